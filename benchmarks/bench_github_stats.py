@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Benchmark the GitHub stats aggregation and render path on synthetic states.
+
+Generates a state file (in the on-disk format of github-stats-state.json)
+for each size, and records the time and peak memory (tracemalloc) of each
+stage of an offline render: _load_state, _aggregate_stats, _render_table and
+_render_contributors. Results are written as JSON, and can be compared with
+an earlier run's (--compare), e.g. one from before a change.
+
+Each stage's scaling exponent between consecutive sizes (1 is linear in the
+size of the state file) is printed too, and flagged once it's clearly
+superlinear.
+
+Usage:
+    ./bench_github_stats.py [--sizes small,medium,50x20000x100x0.1] [-o results.json] [--compare old.json]
+
+Sizes are either one of SIZES, or REPOSxUSERSxDAYS[xBOT_SHARE].
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from pathlib import Path
+
+from contributor_stats import github_stats
+from contributor_stats.github_stats import _encode_ids
+from contributor_stats.render import _render_contributors, _render_table
+
+# name -> (repos, users, days per user, bot share)
+SIZES = {
+    "small": (10, 500, 20, 0.05),
+    "medium": (25, 5_000, 50, 0.05),
+    "large": (50, 20_000, 100, 0.05),
+    "huge": (100, 50_000, 200, 0.05),
+}
+DEFAULT_SIZES = ["small", "medium", "large"]
+
+STAGES = ["load_state", "aggregate_stats", "render_table", "render_contributors"]
+
+# Scaling exponents above this are reported as superlinear
+SUPERLINEAR = 1.3
+
+START_DATE = date(2016, 1, 1)
+STATS = ["issues", "comments", "prs", "prs_merged", "pr_comments"]
+
+
+def generate_state(
+    repos: int, users: int, days: int, bot_share: float, seed: int = 0
+) -> dict:
+    """A synthetic state, as saved by github_stats._write_state.
+
+    Each user is active in a few repos, on ``days`` days in total (spread
+    over those repos), with a few events of a random stat on each. A
+    ``bot_share`` of the accounts are bots (which the render filters out).
+    """
+    rng = random.Random(seed)
+    span = (date(2026, 1, 1) - START_DATE).days
+    repo_names = [f"ActivityWatch/repo-{i}" for i in range(repos)]
+    state: dict = {
+        "version": github_stats.STATE_VERSION,
+        "accounts": {},
+        "repos": {
+            name: {"last_synced": {}, "seen": {}, "users": {}} for name in repo_names
+        },
+    }
+    for user_id in range(1, users + 1):
+        bot = rng.random() < bot_share
+        login = f"app-{user_id}[bot]" if bot else f"user-{user_id}"
+        state["accounts"][str(user_id)] = {
+            "login": login,
+            "node_id": f"U_{user_id}",
+            "updated": "2026-01-01T00:00:00",
+        }
+        user_repos = rng.sample(repo_names, min(repos, rng.randint(1, 3)))
+        for i, repo in enumerate(user_repos):
+            user_days = days // len(user_repos) + (i < days % len(user_repos))
+            active = sorted(
+                START_DATE + timedelta(days=d)
+                for d in rng.sample(range(span), user_days)
+            )
+            row = {stat: 0 for stat in STATS}
+            daily: dict[str, dict[str, int]] = {}
+            for day in active:
+                stat = rng.choice(STATS)
+                count = rng.randint(1, 3)
+                row[stat] += count
+                daily.setdefault(stat, {})[day.isoformat()] = count
+            row["issues"] += row["prs"]  # (issues include PRs)
+            state["repos"][repo]["users"][str(user_id)] = {
+                **row,
+                "comment_words": 20 * row["comments"],
+                "active_days": [day.isoformat() for day in active],
+                "daily": daily,
+            }
+    for repo_state in state["repos"].values():
+        ids = sorted(rng.sample(range(10**9), 50 * len(repo_state["users"])))
+        repo_state["seen"] = {"comments": _encode_ids(ids)}
+    return state
+
+
+def parse_size(spec: str) -> tuple[int, int, int, float]:
+    if spec in SIZES:
+        return SIZES[spec]
+    parts = spec.split("x")
+    try:
+        if len(parts) not in (3, 4):
+            raise ValueError
+        repos, users, days = (int(part) for part in parts[:3])
+        bot_share = float(parts[3]) if len(parts) == 4 else 0.05
+    except ValueError:
+        raise ValueError(
+            f"Invalid size {spec!r}, expected one of {', '.join(SIZES)} "
+            "or REPOSxUSERSxDAYS[xBOT_SHARE]"
+        )
+    return repos, users, days, bot_share
+
+
+def peak_memory(func, *args) -> int:
+    """The peak of bytes allocated during a call."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_size(name: str, workdir: Path, repeat: int = 3) -> dict:
+    """Benchmark each stage on a state of the given size; times are the best
+    of ``repeat`` runs, and the peak memory is measured in a run of its own
+    (tracing allocations slows everything down)."""
+    repos, users, days, bot_share = parse_size(name)
+    state_path = workdir / f"state-{name}.json"
+    with state_path.open("w") as f:
+        json.dump(generate_state(repos, users, days, bot_share), f)
+
+    stages: dict[str, dict] = {}
+
+    def record(stage, func, *args):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func(*args)
+            times.append(time.perf_counter() - started)
+        stages[stage] = {"seconds": min(times), "peak_bytes": peak_memory(func, *args)}
+        return result
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # the renders write to the current directory
+    try:
+        state = record("load_state", github_stats._load_state, state_path)
+        rows = record("aggregate_stats", github_stats._aggregate_stats, state)
+        record("render_table", _render_table, rows)
+        record("render_contributors", _render_contributors, rows)
+    finally:
+        os.chdir(cwd)
+    return {
+        "size": name,
+        "repos": repos,
+        "users": users,
+        "days": days,
+        "bot_share": bot_share,
+        "state_bytes": state_path.stat().st_size,
+        "rows": len(rows),
+        "stages": stages,
+    }
+
+
+def run(sizes: list[str], repeat: int = 3) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in sizes:
+            print(f"Benchmarking {name} {parse_size(name)}", file=sys.stderr)
+            # (silence the stages' own prints)
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                results.append(run_size(name, Path(tmp), repeat))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def scaling(results: list[dict]) -> list[tuple[str, str, float]]:
+    """(size, stage, exponent) of each stage's time growth from the previous
+    size, relative to the growth of the state file."""
+    exponents = []
+    for prev, cur in zip(results, results[1:]):
+        growth = math.log(cur["state_bytes"] / prev["state_bytes"])
+        for stage in STAGES:
+            before = prev["stages"][stage]["seconds"]
+            after = cur["stages"][stage]["seconds"]
+            if growth > 0 and before > 0 and after > 0:
+                exponents.append(
+                    (cur["size"], stage, math.log(after / before) / growth)
+                )
+    return exponents
+
+
+def report(results: dict, baseline: dict | None = None) -> None:
+    base = {r["size"]: r for r in (baseline or {}).get("results", [])}
+    print(f"{'size':<8} {'stage':<20} {'seconds':>9} {'peak MiB':>9}  vs baseline")
+    for result in results["results"]:
+        for stage in STAGES:
+            stats = result["stages"][stage]
+            line = (
+                f"{result['size']:<8} {stage:<20} {stats['seconds']:>9.4f} "
+                f"{stats['peak_bytes'] / 2**20:>9.1f}"
+            )
+            old = base.get(result["size"], {}).get("stages", {}).get(stage)
+            if old:
+                line += (
+                    f"  {stats['seconds'] / old['seconds']:.2f}x time, "
+                    f"{stats['peak_bytes'] / max(old['peak_bytes'], 1):.2f}x memory"
+                )
+            print(line)
+    for size, stage, exponent in scaling(results["results"]):
+        flag = "  <- superlinear" if exponent > SUPERLINEAR else ""
+        print(f"scaling to {size}: {stage} ~ size^{exponent:.2f}{flag}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(DEFAULT_SIZES),
+        help=f"Comma-separated, of: {', '.join(SIZES)} or REPOSxUSERSxDAYS[xBOT_SHARE]",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", "-o", type=Path, default=Path("bench-results.json"))
+    parser.add_argument(
+        "--compare", type=Path, metavar="RESULTS", help="Earlier results to compare to"
+    )
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    for size in sizes:
+        try:
+            parse_size(size)
+        except ValueError as e:
+            parser.error(str(e))
+    results = run(sizes, args.repeat)
+    args.output.write_text(json.dumps(results, indent=2))
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    report(results, baseline)
+    print(f"Written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
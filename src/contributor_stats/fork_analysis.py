@@ -5,122 +5,602 @@ This script uses the GitHub API to analyze forks of the ActivityWatch repository
 to identify unique contributions that are not yet incorporated into the upstream.
 It's designed to be run in a CI environment where the GITHUB_TOKEN is set.
 
+Every branch of every fork is compared against upstream's default branch with
+the compare endpoint (``upstream...owner:branch``), which returns exactly the
+commits the branch is ahead by, however far back it diverged. Forks are
+checked concurrently (bounded by ``--workers``) over one pooled HTTP session,
+and forks that were never pushed to are skipped without fetching anything.
+
+With ``--local``, only the fork listing uses the API: every fork is added as a
+remote of one local bare repo (under .cache/), their branches are fetched
+into its shared object store (incrementally, on later runs), and each fork's
+unique commits are found with ``git log <fork branch> --not --remotes=<upstream>``.
+
+Forks are only checked again once something was pushed to them (their
+``pushed_at`` changed), and only compared again if that changed one of their
+branch heads. Commits that upstream merged since a fork was last checked stay
+in its results until the fork moves.
+
+The same change often shows up in several forks (cherry-picked, rebased, or
+in forks of forks), so unique commits are also grouped into distinct
+contributions (see cluster_commits), by their ``git patch-id --stable``. With
+``--local`` the diffs are at hand; otherwise each new unique commit's diff is
+fetched from the API once (a request per commit; known ones are reused from
+the fork's previous record), and only commits whose diff can't be fetched
+(e.g. too large) are keyed by SHA.
+
 Requirements:
 - Requires the GITHUB_TOKEN environment variable to be set for API authentication.
 - Python packages required: requests, json, datetime, os
 
 Output:
-- A JSON file named "unique_commits.json" that contains:
+- A JSON Lines file named "unique_commits.jsonl" (see ResultLog), with one
+  record per check of a fork, containing:
     - GitHub username that owns the fork
     - Last checked timestamp in ISO format
+    - The fork's pushed_at, and the head SHA of each of its branches
     - Array of unique commits, with each commit containing:
         - SHA
         - Author Name
         - Author Email
         - Commit Message
+        - Author date
+        - Branches of the fork that contain it
+        - Patch ID
+- A JSON file named "unique_patches.json" with one entry per distinct
+  contribution, earliest first: its patch ID, the earliest copy's author,
+  date and message, and the SHAs and forks of every copy.
 """
+
 import json
 import os
-from datetime import datetime, timedelta
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
 
 import requests  # type: ignore[import]
+from requests.adapters import HTTPAdapter  # type: ignore[import]
 
+API_URL = "https://api.github.com"
 
-def get_forks(owner, repo, token, page=1):
-    url = f"https://api.github.com/repos/{owner}/{repo}/forks?page={page}&per_page=100"
-    headers = {}
-    if token:
-        headers["Authorization"] = f"token {token}"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+# Bare repo with upstream and every fork as remotes (named by owner), for --local.
+LOCAL_REPO = Path(__file__).parent.parent.parent / ".cache" / "forks.git"
+
+# Forks checked at once; also the size of the session's connection pool, so
+# every worker can keep its connection alive.
+DEFAULT_WORKERS = 8
+
+# Checked forks whose records are appended to the log at once.
+CHECKPOINT_EVERY = 20
 
 
-def get_commits(owner, repo, token, sha="master", page=1):
-    url = f"https://api.github.com/repos/{owner}/{repo}/commits?sha={sha}&page={page}&per_page=100"
-    headers = {}
+def make_session(token, workers=DEFAULT_WORKERS):
+    """A session whose connection pool is shared by all workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept"] = "application/vnd.github+json"
     if token:
-        headers["Authorization"] = f"token {token}"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+        session.headers["Authorization"] = f"token {token}"
+    return session
+
+
+def _get_all(session, url, key=None):
+    """GET every page of a list endpoint, following the Link headers."""
+    items = []
+    while url:
+        response = session.get(url)
+        response.raise_for_status()
+        data = response.json()
+        items.extend(data[key] if key else data)
+        url = response.links.get("next", {}).get("url")
+    return items
+
+
+def get_forks(session, owner, repo, api_url=API_URL):
+    return _get_all(session, f"{api_url}/repos/{owner}/{repo}/forks?per_page=100")
+
+
+def get_branches(session, owner, repo, api_url=API_URL):
+    return _get_all(session, f"{api_url}/repos/{owner}/{repo}/branches?per_page=100")
+
 
+def get_ahead_commits(session, upstream, base, fork_owner, branch, api_url=API_URL):
+    """Commits on ``fork_owner:branch`` that aren't in upstream's ``base``."""
+    url = (
+        f"{api_url}/repos/{upstream}/compare/{base}...{fork_owner}:{branch}"
+        "?per_page=100"
+    )
+    return _get_all(session, url, key="commits")
 
-def save_to_file(data, filename):
-    with open(filename, "w") as f:
-        json.dump(data, f, indent=2)
 
+def patch_id(diff: bytes):
+    """``git patch-id --stable`` of a diff, or None if it has no changes."""
+    output = subprocess.run(
+        ["git", "patch-id", "--stable"], input=diff, check=True, capture_output=True
+    ).stdout
+    return output.split()[0].decode() if output else None
 
-def load_from_file(filename):
+
+def get_patch_id(session, owner, repo, sha, api_url=API_URL):
+    """The patch ID of a commit, from its diff as served by the API (the same
+    ID local_patch_ids gives it), or None if it has none or is unavailable."""
     try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        response = session.get(
+            f"{api_url}/repos/{owner}/{repo}/commits/{sha}",
+            headers={"Accept": "application/vnd.github.diff"},
+        )
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        # e.g. a diff too large for the API to render
+        print(f"Failed to get the diff of {owner}/{repo}@{sha}: {e}")
+        return None
+    return patch_id(response.content)
 
 
-def is_outdated(timestamp):
-    last_checked = datetime.fromisoformat(timestamp)
-    return datetime.now() - last_checked > timedelta(days=30)
+def _entry(record, offset):
+    return {"offset": offset, "pushed_at": record["pushed_at"]}
 
 
-def main():
-    upstream_owner = "ActivityWatch"
-    repo_name = "activitywatch"
-    token = os.environ.get("GITHUB_TOKEN")
+class ResultLog:
+    """Per-fork results in an append-only JSON Lines file.
+
+    Each line is one fork's record, superseding any earlier line for the same
+    owner. The index next to it (``<name>.index.json``) maps every owner to
+    the offset of their latest record and its ``pushed_at``, which is all a
+    run needs to decide what to check, so a checkpoint only appends the new
+    records and rewrites the (small) index. Records are only read back for
+    forks that changed, and the log is compacted once superseded records make
+    up most of it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".index.json")
+        self.index = self._load_index()
+
+    def _load_index(self):
+        size = self.path.stat().st_size if self.path.exists() else 0
+        try:
+            index = json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            index = None
+        if index is None or index["size"] != size:
+            # missing, or the log was appended to after it was written
+            index = self._scan()
+        return index
+
+    def _scan(self):
+        forks = {}
+        offset = records = 0
+        if self.path.exists():
+            with self.path.open("rb+") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    forks[record["owner"]] = _entry(record, offset)
+                    offset += len(line)
+                    records += 1
+                # drop a line torn by an interrupted append
+                f.truncate(offset)
+        return {"size": offset, "records": records, "forks": forks}
+
+    def _write_index(self):
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.index))
+        tmp.replace(self.index_path)
+
+    def get(self, owner):
+        """The index entry (offset and pushed_at) of ``owner``'s latest record."""
+        return self.index["forks"].get(owner)
+
+    def read(self, owner):
+        with self.path.open("rb") as f:
+            f.seek(self.index["forks"][owner]["offset"])
+            return json.loads(f.readline())
+
+    def all(self):
+        """The latest record of every fork, by owner."""
+        results = {}
+        if self.path.exists():
+            with self.path.open("rb") as f:
+                for line in f:
+                    record = json.loads(line)
+                    results[record["owner"]] = record
+        return results
+
+    def append(self, records):
+        if not records:
+            return
+        with self.path.open("ab") as f:
+            offset = f.tell()
+            for record in records:
+                line = (json.dumps(record) + "\n").encode()
+                f.write(line)
+                self.index["forks"][record["owner"]] = _entry(record, offset)
+                offset += len(line)
+        self.index["size"] = offset
+        self.index["records"] += len(records)
+        if self.index["records"] > 2 * len(self.index["forks"]):
+            self.compact()
+        else:
+            self._write_index()
+
+    def compact(self):
+        """Rewrite the log with only each fork's latest record."""
+        tmp = self.path.with_suffix(".tmp")
+        forks = {}
+        offset = 0
+        with tmp.open("wb") as f:
+            for owner, record in self.all().items():
+                line = (json.dumps(record) + "\n").encode()
+                f.write(line)
+                forks[owner] = _entry(record, offset)
+                offset += len(line)
+        tmp.replace(self.path)
+        self.index = {"size": offset, "records": len(forks), "forks": forks}
+        self._write_index()
+
+
+def never_pushed(fork):
+    # A fork's pushed_at starts out as upstream's at the time it was forked,
+    # so it's only later than created_at once something was pushed to it.
+    # Empty forks (of an empty repo) have none at all.
+    if fork["pushed_at"] is None:
+        return True
+    return fork["pushed_at"] <= fork["created_at"]
 
-    # Load previous results
-    results = load_from_file("unique_commits.json")
-
-    # Get upstream commits
-    upstream_commits = get_commits(upstream_owner, repo_name, token)
-    print(f"Found {len(upstream_commits)} upstream commits")
-    upstream_commit_shas = {commit["sha"] for commit in upstream_commits}
-
-    # Get all forks
-    page = 1
-    while True:
-        forks = get_forks(upstream_owner, repo_name, token, page=page)
-        if not forks:
-            break
-
-        for fork in forks:
-            owner = fork["owner"]["login"]
-            print(f"Checking {owner}/{repo_name}")
-            fork_data = results.get(owner, {})
-
-            if "last_checked" in fork_data and not is_outdated(
-                fork_data["last_checked"]
-            ):
-                continue
 
-            try:
-                fork_commits = get_commits(owner, repo_name, token)
-            except requests.exceptions.HTTPError as e:
-                print(f"Failed to get commits for {owner}: {e}")
+def _record(fork, heads, unique_commits):
+    return {
+        "owner": fork["owner"]["login"],
+        "last_checked": datetime.now().isoformat(),
+        "pushed_at": fork["pushed_at"],
+        "heads": heads,
+        "unique_commits": unique_commits,
+    }
+
+
+def analyze_fork(
+    session,
+    fork,
+    upstream,
+    base,
+    api_url=API_URL,
+    known_heads=None,
+    known_patch_ids=None,
+):
+    """The head SHA of each of a fork's branches, and the unique commits
+    across them, in first-seen order, with their patch IDs (looked up in
+    ``known_patch_ids`` by SHA first). The commits are None (and nothing is
+    compared) if the heads are still ``known_heads``."""
+    owner = fork["owner"]["login"]
+    branches = get_branches(session, owner, fork["name"], api_url)
+    heads = {branch["name"]: branch["commit"]["sha"] for branch in branches}
+    if heads == known_heads:
+        return heads, None
+    unique_commits = {}
+    for branch in branches:
+        try:
+            commits = get_ahead_commits(
+                session, upstream, base, owner, branch["name"], api_url
+            )
+        except requests.exceptions.HTTPError as e:
+            # e.g. a branch deleted in the meantime, or unrelated history
+            print(f"Failed to compare {owner}:{branch['name']}: {e}")
+            continue
+        for commit in commits:
+            info = unique_commits.setdefault(
+                commit["sha"],
+                {
+                    "sha": commit["sha"],
+                    "author": commit["commit"]["author"]["name"],
+                    "email": commit["commit"]["author"]["email"],
+                    "message": commit["commit"]["message"],
+                    "date": commit["commit"]["author"]["date"],
+                    "branches": [],
+                },
+            )
+            info["branches"].append(branch["name"])
+    known_patch_ids = known_patch_ids or {}
+    for sha, info in unique_commits.items():
+        if sha in known_patch_ids:
+            info["patch_id"] = known_patch_ids[sha]
+        else:
+            info["patch_id"] = get_patch_id(session, owner, fork["name"], sha, api_url)
+    return heads, list(unique_commits.values())
+
+
+def _git(repo, *args, input=None, text=True):
+    return subprocess.run(
+        ["git", "--git-dir", str(repo), *args],
+        input=input,
+        check=True,
+        capture_output=True,
+        text=text,
+    ).stdout
+
+
+def _set_remote(repo, name, url, remotes):
+    if name in remotes:
+        _git(repo, "remote", "set-url", name, url)
+    else:
+        _git(repo, "remote", "add", name, url)
+
+
+def fetch_local(repo, upstream_owner, upstream_url, forks, workers=DEFAULT_WORKERS):
+    """Fetch upstream's and every fork's branches into one bare repo, so
+    objects shared between them are only downloaded (and stored) once."""
+    if not Path(repo).exists():
+        subprocess.run(["git", "init", "--bare", "--quiet", str(repo)], check=True)
+    # Remotes are named by owner; upstream's owner never forks its own repo.
+    remotes = set(_git(repo, "remote").split())
+    _set_remote(repo, upstream_owner, upstream_url, remotes)
+    for fork in forks:
+        _set_remote(repo, fork["owner"]["login"], fork["clone_url"], remotes)
+    owners = [upstream_owner] + [fork["owner"]["login"] for fork in forks]
+    fetch = subprocess.run(
+        ["git", "--git-dir", str(repo), "fetch", "--multiple", "--prune"]
+        + ["--no-tags", "--quiet", f"--jobs={workers}", *owners],
+        capture_output=True,
+        text=True,
+    )
+    if fetch.returncode != 0:
+        # e.g. a fork deleted since it was listed; the others are fetched
+        print(f"Some fetches failed:\n{fetch.stderr}")
+
+
+# commit fields, NUL-separated; commits are separated by RS
+_LOG_FORMAT = "%H%x00%an%x00%ae%x00%aI%x00%B%x1e"
+
+
+def local_heads(repo, owner):
+    """The head SHA of each of ``owner``'s fetched branches."""
+    prefix = f"refs/remotes/{owner}/"
+    refs = _git(
+        repo, "for-each-ref", "--format=%(refname) %(objectname)", prefix
+    ).splitlines()
+    heads = {}
+    for line in refs:
+        ref, sha = line.split()
+        if ref != f"{prefix}HEAD":
+            heads[ref[len(prefix) :]] = sha
+    return heads
+
+
+def local_unique_commits(repo, upstream_owner, owner):
+    """Commits on any of ``owner``'s fetched branches that aren't on any of
+    upstream's, oldest first, like analyze_fork."""
+    unique_commits = {}
+    for branch in local_heads(repo, owner):
+        log = _git(
+            repo,
+            "log",
+            "--reverse",
+            f"--format={_LOG_FORMAT}",
+            f"refs/remotes/{owner}/{branch}",
+            "--not",
+            f"--remotes={upstream_owner}",
+        )
+        for record in log.split("\x1e"):
+            record = record.strip("\n")
+            if not record:
                 continue
+            sha, author, email, date, message = record.split("\x00", 4)
+            info = unique_commits.setdefault(
+                sha,
+                {
+                    "sha": sha,
+                    "author": author,
+                    "email": email,
+                    "message": message.rstrip("\n"),
+                    "date": date,
+                    "branches": [],
+                },
+            )
+            info["branches"].append(branch)
+    patch_ids = local_patch_ids(repo, list(unique_commits))
+    for sha, info in unique_commits.items():
+        info["patch_id"] = patch_ids.get(sha)
+    return list(unique_commits.values())
+
+
+def local_patch_ids(repo, shas):
+    """``git patch-id --stable`` of each commit, by SHA: a hash of its diff
+    that ignores line numbers and whitespace, so the same change applied on
+    top of different histories gets the same ID. Commits without a diff
+    (merges, empty commits) have none."""
+    if not shas:
+        return {}
+    # as bytes: patches of binary or non-UTF-8 files aren't valid text
+    patches = _git(
+        repo,
+        "log",
+        "--no-walk=unsorted",
+        "--stdin",
+        "-p",
+        input="\n".join(shas).encode(),
+        text=False,
+    )
+    output = _git(repo, "patch-id", "--stable", input=patches, text=False)
+    patch_ids = {}
+    for line in output.decode().splitlines():
+        patch_id, sha = line.split()
+        patch_ids[sha] = patch_id
+    return patch_ids
+
+
+def _date(commit):
+    # commits recorded before dates were kept sort last
+    date = commit.get("date") or "9999-12-31T00:00:00+00:00"
+    return datetime.fromisoformat(date.replace("Z", "+00:00"))
+
 
-            unique_commits_data = []
-            for commit in fork_commits:
-                if commit["sha"] not in upstream_commit_shas:
-                    unique_commit_info = {
-                        "sha": commit["sha"],
-                        "author": commit["commit"]["author"]["name"],
-                        "email": commit["commit"]["author"]["email"],
-                        "message": commit["commit"]["message"],
-                    }
-                    unique_commits_data.append(unique_commit_info)
-
-            results[owner] = {
-                "last_checked": datetime.now().isoformat(),
-                "unique_commits": unique_commits_data,
+def cluster_commits(results):
+    """Group the unique commits of every fork (``{owner: record}``) into
+    distinct contributions, earliest first.
+
+    Commits are keyed by patch ID (or by SHA, where there's none) in a single
+    pass, so this is linear in the number of commits rather than comparing
+    every pair of them.
+    """
+    clusters = {}
+    for owner, record in results.items():
+        for commit in record["unique_commits"]:
+            key = commit.get("patch_id") or commit["sha"]
+            cluster = clusters.setdefault(
+                key,
+                {"patch_id": commit.get("patch_id"), "earliest": commit, "copies": {}},
+            )
+            cluster["copies"].setdefault(commit["sha"], set()).add(owner)
+            if _date(commit) < _date(cluster["earliest"]):
+                cluster["earliest"] = commit
+    report = []
+    for cluster in clusters.values():
+        earliest = cluster["earliest"]
+        report.append(
+            {
+                "patch_id": cluster["patch_id"],
+                "author": earliest["author"],
+                "email": earliest["email"],
+                "date": earliest.get("date"),
+                "message": earliest["message"],
+                "shas": sorted(cluster["copies"]),
+                "forks": sorted(set().union(*cluster["copies"].values())),
             }
+        )
+    report.sort(key=_date)
+    return report
+
+
+def main(
+    upstream_owner="ActivityWatch",
+    repo_name="activitywatch",
+    api_url=API_URL,
+    workers=DEFAULT_WORKERS,
+    filename="unique_commits.jsonl",
+    report_filename="unique_patches.json",
+    local=False,
+    local_repo=LOCAL_REPO,
+):
+    token = os.environ.get("GITHUB_TOKEN")
+    session = make_session(token, workers)
+    upstream = f"{upstream_owner}/{repo_name}"
 
-        # Save intermediate results
-        save_to_file(results, "unique_commits.json")
+    # Load previous results (just the index)
+    log = ResultLog(filename)
 
-        page += 1
+    response = session.get(f"{api_url}/repos/{upstream}")
+    response.raise_for_status()
+    base = response.json()["default_branch"]
+    upstream_url = response.json()["clone_url"]
+
+    forks = get_forks(session, upstream_owner, repo_name, api_url)
+    print(f"Found {len(forks)} forks")
+    to_check = []
+    records = []
+    for fork in forks:
+        entry = log.get(fork["owner"]["login"])
+        if entry and entry["pushed_at"] == fork["pushed_at"]:
+            # nothing pushed since it was last checked
+            continue
+        if never_pushed(fork):
+            records.append(_record(fork, {}, []))
+            continue
+        to_check.append(fork)
+
+    def known_heads(owner):
+        return log.read(owner)["heads"] if log.get(owner) else None
+
+    def known_patch_ids(owner):
+        if not log.get(owner):
+            return {}
+        commits = log.read(owner)["unique_commits"]
+        # (commits without one are looked up again, e.g. after a failure)
+        return {c["sha"]: c["patch_id"] for c in commits if c.get("patch_id")}
+
+    def checked(fork, heads, unique_commits):
+        owner = fork["owner"]["login"]
+        if unique_commits is None:
+            # pushed to, but no branch moved (e.g. a tag, or a deleted branch
+            # pushed back); its commits are the same as last time
+            unique_commits = log.read(owner)["unique_commits"]
+        records.append(_record(fork, heads, unique_commits))
+        if len(records) >= CHECKPOINT_EVERY:
+            log.append(records)
+            records.clear()
+
+    try:
+        if local:
+            fetch_local(local_repo, upstream_owner, upstream_url, to_check, workers)
+            for fork in to_check:
+                owner = fork["owner"]["login"]
+                heads = local_heads(local_repo, owner)
+                if heads == known_heads(owner):
+                    checked(fork, heads, None)
+                else:
+                    unique_commits = local_unique_commits(
+                        local_repo, upstream_owner, owner
+                    )
+                    checked(fork, heads, unique_commits)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(
+                        analyze_fork,
+                        session,
+                        fork,
+                        upstream,
+                        base,
+                        api_url,
+                        known_heads(fork["owner"]["login"]),
+                        known_patch_ids(fork["owner"]["login"]),
+                    ): fork
+                    for fork in to_check
+                }
+                for future in as_completed(futures):
+                    fork = futures[future]
+                    owner = fork["owner"]["login"]
+                    print(f"Checked {owner}/{fork['name']}")
+                    try:
+                        heads, unique_commits = future.result()
+                    except requests.exceptions.HTTPError as e:
+                        print(f"Failed to get commits for {owner}: {e}")
+                        continue
+                    checked(fork, heads, unique_commits)
+    finally:
+        # Save (intermediate) results
+        log.append(records)
+    results = log.all()
+    with open(report_filename, "w") as f:
+        json.dump(cluster_commits(results), f, indent=2)
+    return results
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of forks to check concurrently.",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=API_URL,
+        help="GitHub API base URL (e.g. a local stand-in for testing).",
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Fetch the forks into a local bare repo (.cache/forks.git) and "
+        "find their unique commits with git, using the API only to list forks.",
+    )
+    args = parser.parse_args()
+    main(api_url=args.api_url, workers=args.workers, local=args.local)
@@ -1,23 +1,42 @@
 from __future__ import annotations
 
-import itertools
+import base64
+import bisect
+import fcntl
 import json
 import logging
 import os
 import subprocess
+import tempfile
+import threading
 import time
 from collections import defaultdict
-from dataclasses import dataclass
-from datetime import date, datetime, timezone
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Callable, TypedDict
+from typing import Callable, Iterator, NamedTuple, TypedDict
 
-import pandas as pd
 from github import Github, RateLimitExceededException
+from github.PaginatedList import PaginatedList
 from github.Repository import Repository
 from joblib import Memory
 from tqdm import tqdm
 
+from contributor_stats import transport
+from contributor_stats.metrics import REGISTRY
+from contributor_stats.render import (
+    DISPLAY_COLUMNS,
+    MIN_ACTIVITY_TOTAL,
+    SNAPSHOT_PATH,
+    _render_contributors,
+    _render_table,
+    load_snapshot,
+    save_snapshot,
+    sort_rows,
+)
+from contributor_stats.windows import WindowIndex, parse_window
+
 logger = logging.getLogger(__name__)
 
 script_dir = Path(__file__).parent
@@ -31,6 +50,85 @@ DEFAULT_SINCE = datetime(1999, 1, 1)
 # has to fetch activity since the last sync (see _load_state/_save_state).
 STATE_PATH = project_dir / "github-stats-state.json"
 
+# Bumped when the state's layout changes; older states are upgraded when
+# loaded (see _upgrade_state), so the next sync stays incremental.
+# 2: users keyed by numeric GitHub user ID rather than login.
+# 3: per-day counts for each stat (``daily``), for rolling-window tables.
+STATE_VERSION = 3
+
+# How often the ID -> login table is refreshed for users who haven't shown up
+# in any fetch since (see _refresh_accounts).
+ACCOUNT_REFRESH_INTERVAL = timedelta(days=7)
+
+# Repos whose listing metadata hasn't changed are skipped (see _is_unchanged),
+# but not for longer than this: activity like issue comments doesn't touch the
+# repo's metadata, so a dormant repo still gets a full check once in a while.
+FORCE_SYNC_INTERVAL = timedelta(days=7)
+
+
+# Sync metrics (see metrics.py), written out with --metrics.
+REQUESTS = REGISTRY.counter(
+    "github_stats_requests_total",
+    "GitHub API requests, by the repo and stat they were made for",
+    ("repo", "stat", "status"),
+)
+PAGES = REGISTRY.counter(
+    "github_stats_pages_total",
+    "Pages of list results fetched",
+    ("repo", "stat"),
+)
+FETCH_SECONDS = REGISTRY.histogram(
+    "github_stats_fetch_seconds",
+    "Time spent fetching one stat of one repo, including rate-limit sleeps",
+    ("repo", "stat"),
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "github_stats_cache_lookups_total",
+    "Lookups in the on-disk fetcher cache",
+    ("stat", "result"),
+)
+REPOS = REGISTRY.counter(
+    "github_stats_repos_total",
+    "Whitelisted repos, by whether they were synced or skipped as unchanged",
+    ("result",),
+)
+RATE_LIMIT_SLEEPS = REGISTRY.histogram(
+    "github_stats_rate_limit_sleep_seconds",
+    "Time slept waiting for the rate limit to reset",
+)
+SAVE_STATE_SECONDS = REGISTRY.histogram(
+    "github_stats_save_state_seconds",
+    "Time spent writing the state file and snapshot",
+)
+CHECKPOINTS = REGISTRY.counter(
+    "github_stats_checkpoint_commits_total",
+    "State checkpoint commits made before rate-limit sleeps",
+    ("result",),
+)
+
+# The (repo, stat) requests are currently being made for, as metric labels.
+_fetching: ContextVar[tuple[str, str]] = ContextVar("fetching", default=("", ""))
+
+
+@contextmanager
+def _requests_for(repo: str, stat: str) -> Iterator[None]:
+    token = _fetching.set((repo, stat))
+    try:
+        yield
+    finally:
+        _fetching.reset(token)
+
+
+def _requests_made(repo: str) -> int:
+    return int(sum(n for key, n in REQUESTS.values.items() if key[0] == repo))
+
+
+def _count_request(method: str, url: str, status: int, headers: dict, body) -> None:
+    repo, stat = _fetching.get()
+    REQUESTS.inc(repo=repo, stat=stat, status=status)
+    if method == "GET" and status == 200 and body and body.lstrip()[:1] == "[":
+        PAGES.inc(repo=repo, stat=stat)
+
 
 def _is_bot(username):
     # Same filter the published table uses: app accounts end in "[bot]".
@@ -41,120 +139,211 @@ def _sort_dict_by_value(d: dict) -> dict:
     return {k: v for k, v in sorted(d.items(), key=lambda item: item[1])}
 
 
+class Account(NamedTuple):
+    """The GitHub account behind an object. State is keyed by the numeric ID,
+    which survives renames; the login is only looked up for rendering."""
+
+    id: int
+    login: str
+    node_id: str
+
+
+def _account(user) -> Account:
+    return Account(user.id, user.login, user.node_id)
+
+
+class Item(NamedTuple):
+    """One counted object, as reported by a fetcher."""
+
+    # Comment ID, or the issue/PR number (an issue and its PR share one).
+    # Unique per repo and stat, so _merge_stat can count each object once.
+    id: int
+    user: Account
+    day: date
+    words: int = 0
+
+
 class CommentStats(TypedDict):
     count: dict[str, int]
     words: dict[str, int]
     days: dict[str, set[date]]
+    daily: dict[str, dict[date, int]]
+    items: list[Item]
+    # URL of the next page of results, None after the last (see STAT_FETCHERS)
+    next_page: str | None
 
 
 class CountWithDays(TypedDict):
     count: dict[str, int]
     days: dict[str, set[date]]
+    daily: dict[str, dict[date, int]]
+    items: list[Item]
+    next_page: str | None
 
 
-@memory.cache(ignore=["gh"])
-def _comments_by_user(gh: Github, repo_fullname: str, since: datetime) -> CommentStats:
-    """Retrieve comment statistics by user"""
-    logger.info(" - Getting comments by user...")
-    repo: Repository = gh.get_repo(repo_fullname)
-
-    comments_by_user: dict[str, int] = defaultdict(int)
+def _tally(items: list[Item], next_page: str | None = None) -> CommentStats:
+    """Sum per-object items into per-user counts, words, active days and
+    per-day counts, keyed by user ID (as a string, like the JSON state)."""
+    count_by_user: dict[str, int] = defaultdict(int)
     words_by_user: dict[str, int] = defaultdict(int)
     days_by_user: dict[str, set[date]] = defaultdict(set)
+    daily_by_user: dict[str, dict[date, int]] = defaultdict(lambda: defaultdict(int))
+    for item in items:
+        user = str(item.user.id)
+        count_by_user[user] += 1
+        words_by_user[user] += item.words
+        days_by_user[user].add(item.day)
+        daily_by_user[user][item.day] += 1
+    return CommentStats(
+        count=_sort_dict_by_value(count_by_user),
+        words=_sort_dict_by_value(words_by_user),
+        days=dict(days_by_user),
+        daily={user: dict(daily) for user, daily in daily_by_user.items()},
+        items=items,
+        next_page=next_page,
+    )
+
+
+def _tally_counts(items: list[Item], next_page: str | None = None) -> CountWithDays:
+    stats = _tally(items, next_page)
+    return CountWithDays(
+        count=stats["count"],
+        days=stats["days"],
+        daily=stats["daily"],
+        items=items,
+        next_page=next_page,
+    )
+
+
+def _repo(gh: Github, repo_fullname: str) -> Repository:
+    # lazy: listing endpoints only need the repo's URL, so don't spend a
+    # request on fetching the repo itself for every page
+    return gh.get_repo(repo_fullname, lazy=True)
+
+
+def _get_page(paginated: PaginatedList, url: str | None) -> tuple[list, str | None]:
+    """Fetch one page of ``paginated``: the first, or the one at ``url`` (a
+    next-page link returned with an earlier page). Returns the page's objects
+    and the next page's URL, or None if it was the last page."""
+    # PyGithub only iterates whole lists, or gets numbered pages without
+    # their Link headers, so drive its own page fetching from a given URL.
+    if url is not None:
+        paginated._PaginatedList__nextUrl = url  # type: ignore[attr-defined]
+        paginated._PaginatedList__nextParams = None  # type: ignore[attr-defined]
+    objects = paginated._fetchNextPage()
+    return objects, paginated._PaginatedList__nextUrl  # type: ignore[attr-defined]
+
 
-    # NOTE: `since` filters on the comment's `updated_at`, not `created_at`.
-    # In incremental runs (see _merge_stat), a comment edited after the
-    # last sync will be re-counted here, double-counting it in the cumulative
-    # totals. Considered rare enough relative to total volume to ignore.
+@memory.cache(ignore=["gh"])
+def _comments_by_user(
+    gh: Github, repo_fullname: str, since: datetime, page: str | None = None
+) -> CommentStats:
+    """Retrieve comment statistics by user, for one page of comments"""
+    logger.info(f" - Getting comments by user ({page or 'first page'})...")
+    repo = _repo(gh, repo_fullname)
+
+    # NOTE: `since` filters on the comment's `updated_at`, not `created_at`,
+    # so a comment edited after the last sync is returned again. _merge_stat
+    # skips it by ID, so it's still only counted once.
     # NOTE: reactions are deliberately not fetched: get_reactions() costs one
     # API request per comment and the result was unused downstream.
-    for comment in repo.get_issues_comments(since=since):
+    comments, next_page = _get_page(repo.get_issues_comments(since=since), page)
+    items = []
+    for comment in comments:
         print(comment)
         if _is_bot(comment.user.login):
             continue
-        comments_by_user[comment.user.login] += 1
-        words_by_user[comment.user.login] += len(comment.body.split())
-        days_by_user[comment.user.login].add(comment.created_at.date())
-
-    return CommentStats(
-        count=_sort_dict_by_value(comments_by_user),
-        words=_sort_dict_by_value(words_by_user),
-        days=dict(days_by_user),
-    )
+        items.append(
+            Item(
+                comment.id,
+                _account(comment.user),
+                comment.created_at.date(),
+                len(comment.body.split()),
+            )
+        )
+    return _tally(items, next_page)
 
 
 @memory.cache(ignore=["gh"])
-def _issues_by_user(gh: Github, repo_fullname: str, since: datetime) -> CountWithDays:
-    """Retrieving issue statistics by user"""
-    logger.info(" - Getting issues by user...")
-    repo: Repository = gh.get_repo(repo_fullname)
-    issues_by_user: dict[str, int] = defaultdict(int)
-    days_by_user: dict[str, set[date]] = defaultdict(set)
-    for issue in repo.get_issues(state="all", since=since):
+def _issues_by_user(
+    gh: Github, repo_fullname: str, since: datetime, page: str | None = None
+) -> CountWithDays:
+    """Retrieving issue statistics by user, for one page of issues"""
+    logger.info(f" - Getting issues by user ({page or 'first page'})...")
+    repo = _repo(gh, repo_fullname)
+    issues, next_page = _get_page(repo.get_issues(state="all", since=since), page)
+    items = []
+    for issue in issues:
         # TODO: Don't count issues tagged as invalid
         print(issue)
         if issue.created_at < since:
             continue
-        issues_by_user[issue.user.login] += 1
-        days_by_user[issue.user.login].add(issue.created_at.date())
-    return CountWithDays(
-        count=_sort_dict_by_value(issues_by_user), days=dict(days_by_user)
-    )
+        items.append(Item(issue.number, _account(issue.user), issue.created_at.date()))
+    return _tally_counts(items, next_page)
 
 
 @memory.cache(ignore=["gh"])
 def _pr_comments_by_user(
-    gh: Github, repo_fullname: str, since: datetime
+    gh: Github, repo_fullname: str, since: datetime, page: str | None = None
 ) -> CountWithDays:
-    logger.info(" - Getting PR comments by user...")
-    repo: Repository = gh.get_repo(repo_fullname)
-    pr_comments_by_user: dict[str, int] = defaultdict(int)
-    days_by_user: dict[str, set[date]] = defaultdict(set)
+    logger.info(f" - Getting PR comments by user ({page or 'first page'})...")
+    repo = _repo(gh, repo_fullname)
     # NOTE: same `updated_at`-vs-`created_at` caveat as _comments_by_user above.
-    for pr_comment in repo.get_pulls_comments(since=since):
-        pr_comments_by_user[pr_comment.user.login] += 1
-        days_by_user[pr_comment.user.login].add(pr_comment.created_at.date())
-    return CountWithDays(
-        count=_sort_dict_by_value(pr_comments_by_user), days=dict(days_by_user)
-    )
+    pr_comments, next_page = _get_page(repo.get_pulls_comments(since=since), page)
+    items = [
+        Item(pr_comment.id, _account(pr_comment.user), pr_comment.created_at.date())
+        for pr_comment in pr_comments
+    ]
+    return _tally_counts(items, next_page)
 
 
 @memory.cache(ignore=["gh"])
-def _submitted_prs(gh: Github, repo_fullname: str, since: datetime) -> CountWithDays:
-    """returns the number of submitted PRs per user"""
-    logger.info(" - Getting submitted PRs...")
-    repo: Repository = gh.get_repo(repo_fullname)
-    count_by_user: dict[str, int] = defaultdict(int)
-    days_by_user: dict[str, set[date]] = defaultdict(set)
-    for pr in repo.get_pulls(state="all", sort="created", direction="desc"):
+def _submitted_prs(
+    gh: Github, repo_fullname: str, since: datetime, page: str | None = None
+) -> CountWithDays:
+    """returns the number of submitted PRs per user, for one page of PRs"""
+    logger.info(f" - Getting submitted PRs ({page or 'first page'})...")
+    repo = _repo(gh, repo_fullname)
+    prs, next_page = _get_page(
+        repo.get_pulls(state="all", sort="created", direction="desc"), page
+    )
+    items: list[Item] = []
+    for pr in prs:
         if pr.created_at < since:
-            break
-        count_by_user[pr.user.login] += 1
-        days_by_user[pr.user.login].add(pr.created_at.date())
-    return CountWithDays(count=dict(count_by_user), days=dict(days_by_user))
+            # newest first, so everything after this is older too
+            return _tally_counts(items)
+        items.append(Item(pr.number, _account(pr.user), pr.created_at.date()))
+    return _tally_counts(items, next_page)
 
 
 @memory.cache(ignore=["gh"])
 def _merged_prs_by_user(
-    gh: Github, repo_fullname: str, since: datetime
+    gh: Github, repo_fullname: str, since: datetime, page: str | None = None
 ) -> CountWithDays:
-    """returns the number of merged PRs per user"""
-    logger.info(" - Getting merged PRs...")
-    repo: Repository = gh.get_repo(repo_fullname)
-    merged_prs_by_user: dict[str, int] = defaultdict(int)
-    days_by_user: dict[str, set[date]] = defaultdict(set)
-    for pr in repo.get_pulls(state="closed", sort="updated", direction="desc"):
+    """returns the number of merged PRs per user, for one page of PRs"""
+    logger.info(f" - Getting merged PRs ({page or 'first page'})...")
+    repo = _repo(gh, repo_fullname)
+    prs, next_page = _get_page(
+        repo.get_pulls(state="closed", sort="updated", direction="desc"), page
+    )
+    items: list[Item] = []
+    for pr in prs:
         if pr.updated_at < since:
-            break
-        if not pr.merged or pr.merged_at < since:
+            return _tally_counts(items)
+        # merged_at rather than `merged`, which list results don't include
+        # (reading it would fetch each PR separately)
+        if pr.merged_at is None or pr.merged_at < since:
             continue
-        merged_prs_by_user[pr.user.login] += 1
-        days_by_user[pr.user.login].add(pr.merged_at.date())
-    return CountWithDays(count=dict(merged_prs_by_user), days=dict(days_by_user))
+        items.append(Item(pr.number, _account(pr.user), pr.merged_at.date()))
+    return _tally_counts(items, next_page)
 
 
 # One fetcher per stat; each stat is fetched, merged and timestamped
 # independently so a run interrupted mid-repo can checkpoint and resume.
+# Fetchers return one page of results at a time (and whether it was the
+# last), which is merged before the next page is fetched, so a resumed sync
+# continues from the page it stopped at (see _sync_repo) rather than
+# refetching the stat from the start.
 # Active days are derived from the objects these fetchers already iterate
 # (each reports the days it saw activity on), so no separate fetch is needed.
 STAT_FETCHERS: dict[str, Callable] = {
@@ -166,6 +355,13 @@ STAT_FETCHERS: dict[str, Callable] = {
 }
 
 
+def _disable_cache() -> None:
+    """Bypass the on-disk fetcher cache, so replayed responses are neither
+    shadowed by nor written into results cached from live runs."""
+    for stat, fetcher in STAT_FETCHERS.items():
+        STAT_FETCHERS[stat] = getattr(fetcher, "func", fetcher)
+
+
 def _empty_user_stats() -> dict:
     return {
         "issues": 0,
@@ -175,17 +371,127 @@ def _empty_user_stats() -> dict:
         "prs_merged": 0,
         "pr_comments": 0,
         "active_days": set(),
+        # {stat: {day: count}}, see windows.WindowIndex
+        "daily": {},
     }
 
 
-def _load_state() -> dict:
+# The per-user columns summed across repos for the rendered table.
+TOTAL_COLUMNS = ["issues", "comments", "prs", "prs_merged", "pr_comments"]
+
+
+def _repo_row(user_stats: dict) -> dict[str, int]:
+    """A user's contribution from a single repo to the rendered totals."""
+    row = {col: user_stats[col] for col in TOTAL_COLUMNS}
+    # issues include PRs, so we need to subtract them.
+    # A PR created mid-run (after the issues fetch but before the PR
+    # fetch) can make prs briefly exceed issues; the next incremental
+    # run counts that PR as an issue and self-corrects the cumulative
+    # totals, so clip instead of crashing.
+    row["issues"] = max(row["issues"] - row["prs"], 0)
+    return row
+
+
+def _empty_totals() -> dict:
+    return {**{col: 0 for col in TOTAL_COLUMNS}, "active_days": set()}
+
+
+def _build_totals(state: dict) -> dict[str, dict]:
+    """Sum every repo's per-user stats into cross-repo totals."""
+    totals: dict[str, dict] = defaultdict(_empty_totals)
+    for repo_state in state["repos"].values():
+        for user, user_stats in repo_state["users"].items():
+            if user_stats["prs"] > user_stats["issues"]:
+                logger.warning(f"prs > issues for {user}, clipping")
+            user_totals = totals[user]
+            for col, value in _repo_row(user_stats).items():
+                user_totals[col] += value
+            user_totals["active_days"] |= user_stats["active_days"]
+    return dict(totals)
+
+
+def _snapshot_rows(totals: dict[str, dict], accounts: dict[str, dict]) -> list[dict]:
+    """Turn cross-repo totals into sorted ``['user'] + DISPLAY_COLUMNS`` rows,
+    joining the user IDs they're keyed by to current logins."""
+    rows = []
+    for user_id, user_totals in totals.items():
+        user = accounts.get(user_id, {}).get("login", user_id)
+        # filter out bots (named end in "[bot]")
+        if _is_bot(user):
+            continue
+        row = {"user": user, **{col: user_totals[col] for col in TOTAL_COLUMNS}}
+        row["active_days"] = len(user_totals["active_days"])
+        row["total"] = sum(row[col] for col in TOTAL_COLUMNS)
+        rows.append(row)
+    return sort_rows(rows)
+
+
+def _encode_ids(ids: list[int]) -> str:
+    """Pack a sorted ID list as base64 of delta-encoded LEB128 varints.
+
+    Comment IDs are large but dense within a repo, so this takes a few bytes
+    per ID instead of a line of indented JSON each.
+    """
+    out = bytearray()
+    prev = 0
+    for id_ in ids:
+        delta, prev = id_ - prev, id_
+        while delta > 0x7F:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return base64.b64encode(bytes(out)).decode()
+
+
+def _decode_ids(encoded: str) -> list[int]:
+    ids = []
+    prev = delta = shift = 0
+    for byte in base64.b64decode(encoded):
+        delta |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            prev += delta
+            ids.append(prev)
+            delta = shift = 0
+    return ids
+
+
+def _empty_state() -> dict:
+    return {"version": STATE_VERSION, "repos": {}, "accounts": {}, "totals": {}}
+
+
+def _state_path(state: dict) -> Path:
+    if "path" in state:
+        return Path(state["path"])
+    shard = state.get("shard")
+    if shard is None:
+        return STATE_PATH
+    return STATE_PATH.with_name(
+        f"{STATE_PATH.stem}.shard-{shard['index']}-of-{shard['count']}.json"
+    )
+
+
+def _snapshot_path(state: dict) -> Path:
+    """SNAPSHOT_PATH, or next to a state kept apart from the published one
+    (see main's record/replay runs)."""
+    if "path" in state:
+        path = Path(state["path"])
+        return path.with_name(f"{path.stem}.snapshot.json")
+    return SNAPSHOT_PATH
+
+
+def _load_state(path: Path | None = None) -> dict:
     """Load cumulative per-repo/per-user stats from a previous run, if any."""
-    if not STATE_PATH.exists():
-        return {"repos": {}}
+    path = path or STATE_PATH
+    if not path.exists():
+        return _empty_state()
 
-    with STATE_PATH.open() as f:
+    with path.open() as f:
         state = json.load(f)
 
+    _upgrade_state(state)
+    state.setdefault("accounts", {})
+
     for repo_state in state.get("repos", {}).values():
         # Older states stored a single timestamp per repo; expand it to the
         # per-stat timestamps used since partial-sync checkpoints were added.
@@ -198,46 +504,319 @@ def _load_state() -> dict:
         repo_state["users"] = {
             user: user_stats
             for user, user_stats in repo_state.get("users", {}).items()
-            if not _is_bot(user)
+            if not _is_bot(state["accounts"].get(user, {}).get("login", user))
         }
-        for user_stats in repo_state["users"].values():
+        if "logins" in repo_state:
+            repo_state["logins"] = {
+                login: user_stats
+                for login, user_stats in repo_state["logins"].items()
+                if not _is_bot(login)
+            }
+        for user_stats in _all_user_stats(repo_state):
             user_stats["active_days"] = {
                 date.fromisoformat(d) for d in user_stats.get("active_days", [])
             }
+            user_stats["daily"] = {
+                stat: {date.fromisoformat(d): n for d, n in daily.items()}
+                for stat, daily in user_stats.get("daily", {}).items()
+            }
+        repo_state["seen"] = {
+            stat: _decode_ids(ids) for stat, ids in repo_state.get("seen", {}).items()
+        }
+    # Cross-repo totals aren't persisted; _merge_stat keeps them current from
+    # here on, and _save_state materializes them into the render snapshot.
+    state["totals"] = _build_totals(state)
     return state
 
 
+def _upgrade_state(state: dict) -> None:
+    """Bring a state loaded from an older version up to STATE_VERSION.
+
+    v1 rows are keyed by login; they're kept under the repo's ``logins``
+    until the next sync re-keys them by user ID (see _rekey_logins). States
+    before v3 have no per-day counts, so the rolling-window tables only
+    include what's synced from then on.
+    """
+    version = state.get("version", 1)
+    if version == STATE_VERSION:
+        return
+    logger.warning(f"Upgrading state v{version} to v{STATE_VERSION}")
+    if version < 2:
+        for repo_state in state.get("repos", {}).values():
+            repo_state["logins"] = repo_state.pop("users", {})
+            repo_state["users"] = {}
+    state["version"] = STATE_VERSION
+
+
+def _all_user_stats(repo_state: dict) -> Iterator[dict]:
+    """Every row of a repo, including login-keyed ones not yet re-keyed."""
+    yield from repo_state.get("users", {}).values()
+    yield from repo_state.get("logins", {}).values()
+
+
+def _serialize_users(users: dict[str, dict]) -> dict[str, dict]:
+    return {
+        user: {
+            **{
+                k: v for k, v in user_stats.items() if k not in ("active_days", "daily")
+            },
+            "active_days": sorted(d.isoformat() for d in user_stats["active_days"]),
+            "daily": {
+                stat: {d.isoformat(): n for d, n in daily.items()}
+                for stat, daily in user_stats.get("daily", {}).items()
+            },
+        }
+        for user, user_stats in users.items()
+    }
+
+
+# Held (see _state_lock) by the thread holding the state file's lock.
+_lock_owner = threading.RLock()
+_lock_held = False
+
+
+@contextmanager
+def _state_lock(path: Path | None = None) -> Iterator[None]:
+    """Hold an exclusive lock on a state file, shared by every process that
+    writes it (the sync, the webhook receiver), e.g. to reload, update and
+    save it without losing what another saved in between. Re-entrant."""
+    global _lock_held
+    path = path or STATE_PATH
+    with _lock_owner:
+        if _lock_held:
+            yield
+            return
+        with path.with_name(f"{path.name}.lock").open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # (released when closed)
+            _lock_held = True
+            try:
+                yield
+            finally:
+                _lock_held = False
+
+
 def _save_state(state: dict) -> None:
-    """Persist cumulative per-repo/per-user stats for the next run."""
+    """Persist cumulative per-repo/per-user stats for the next run, along
+    with the snapshot of rendered rows they aggregate to.
+
+    A shard (see --shard) only writes its own state file; the snapshot is
+    written once the shards are merged.
+    """
+    with SAVE_STATE_SECONDS.time(), _state_lock(_state_path(state)):
+        _write_state(state)
+
+
+def _write_state(state: dict) -> None:
     serializable = {
+        "version": STATE_VERSION,
+        "accounts": state.get("accounts", {}),
+        **(
+            {"accounts_refreshed": state["accounts_refreshed"]}
+            if "accounts_refreshed" in state
+            else {}
+        ),
+        # webhook deliveries already ingested (see webhooks.py)
+        **({"deliveries": state["deliveries"]} if state.get("deliveries") else {}),
         "repos": {
             repo_name: {
                 "last_synced": repo_state["last_synced"],
-                "users": {
-                    user: {
-                        **{k: v for k, v in user_stats.items() if k != "active_days"},
-                        "active_days": sorted(
-                            d.isoformat() for d in user_stats["active_days"]
-                        ),
-                    }
-                    for user, user_stats in repo_state.get("users", {}).items()
+                **({"meta": repo_state["meta"]} if "meta" in repo_state else {}),
+                **({"cost": repo_state["cost"]} if "cost" in repo_state else {}),
+                **({"cursor": repo_state["cursor"]} if "cursor" in repo_state else {}),
+                "seen": {
+                    stat: _encode_ids(ids)
+                    for stat, ids in repo_state.get("seen", {}).items()
                 },
+                "users": _serialize_users(repo_state.get("users", {})),
+                # login-keyed rows of a v1 state, until _rekey_logins
+                **(
+                    {"logins": _serialize_users(repo_state["logins"])}
+                    if repo_state.get("logins")
+                    else {}
+                ),
             }
             for repo_name, repo_state in state.get("repos", {}).items()
-        }
+        },
     }
-    with STATE_PATH.open("w") as f:
+    with _state_path(state).open("w") as f:
         json.dump(serializable, f, indent=2, sort_keys=True)
+    if "shard" in state:
+        return
 
+    totals = state.get("totals")
+    if totals is None:
+        totals = _build_totals(state)
+    rows = _snapshot_rows(totals, state.get("accounts", {}))
+    save_snapshot(
+        [row for row in rows if row["total"] > MIN_ACTIVITY_TOTAL],
+        _snapshot_path(state),
+    )
 
-def _merge_stat(repo_state: dict, stat: str, data) -> None:
-    """Add a freshly-fetched delta for one stat onto the cumulative totals."""
+
+def _unseen(repo_state: dict, stat: str, items: list[Item]) -> dict:
+    """Tally the items not yet counted for this repo and stat, and record
+    them in the repo's seen-ID index so they never are again."""
+    seen = repo_state.setdefault("seen", {}).setdefault(stat, [])
+    new: dict[int, Item] = {}
+    for item in items:
+        if _is_bot(item.user.login) or item.id in new:
+            continue
+        i = bisect.bisect_left(seen, item.id)
+        if i == len(seen) or seen[i] != item.id:
+            new[item.id] = item
+    if new:
+        # one merge of the two sorted runs per page (timsort finds them),
+        # rather than an insort per ID, which is quadratic on a first sync
+        repo_state["seen"][stat] = sorted(seen + list(new))
+    stats = _tally(list(new.values()))
+    return {k: v for k, v in stats.items() if k not in ("items", "next_page")}
+
+
+def _record_accounts(state: dict, items: list[Item], fetched: str) -> None:
+    """Update the ID -> login table from freshly fetched objects, so renamed
+    users who are still active are picked up without extra requests."""
+    accounts = state.setdefault("accounts", {})
+    for item in items:
+        accounts[str(item.user.id)] = {
+            "login": item.user.login,
+            "node_id": item.user.node_id,
+            # when the login was last seen, to merge shards (see _merge_states)
+            "updated": fetched,
+        }
+
+
+def _graphql(gh: Github, query: str, variables: dict) -> dict:
+    # PyGithub 1.x has no GraphQL helper, but its requester can POST to the
+    # endpoint, which keeps these requests on the same client and transport.
+    requester = gh._Github__requester  # type: ignore[attr-defined]
+    _, data = requester.requestJsonAndCheck(
+        "POST", "/graphql", input={"query": query, "variables": variables}
+    )
+    return data["data"]
+
+
+def _refresh_accounts(gh: Github, state: dict, now: datetime) -> None:
+    """Refresh every known user's current login, 100 users per request.
+
+    This is all a rename costs: rows are keyed by user ID, so history is
+    re-attributed by the next render without resyncing any repo.
+    """
+    refreshed = state.get("accounts_refreshed")
+    if refreshed and now - datetime.fromisoformat(refreshed) < ACCOUNT_REFRESH_INTERVAL:
+        return
+    accounts = state.setdefault("accounts", {})
+    user_ids = sorted(accounts, key=int)
+    for i in range(0, len(user_ids), 100):
+        batch = user_ids[i : i + 100]
+        nodes = _graphql(
+            gh,
+            "query($ids: [ID!]!) { nodes(ids: $ids) { ... on Actor { login } } }",
+            {"ids": [accounts[user_id]["node_id"] for user_id in batch]},
+        )["nodes"]
+        for user_id, node in zip(batch, nodes):
+            # deleted accounts come back as null; keep their last known login
+            if node and node.get("login"):
+                if node["login"] != accounts[user_id]["login"]:
+                    logger.info(f"{accounts[user_id]['login']} is now {node['login']}")
+                accounts[user_id]["login"] = node["login"]
+                accounts[user_id]["updated"] = now.isoformat()
+    state["accounts_refreshed"] = now.isoformat()
+
+
+def _lookup_logins(gh: Github, logins: list[str]) -> dict[str, Account]:
+    """The accounts of logins, 100 per request (one aliased ``user`` field
+    each); logins that no longer exist are left out."""
+    accounts = {}
+    for i in range(0, len(logins), 100):
+        batch = logins[i : i + 100]
+        params = ", ".join(f"$l{j}: String!" for j in range(len(batch)))
+        fields = " ".join(
+            f"u{j}: user(login: $l{j}) {{ databaseId id login }}"
+            for j in range(len(batch))
+        )
+        data = _graphql(
+            gh,
+            f"query({params}) {{ {fields} }}",
+            {f"l{j}": login for j, login in enumerate(batch)},
+        )
+        for j, login in enumerate(batch):
+            # renamed-away and deleted accounts (and bots) come back as null
+            user = data.get(f"u{j}")
+            if user and user.get("databaseId"):
+                accounts[login] = Account(user["databaseId"], user["login"], user["id"])
+    return accounts
+
+
+def _add_user_stats(stats: dict, other: dict) -> None:
+    for col in ("comment_words", *TOTAL_COLUMNS):
+        stats[col] += other.get(col, 0)
+    stats["active_days"] |= other["active_days"]
+    for stat, per_day in other.get("daily", {}).items():
+        daily = stats["daily"].setdefault(stat, {})
+        for day, count in per_day.items():
+            daily[day] = daily.get(day, 0) + count
+
+
+def _rekey_logins(gh: Github, state: dict, now: datetime) -> None:
+    """Re-key the login-keyed rows of an upgraded v1 state by user ID.
+
+    Rows of logins that can't be resolved anymore (see _lookup_logins) are
+    dropped; everything else keeps its history, so the sync stays
+    incremental.
+    """
+    pending = [
+        repo_state for repo_state in state["repos"].values() if "logins" in repo_state
+    ]
+    if not pending:
+        return
+    logins = sorted(set().union(*(repo_state["logins"] for repo_state in pending)))
+    accounts = _lookup_logins(gh, logins)
+    for account in accounts.values():
+        state["accounts"][str(account.id)] = {
+            "login": account.login,
+            "node_id": account.node_id,
+            "updated": now.isoformat(),
+        }
+    dropped = set()
+    for repo_state in pending:
+        users = repo_state.setdefault("users", {})
+        for login, user_stats in repo_state.pop("logins").items():
+            if login not in accounts:
+                dropped.add(login)
+                continue
+            # (a renamed user can have rows under both logins)
+            user = str(accounts[login].id)
+            _add_user_stats(users.setdefault(user, _empty_user_stats()), user_stats)
+    logger.info(f"Re-keyed {len(accounts)} logins by user ID")
+    if dropped:
+        logger.warning(
+            f"Dropped the rows of {len(dropped)} unresolvable logins: "
+            + ", ".join(sorted(dropped))
+        )
+    state["totals"] = _build_totals(state)
+
+
+def _merge_stat(
+    repo_state: dict, stat: str, data, totals: dict[str, dict] | None = None
+) -> None:
+    """Add a freshly-fetched delta for one stat onto the cumulative totals.
+
+    Objects the repo's seen-ID index says were already counted (an edited
+    comment, or overlap between runs) are skipped, so every comment, issue
+    and PR is counted exactly once. If given, the cross-repo ``totals`` (see
+    _build_totals) are updated by the same delta, so the render snapshot
+    never needs a full re-aggregation.
+    """
+    if "items" in data:
+        data = _unseen(repo_state, stat, data["items"])
     # Drop bot accounts entirely, matching the published table's filter.
     data = {
         key: {user: v for user, v in d.items() if not _is_bot(user)}
         for key, d in data.items()
     }
     users = repo_state.setdefault("users", {})
+    touched = set().union(*data.values())
+    before = {user: _repo_row(users[user]) for user in touched if user in users}
     if stat == "comments":
         for user in set(data["count"]) | set(data["words"]):
             stats = users.setdefault(user, _empty_user_stats())
@@ -250,13 +829,42 @@ def _merge_stat(repo_state: dict, stat: str, data) -> None:
     # merging the same day twice harmless.
     for user, days in data["days"].items():
         users.setdefault(user, _empty_user_stats())["active_days"] |= days
+    for user, per_day in data.get("daily", {}).items():
+        user_stats = users.setdefault(user, _empty_user_stats())
+        daily = user_stats["daily"].setdefault(stat, {})
+        for day, count in per_day.items():
+            daily[day] = daily.get(day, 0) + count
+
+    if totals is None:
+        return
+    for user in touched:
+        user_totals = totals.setdefault(user, _empty_totals())
+        old_row = before.get(user, {})
+        for col, value in _repo_row(users[user]).items():
+            user_totals[col] += value - old_row.get(col, 0)
+        user_totals["active_days"] |= data["days"].get(user, set())
+
+
+def _tokens() -> list[str]:
+    """GITHUB_TOKEN, followed by any extra tokens in GITHUB_TOKENS (separated
+    by commas or whitespace), e.g. a PAT or a GitHub App installation token."""
+    extra = os.getenv("GITHUB_TOKENS", "").replace(",", " ").split()
+    tokens = [os.getenv("GITHUB_TOKEN", ""), *extra]
+    return [token for token in dict.fromkeys(tokens) if token]
+
+
+def _token_pool() -> AbstractContextManager:
+    """With several tokens, spread the sync's requests over their budgets
+    (see transport.pooling), so it only sleeps once they're all used up."""
+    tokens = _tokens()
+    return transport.pooling(tokens) if len(tokens) > 1 else nullcontext()
 
 
 def _init_gh():
-    GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+    tokens = _tokens()
     # per_page=100 (max) to minimize pagination requests; the Actions
-    # GITHUB_TOKEN only gets 1000 requests/hour.
-    return Github(GITHUB_TOKEN, per_page=100)
+    # GITHUB_TOKEN only gets 1000 requests/hour (see _token_pool for more).
+    return Github(tokens[0] if tokens else None, per_page=100)
 
 
 def _commit_state() -> None:
@@ -268,8 +876,9 @@ def _commit_state() -> None:
     if os.getenv("GITHUB_ACTIONS") != "true" or not STATE_PATH.exists():
         return
     git = ["git", "-C", str(project_dir)]
-    subprocess.run([*git, "add", str(STATE_PATH)], check=False)
+    subprocess.run([*git, "add", str(STATE_PATH), str(SNAPSHOT_PATH)], check=False)
     if subprocess.run([*git, "diff", "--cached", "--quiet"]).returncode == 0:
+        CHECKPOINTS.inc(result="unchanged")
         return  # no staged changes
     commit = subprocess.run(
         [
@@ -284,71 +893,111 @@ def _commit_state() -> None:
         ],
         check=False,
     )
-    if commit.returncode == 0:
-        push = subprocess.run([*git, "push"], check=False)
-        if push.returncode != 0:
-            logger.warning("Failed to push state checkpoint")
+    if commit.returncode != 0:
+        CHECKPOINTS.inc(result="failed")
+        return
+    push = subprocess.run([*git, "push"], check=False)
+    if push.returncode != 0:
+        CHECKPOINTS.inc(result="unpushed")
+        logger.warning("Failed to push state checkpoint")
+    else:
+        CHECKPOINTS.inc(result="pushed")
 
 
-def _sleep_until_rate_limit_reset(gh: Github) -> None:
+def _sleep_until_rate_limit_reset(gh: Github, state: dict) -> None:
     # Checkpoint progress first: the sleep can be up to an hour, during which
-    # the job may hit the 6h runner limit or get cancelled.
-    _commit_state()
+    # the job may hit the 6h runner limit or get cancelled. Shards don't: their
+    # pushes would race each other, and their state is only kept after merging.
+    # Neither do record/replay runs, whose state isn't the published one.
+    if "shard" not in state and "path" not in state:
+        _commit_state()
     wait = max(gh.rate_limiting_resettime - time.time(), 0) + 10
     logger.warning(f"Rate limit exceeded, sleeping {wait:.0f}s until reset...")
     time.sleep(wait)
+    RATE_LIMIT_SLEEPS.observe(wait)
+
+
+def _fetch_page(
+    gh: Github,
+    state: dict,
+    fetcher: Callable,
+    repo_fullname: str,
+    since: datetime,
+    page: str | None,
+) -> dict:
+    """Fetch one page of a stat, retrying it after any rate-limit sleep."""
+    if hasattr(fetcher, "check_call_in_cache"):  # not if caching is disabled
+        cached = fetcher.check_call_in_cache(gh, repo_fullname, since, page)
+        CACHE_LOOKUPS.inc(stat=_fetching.get()[1], result="hit" if cached else "miss")
+    while True:
+        try:
+            return fetcher(gh, repo_fullname, since, page)
+        except RateLimitExceededException:
+            # Persist everything merged so far so the checkpoint commit made
+            # before sleeping includes partial progress.
+            _save_state(state)
+            _sleep_until_rate_limit_reset(gh, state)
 
 
 def _sync_repo(gh: Github, state: dict, repo_fullname: str) -> None:
     """Fetch and merge all stat deltas for a repo, one stat at a time.
 
     Each stat keeps its own last-synced timestamp and is merged into the
-    state as soon as it's fetched, so the state checkpointed before a
-    rate-limit sleep includes partial progress, even mid-repo. A later run
-    then only re-fetches the stats that were still pending.
+    state page by page as it's fetched, so the state checkpointed before a
+    rate-limit sleep includes partial progress, even mid-stat. The repo's
+    ``cursor`` records the next page of the stat in progress; the retry after
+    the sleep, or a later run, continues from that page.
     """
     repo_state = state["repos"].setdefault(
         repo_fullname, {"last_synced": {}, "users": {}}
     )
     last_synced = repo_state["last_synced"]
+    requests_before = _requests_made(repo_fullname)
     for stat, fetcher in STAT_FETCHERS.items():
-        since = (
-            datetime.fromisoformat(last_synced[stat])
-            if last_synced.get(stat)
-            else DEFAULT_SINCE
-        )
-        while True:
-            try:
-                data = fetcher(gh, repo_fullname, since=since)
-                break
-            except RateLimitExceededException:
-                # Persist everything merged so far so the checkpoint commit
-                # made before sleeping includes partial progress.
-                _save_state(state)
-                _sleep_until_rate_limit_reset(gh)
-        _merge_stat(repo_state, stat, data)
-        # Recorded after fetching, so the next run's `since` doesn't skip
-        # activity that happened while this run was fetching.
-        last_synced[stat] = (
-            datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
-        )
+        cursor = repo_state.get("cursor")
+        if cursor and cursor["stat"] == stat:
+            # an interrupted fetch: continue it where it stopped
+            since = datetime.fromisoformat(cursor["since"])
+            started = cursor["started"]
+            page = cursor["page"]
+        else:
+            since = (
+                datetime.fromisoformat(last_synced[stat])
+                if last_synced.get(stat)
+                else DEFAULT_SINCE
+            )
+            # Recorded before fetching, so the next run's `since` doesn't skip
+            # activity that happened while this run was fetching. Whatever
+            # both runs see is only counted once (see _merge_stat).
+            started = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+            page = None
+        with _requests_for(repo_fullname, stat), FETCH_SECONDS.time(
+            repo=repo_fullname, stat=stat
+        ):
+            while True:
+                data = _fetch_page(gh, state, fetcher, repo_fullname, since, page)
+                _record_accounts(state, data["items"], started)
+                _merge_stat(repo_state, stat, data, state.get("totals"))
+                page = data["next_page"]
+                if page is None:
+                    break
+                repo_state["cursor"] = {
+                    "stat": stat,
+                    "since": since.isoformat(),
+                    "started": started,
+                    "page": page,
+                }
+        if repo_state.get("cursor", {}).get("stat") == stat:
+            del repo_state["cursor"]
+        last_synced[stat] = started
+    # Requests this sync took, to balance shards by (see _assign_shards).
+    # Only known when requests are being counted (see main).
+    cost = _requests_made(repo_fullname) - requests_before
+    if cost:
+        repo_state["cost"] = cost
     _save_state(state)
 
 
-@dataclass
-class RepoStats:
-    # most stats are per user
-
-    issues: dict[str, int]
-    comments: CommentStats
-    prs: dict[str, int]
-    prs_merged: dict[str, int]
-    pr_comments: dict[str, int]
-    active_days_set: dict[str, set[date]]
-    # commits: dict[str, int]
-    df: pd.DataFrame
-
-
 WHITELIST = [
     "activitywatch",
     "activitywatch-old",
@@ -378,249 +1027,331 @@ WHITELIST = [
 ]
 
 
-def _sync(gh: Github, state: dict) -> None:
-    """Fetch and merge stats for every whitelisted repo into the state."""
-    while True:
-        try:
-            repos = [
-                repo
-                for repo in gh.get_user("ActivityWatch").get_repos()
-                if repo.name in WHITELIST
-            ]
-            break
-        except RateLimitExceededException:
-            _sleep_until_rate_limit_reset(gh)
-    for repo in tqdm(repos):
-        logger.info(f"Processing for {repo.name}...")
-        _sync_repo(gh, state, repo.full_name)
+def _repo_meta(repo: Repository) -> dict:
+    """Metadata from the repo listing that changes when the repo sees activity."""
+    return {
+        "pushed_at": repo.pushed_at.isoformat() if repo.pushed_at else None,
+        "updated_at": repo.updated_at.isoformat() if repo.updated_at else None,
+        "open_issues_count": repo.open_issues_count,
+    }
 
 
-DISPLAY_COLUMNS = [
-    "issues",
-    "comments",
-    "prs",
-    "prs_merged",
-    "pr_comments",
-    "active_days",
-    "total",
-]
+def _is_unchanged(repo_state: dict | None, meta: dict, now: datetime) -> bool:
+    """Whether a repo can be skipped: every stat was synced after its last
+    push/update, its open issue count is the same, and it was fully checked
+    within FORCE_SYNC_INTERVAL."""
+    if repo_state is None or repo_state.get("meta", {}) != meta:
+        return False
+    if "cursor" in repo_state:
+        return False  # a fetch was interrupted
+    last_synced = repo_state["last_synced"]
+    if any(not last_synced.get(stat) for stat in STAT_FETCHERS):
+        return False
+    oldest_sync = min(
+        datetime.fromisoformat(last_synced[stat]) for stat in STAT_FETCHERS
+    )
+    if now - oldest_sync > FORCE_SYNC_INTERVAL:
+        return False
+    return all(
+        datetime.fromisoformat(meta[key]) <= oldest_sync
+        for key in ("pushed_at", "updated_at")
+        if meta[key]
+    )
+
+
+def _sync(gh: Github, state: dict) -> None:
+    """Fetch and merge stats for every whitelisted repo into the state.
 
-# Minimum total activity for a user to appear in either rendered artifact, so
-# the table and the contributors list apply the same bar (drive-by/near-zero
-# accounts are excluded from both).
-MIN_ACTIVITY_TOTAL = 10
+    The repo listing this already fetches doubles as a catalog of repo
+    metadata; repos that haven't changed since they were last synced are
+    skipped without spending any requests on their stats.
+    """
+    with _requests_for("", "repos"):
+        while True:
+            try:
+                repos = [
+                    (repo, _repo_meta(repo))
+                    for repo in gh.get_user("ActivityWatch").get_repos()
+                    if repo.name in WHITELIST
+                ]
+                break
+            except RateLimitExceededException:
+                _sleep_until_rate_limit_reset(gh, state)
+    shard = state.get("shard")
+    if shard:
+        repos = [
+            (repo, meta) for repo, meta in repos if repo.full_name in shard["repos"]
+        ]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with _requests_for("", "accounts"):
+        while True:
+            try:
+                # (each shard for its own repos)
+                _rekey_logins(gh, state, now)
+                # shards all carry every account; refreshing them once is enough
+                if not shard or shard["index"] == 1:
+                    _refresh_accounts(gh, state, now)
+                break
+            except RateLimitExceededException:
+                _sleep_until_rate_limit_reset(gh, state)
+    for repo, meta in tqdm(repos):
+        if _is_unchanged(state["repos"].get(repo.full_name), meta, now):
+            logger.info(f"Skipping {repo.name}, unchanged since last sync")
+            REPOS.inc(result="skipped")
+            continue
+        REPOS.inc(result="synced")
+        logger.info(f"Processing for {repo.name}...")
+        _sync_repo(gh, state, repo.full_name)
+        # Taken from the listing, i.e. before fetching, so anything that
+        # changes the repo mid-sync still shows up as a change next run.
+        state["repos"][repo.full_name]["meta"] = meta
+    _save_state(state)
 
 
-def _aggregate_stats(state: dict) -> pd.DataFrame:
-    """Aggregate per-repo stats from saved state into one bot-filtered
-    DataFrame sorted by activity, most active first (no API calls).
+def _assign_shards(
+    repos: list[str], costs: dict[str, int], count: int
+) -> list[list[str]]:
+    """Split ``repos`` into ``count`` shards of about equal request cost.
 
-    Returns columns ``['user'] + DISPLAY_COLUMNS``. Both the HTML activity
-    table and the contributors avatar list are rendered from this.
+    Greedy: most expensive repo first, each onto the currently cheapest
+    shard. Repos without a known cost count as the average. The split only
+    depends on its inputs, so every shard job computes the same one.
     """
-    repostats: dict[str, RepoStats] = {}
-    for repo_fullname, repo_state in state["repos"].items():
-        users = repo_state["users"]
-        name = repo_fullname.split("/")[-1]
-        repostats[name] = RepoStats(
-            issues={user: stats["issues"] for user, stats in users.items()},
-            comments=CommentStats(
-                count={user: stats["comments"] for user, stats in users.items()},
-                words={user: stats["comment_words"] for user, stats in users.items()},
-                days={},
-            ),
-            prs={user: stats["prs"] for user, stats in users.items()},
-            prs_merged={user: stats["prs_merged"] for user, stats in users.items()},
-            pr_comments={user: stats["pr_comments"] for user, stats in users.items()},
-            active_days_set={
-                user: stats["active_days"] for user, stats in users.items()
-            },
-            df=None,
-        )
+    default = sum(costs.values()) // len(costs) if costs else 1
+    weight = {repo: max(costs.get(repo, default), 1) for repo in repos}
+    shards: list[list[str]] = [[] for _ in range(count)]
+    loads = [0] * count
+    for repo in sorted(repos, key=lambda repo: (-weight[repo], repo)):
+        i = min(range(count), key=lambda i: (loads[i], i))
+        shards[i].append(repo)
+        loads[i] += weight[repo]
+    return shards
+
+
+def _load_shard_state(index: int, count: int) -> dict:
+    """The part of the state that shard ``index`` (1-based) of ``count`` syncs,
+    balanced by the cost of each repo's previous sync."""
+    state = _load_state()
+    costs = {
+        name: repo_state["cost"]
+        for name, repo_state in state["repos"].items()
+        if "cost" in repo_state
+    }
+    whitelist = [f"ActivityWatch/{name}" for name in WHITELIST]
+    repos = _assign_shards(whitelist, costs, count)[index - 1]
+    logger.info(f"Shard {index}/{count}: {', '.join(repos)}")
+    state["repos"] = {
+        name: repo_state for name, repo_state in state["repos"].items() if name in repos
+    }
+    state["totals"] = _build_totals(state)
+    state["shard"] = {"index": index, "count": count, "repos": repos}
+    return state
 
-    all_users = set(
-        user
-        for repo in repostats.values()
-        for user in (
-            set(repo.comments["count"].keys())
-            | set(repo.issues.keys())
-            | set(repo.pr_comments.keys())
-            | set(repo.prs_merged.keys())
-        )
-    )
-    print(f"Total contributors: {len(all_users)}")
-
-    # Compute stats for each repo
-    for name, stats in repostats.items():
-        df = pd.DataFrame(
-            [
-                (
-                    user,
-                    stats.issues.get(user, 0),
-                    stats.comments["count"].get(user, 0),
-                    stats.comments["words"].get(user, 0),
-                    stats.prs.get(user, 0),
-                    stats.pr_comments.get(user, 0),
-                    stats.prs_merged.get(user, 0),
-                    # active days
-                    stats.active_days_set.get(user, set()),
-                )
-                for user in all_users
-            ],
-            columns=[
-                "user",
-                "issues",
-                "comments",
-                "comment words",
-                "prs",
-                "prs_merged",
-                "pr_comments",
-                "active_days_set",
-            ],
-        )
 
-        # issues include PRs, so we need to subtract them.
-        # A PR created mid-run (after the issues fetch but before the PR
-        # fetch) can make prs briefly exceed issues; the next incremental
-        # run counts that PR as an issue and self-corrects the cumulative
-        # totals, so clip instead of crashing.
-        neg = df["prs"] > df["issues"]
-        if neg.any():
-            logger.warning(
-                f"prs > issues for {df.loc[neg, 'user'].tolist()}, clipping"
-            )
-        df["issues"] = (df["issues"] - df["prs"]).clip(lower=0)
-
-        df["total"] = (
-            df["issues"]
-            + df["comments"]
-            + df["prs"]
-            + df["pr_comments"]
-            + df["prs_merged"]
+def _merge_repo_states(copies: list[dict]) -> dict:
+    repo_state: dict = {"last_synced": {}, "users": {}, "seen": {}}
+    for stat in STAT_FETCHERS:
+        columns = ["comments", "comment_words"] if stat == "comments" else [stat]
+        # the copy synced most recently wins, with the counts and seen IDs
+        # that go with it. Ties prefer a copy whose login-keyed rows were
+        # re-keyed (see _rekey_logins), e.g. by a shard that stopped before
+        # syncing this stat; then they're identical, or broken by content.
+        winner = max(
+            copies,
+            key=lambda copy: (
+                copy["last_synced"].get(stat, ""),
+                "logins" not in copy,
+                copy.get("seen", {}).get(stat, []),
+                json.dumps(
+                    {
+                        user: [user_stats.get(col, 0) for col in columns]
+                        for user, user_stats in copy["users"].items()
+                    },
+                    sort_keys=True,
+                ),
+            ),
         )
-        df = df.sort_values("total", ascending=False)
-        df = df.set_index("user")
-        stats.df = df
-
-    def df_total(repostats: dict[str, pd.DataFrame]) -> pd.DataFrame:
-        # Sum all repo stats into one dataframe
-        assert len(repostats) > 0
-        df: pd.DataFrame = None
-        for stats in repostats.values():
-            if df is None:
-                # if first repo, just copy it
-                df = stats.df
-            else:
-                # print(df.columns)
-                # print(stats["df"].columns)
-                # output: ['issues', 'comments', 'pr_comments', 'submitted_prs', 'merged_prs', 'active_days_set', 'total']
-
-                df["issues"] += stats.df["issues"]
-                df["comments"] += stats.df["comments"]
-                df["prs"] += stats.df["prs"]
-                df["prs_merged"] += stats.df["prs_merged"]
-                df["pr_comments"] += stats.df["pr_comments"]
-                df["total"] = (
-                    df["issues"]
-                    + df["comments"]
-                    + df["prs"]
-                    + df["prs_merged"]
-                    + df["pr_comments"]
-                )
-
-                # here the sets in active_days are added together too
-                days_by_name = defaultdict(set)
-                for name, days in itertools.chain(
-                    df["active_days_set"].items(),
-                    stats.df["active_days_set"].items(),
-                ):
-                    if isinstance(days, float):
-                        continue
-                    days_by_name[name].update(days)
-
-                df["active_days_set"] = pd.Series(
-                    list(days_by_name.values()),
-                    index=list(days_by_name.keys()),
-                    dtype=object,
-                )
-                df["active_days"] = df["active_days_set"].apply(lambda x: len(x))
-        df = df.sort_values("total", ascending=True)
-        return df
-
-    df = df_total(repostats)
-
-    pd.set_option("display.max_rows", None, "display.max_columns", None)
-    print(df[DISPLAY_COLUMNS])
-    print(df.columns)
-
-    # reset index to make user a column (better in HTML)
-    df = df.reset_index()
-
-    # filter out bots (named end in "[bot]")
-    df = df[~df["user"].str.endswith("[bot]")]
-
-    # most active first
-    df = df.sort_values(
-        ["total", "active_days", "user"], ascending=[False, False, True]
+        if stat in winner["last_synced"]:
+            repo_state["last_synced"][stat] = winner["last_synced"][stat]
+        if stat in winner.get("seen", {}):
+            repo_state["seen"][stat] = list(winner["seen"][stat])
+        if winner.get("cursor", {}).get("stat") == stat:
+            repo_state["cursor"] = winner["cursor"]
+        for user, user_stats in winner["users"].items():
+            merged = repo_state["users"].setdefault(user, _empty_user_stats())
+            for col in columns:
+                merged[col] = user_stats.get(col, 0)
+            if stat in user_stats.get("daily", {}):
+                merged["daily"][stat] = dict(user_stats["daily"][stat])
+    # active days only ever grow, whichever copy saw them
+    for copy in copies:
+        for user, user_stats in copy["users"].items():
+            merged = repo_state["users"].setdefault(user, _empty_user_stats())
+            merged["active_days"] |= user_stats["active_days"]
+    latest = max(
+        copies,
+        key=lambda copy: (
+            max(copy["last_synced"].values(), default=""),
+            json.dumps(copy.get("meta"), sort_keys=True),
+            copy.get("cost", 0),
+        ),
     )
+    for key in ("meta", "cost"):
+        if key in latest:
+            repo_state[key] = latest[key]
+    # login-keyed rows only survive if no copy has re-keyed them yet
+    if all("logins" in copy for copy in copies):
+        repo_state["logins"] = latest["logins"]
+    return repo_state
 
-    return df[["user"] + DISPLAY_COLUMNS]
-
-
-def _render_table(df: pd.DataFrame) -> None:
-    """Render the HTML activity table from aggregated stats."""
-    # drop near-inactive accounts (same bar as the contributors list)
-    df = df[df["total"] > MIN_ACTIVITY_TOTAL].copy()
 
-    # linkify GitHub usernames
-    df["user"] = df["user"].apply(lambda x: f'<a href="https://github.com/{x}">{x}</a>')
+def _merge_states(states: list[dict]) -> dict:
+    """Combine shard states (and the state they started from) into one.
 
-    # replace "_" with space and title-ize the column names
-    df.columns = [
-        col.replace("_", " ").title().replace("Pr", "PR") for col in df.columns
+    Per repo and stat, the most recently synced copy is kept. Every choice
+    is a max over the copies, so the result doesn't depend on the order
+    states are merged in, or on merging the same state twice.
+    """
+    merged = _empty_state()
+    for state in states:
+        for user_id, account in state.get("accounts", {}).items():
+            current = merged["accounts"].get(user_id)
+            key = (account.get("updated", ""), account["login"])
+            if current is None or key > (current.get("updated", ""), current["login"]):
+                merged["accounts"][user_id] = account
+    refreshed = [
+        state["accounts_refreshed"] for state in states if "accounts_refreshed" in state
     ]
+    if refreshed:
+        merged["accounts_refreshed"] = max(refreshed)
+    for state in states:
+        for delivery, received in state.get("deliveries", {}).items():
+            deliveries = merged.setdefault("deliveries", {})
+            deliveries[delivery] = max(received, deliveries.get(delivery, ""))
+    for name in sorted(set().union(*(state["repos"] for state in states))):
+        copies = [state["repos"][name] for state in states if name in state["repos"]]
+        merged["repos"][name] = _merge_repo_states(copies)
+    merged["totals"] = _build_totals(merged)
+    return merged
+
+
+def merge_shards(paths: list[Path]) -> dict:
+    """Merge shard state files into the main state (and its snapshot)."""
+    state = _merge_states([_load_state()] + [_load_state(path) for path in paths])
+    _save_state(state)
+    logger.info(f"Merged {len(paths)} shards into {STATE_PATH.name}")
+    return state
 
-    savepath = Path("github-activity-table.html")
-    with savepath.open("w") as f:
-        html = df.to_html(
-            index=False,
-            justify="left",
-            classes="table table-sm",
-            border=0,
-            escape=False,
-        )
-        f.write(html)
-    print(f"Written to {savepath}")
 
+def _aggregate_stats(state: dict) -> list[dict]:
+    """Aggregate per-repo stats from saved state into bot-filtered rows
+    sorted by activity, most active first (no API calls).
 
-# Number of top contributors (by total GitHub activity) whose avatars are shown
-# on the website's contributors page. Chosen to roughly preserve the size of the
-# previously hand-maintained _data/contributors.yml.
-NUM_CONTRIBUTORS = 64
+    Rows have the keys ``['user'] + DISPLAY_COLUMNS``. This recomputes the
+    totals from scratch; the sync keeps the same totals up to date
+    incrementally (see _merge_stat) and renders from those instead.
+    """
+    totals = _build_totals(state)
+    print(f"Total contributors: {len(totals)}")
+    return _snapshot_rows(totals, state["accounts"])
+
+
+def _render_windows(state: dict, windows: list[str]) -> None:
+    """Render a table and contributors list per rolling window (e.g. ``30d``),
+    suffixed with the window, from the state's per-day counts."""
+    index = WindowIndex(state)
+    today = datetime.now(timezone.utc).date()
+    for window in windows:
+        rows = index.rows(parse_window(window), today)
+        _render_table(rows, suffix=f"-{window}")
+        _render_contributors(rows, suffix=f"-{window}")
+
+
+def _run_sync(
+    state: dict,
+    tape: AbstractContextManager,
+    metrics: Path | None = None,
+    metrics_port: int | None = None,
+) -> None:
+    server = REGISTRY.serve(metrics_port) if metrics_port else None
+    try:
+        with tape, transport.observing(_count_request), _token_pool():
+            # the client must be created inside the block to use its transport
+            gh = _init_gh()
+            _sync(gh, state)
+    finally:
+        # also for failed runs, which are the interesting ones
+        if metrics:
+            REGISTRY.write(metrics)
+        if server:
+            server.shutdown()
+
+
+def _run_tape(
+    tape: AbstractContextManager,
+    state_path: Path | None = None,
+    metrics: Path | None = None,
+    metrics_port: int | None = None,
+) -> dict:
+    """Sync through a recording or replaying transport.
+
+    Such runs make fixtures and benchmarks, so they start from an empty state
+    kept at ``state_path`` (by default a temporary file), apart from the
+    published state, which along with the rendered outputs is left alone.
+    Every run then makes the same requests, which a fixture recorded this way
+    has all the responses to.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        state = _empty_state()
+        state["path"] = str(state_path or Path(tmp) / STATE_PATH.name)
+        _run_sync(state, tape, metrics, metrics_port)
+    rows = _snapshot_rows(state["totals"], state["accounts"])
+    logger.info(f"Synced {len(rows)} contributors from {len(state['repos'])} repos")
+    return state
 
 
-def _render_contributors(df: pd.DataFrame) -> None:
-    """Render the contributors avatar list consumed by the website's
-    _data/contributors.yml (the top contributors by total activity)."""
-    # same activity bar as the table, so the two artifacts stay consistent even
-    # if the contributor pool ever shrinks below NUM_CONTRIBUTORS
-    eligible = df[df["total"] > MIN_ACTIVITY_TOTAL]
-    users = eligible["user"].head(NUM_CONTRIBUTORS).tolist()
-    savepath = Path("contributors.yml")
-    with savepath.open("w") as f:
-        f.write("\n".join(f"- {user}" for user in users) + "\n")
-    print(f"Written {len(users)} contributors to {savepath}")
-    print("Done!")
+def main(
+    render_only: bool = False,
+    record: Path | None = None,
+    replay: Path | None = None,
+    windows: list[str] | None = None,
+    metrics: Path | None = None,
+    metrics_port: int | None = None,
+    shard: tuple[int, int] | None = None,
+    state_path: Path | None = None,
+) -> None:
+    state = None
+    if render_only and SNAPSHOT_PATH.exists():
+        # Fast path, same as render.py: no state parsing or re-aggregation.
+        rows = load_snapshot()
+    elif render_only:
+        state = _load_state()
+        rows = _aggregate_stats(state)
+    elif replay:
+        _disable_cache()
+        _run_tape(transport.replaying(replay), state_path, metrics, metrics_port)
+        return
+    elif record:
+        _disable_cache()  # so the fixture has every response
+        _run_tape(transport.recording(record), state_path, metrics, metrics_port)
+        return
+    else:
+        state = _load_shard_state(*shard) if shard else _load_state()
+        _run_sync(state, nullcontext(), metrics, metrics_port)
+        if shard:
+            return  # a shard's totals are partial until merged
+        rows = _snapshot_rows(state["totals"], state["accounts"])
+    _render_table(rows)
+    _render_contributors(rows)
+    if windows:
+        _render_windows(state or _load_state(), windows)
 
 
-def main(render_only: bool = False) -> None:
-    state = _load_state()
-    if not render_only:
-        gh = _init_gh()
-        _sync(gh, state)
-    df = _aggregate_stats(state)
-    _render_table(df)
-    _render_contributors(df)
+def _parse_shard(spec: str) -> tuple[int, int]:
+    index, _, count = spec.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise ValueError(f"Invalid shard {spec!r}, expected e.g. 1/4")
+    return int(index), int(count)
 
 
 if __name__ == "__main__":
@@ -633,8 +1364,102 @@ if __name__ == "__main__":
     parser.add_argument(
         "--render-only",
         action="store_true",
-        help="Render the table from github-stats-state.json without calling "
-        "the GitHub API (no token required).",
+        help="Render the table from github-stats-snapshot.json (or the state, "
+        "if there is no snapshot yet) without calling the GitHub API (no token "
+        "required).",
+    )
+    tape = parser.add_mutually_exclusive_group()
+    tape.add_argument(
+        "--record",
+        type=Path,
+        metavar="FIXTURE",
+        help="Record every GitHub API response of the sync to FIXTURE.",
+    )
+    tape.add_argument(
+        "--replay",
+        type=Path,
+        metavar="FIXTURE",
+        help="Serve the sync's GitHub API requests from FIXTURE instead of the "
+        "network (offline, deterministic; e.g. for benchmarks).",
+    )
+    parser.add_argument(
+        "--state",
+        type=Path,
+        metavar="FILE",
+        help="With --record or --replay, keep the run's state in FILE (default: "
+        "a temporary file). Such runs start from an empty state, and leave the "
+        "published state, snapshot and rendered outputs alone.",
+    )
+    parser.add_argument(
+        "--window",
+        action="append",
+        dest="windows",
+        metavar="WINDOW",
+        help="Also render the table for only the last WINDOW (e.g. 30d, 12w, "
+        "1y) to github-activity-table-WINDOW.html and contributors-WINDOW.yml. "
+        "Can be given several times.",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        metavar="FILE",
+        help="Write the sync's metrics (requests per repo and stat, cache hits, "
+        "rate-limit sleeps, ...) to FILE in Prometheus text format.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve the sync's metrics on http://127.0.0.1:PORT/metrics while "
+        "it runs.",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="I/N",
+        help="Only sync shard I of N (1-based) of the whitelisted repos, split "
+        "by the previous sync's request cost, into its own state file "
+        "(github-stats-state.shard-I-of-N.json). Combine with merge-shards.",
+    )
+    commands = parser.add_subparsers(dest="command")
+    merge = commands.add_parser(
+        "merge-shards",
+        help="Merge shard state files into github-stats-state.json and its "
+        "snapshot.",
+    )
+    merge.add_argument(
+        "shards",
+        nargs="*",
+        type=Path,
+        help="Shard state files (default: all github-stats-state.shard-*.json).",
     )
     args = parser.parse_args()
-    main(render_only=args.render_only)
+    if args.command == "merge-shards":
+        merge_shards(
+            args.shards or sorted(project_dir.glob(f"{STATE_PATH.stem}.shard-*.json"))
+        )
+        raise SystemExit
+    if args.state and not (args.record or args.replay):
+        parser.error("--state only applies to --record and --replay")
+    if args.shard and (args.record or args.replay):
+        parser.error("--shard can't be combined with --record or --replay")
+    shard = None
+    if args.shard:
+        try:
+            shard = _parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    for window in args.windows or []:
+        try:
+            parse_window(window)
+        except ValueError as e:
+            parser.error(str(e))
+    main(
+        render_only=args.render_only,
+        record=args.record,
+        replay=args.replay,
+        windows=args.windows,
+        metrics=args.metrics,
+        metrics_port=args.metrics_port,
+        shard=shard,
+        state_path=args.state,
+    )
@@ -1 +0,0 @@
-../../gitstats/gitstats.py
\ No newline at end of file
@@ -0,0 +1,443 @@
+"""Per-author and per-directory stats from a repo's git history and blame.
+
+The history is read in one ``git log --numstat`` pass, which gives each
+author's commits, active days and lines added/removed, and the blame in one
+``git blame`` per file at HEAD. Both passes also fill a ``DirTree``, which
+attributes the same counts to the directories the files are in, so we can
+tell who owns e.g. aw-server-rust/aw-datastore. A ``CommitIndex`` shared by
+the repos of a run makes sure commits they have in common are only counted
+(and read) once.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+# The counts kept for each author in each directory
+COUNTS = ("commits", "lines_added", "lines_removed", "blame")
+
+# Directory levels attributed to, e.g. aw-server-rust/aw-datastore/src is
+# counted for aw-datastore and aw-datastore/src at depth 2
+DEFAULT_DEPTH = 2
+
+# Nodes kept in a DirTree before the smallest are pruned (see DirTree.prune)
+MAX_NODES = 5000
+
+# Files blamed at once
+BLAME_WORKERS = os.cpu_count() or 4
+
+# Marks the start of each commit in the log (followed by SHA, author, date)
+_COMMIT = "\x00"
+_LOG_FORMAT = "%x00%H%x00%aN%x00%ad"
+
+
+class _Node:
+    __slots__ = ("authors", "children")
+
+    def __init__(self) -> None:
+        self.authors: dict[str, Counter] = {}
+        self.children: dict[str, _Node] = {}
+
+    def add(self, author: str, **counts: int) -> None:
+        self.authors.setdefault(author, Counter()).update(counts)
+
+    def lines(self) -> int:
+        """Lines added, removed and blamed in this directory, by anyone."""
+        return sum(
+            c["lines_added"] + c["lines_removed"] + c["blame"]
+            for c in self.authors.values()
+        )
+
+
+class DirTree:
+    """Counts per author for each directory (a prefix tree of paths), up to
+    ``depth`` levels deep.
+
+    Counts are added to every level of a file's directory, so a directory's
+    counts always include those of its subdirectories. That's what makes
+    pruning cheap: dropping a subdirectory loses nothing of its parents.
+    Whenever there are more than ``max_nodes`` directories, the ones with
+    fewer than ``min_lines`` lines are dropped (doubling ``min_lines`` until
+    enough were), which keeps the memory bounded for huge trees. (A pruned
+    directory that's touched again starts over from zero, so the counts of
+    small directories may be incomplete.)
+    """
+
+    def __init__(
+        self, depth: int = DEFAULT_DEPTH, max_nodes: int = MAX_NODES, min_lines=0
+    ) -> None:
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.min_lines = min_lines
+        self.root = _Node()
+        self.nodes = 1
+
+    def _nodes(self, path: str) -> list[_Node]:
+        """The nodes of the file's directories, from the root down."""
+        nodes = [self.root]
+        node = self.root
+        for part in path.split("/")[:-1][: self.depth]:
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _Node()
+                self.nodes += 1
+            nodes.append(child)
+            node = child
+        return nodes
+
+    def add(self, author: str, path: str, **counts: int) -> None:
+        for node in self._nodes(path):
+            node.add(author, **counts)
+        self._bound()
+
+    def add_commit(self, author: str, changes: Iterable[tuple[str, int, int]]):
+        """Count a commit, with its (path, added, removed) changes, once in
+        each directory it touched."""
+        touched: dict[int, _Node] = {}
+        for path, added, removed in changes:
+            for node in self._nodes(path):
+                node.add(author, lines_added=added, lines_removed=removed)
+                touched[id(node)] = node
+        for node in touched.values():
+            node.add(author, commits=1)
+        self._bound()
+
+    def _bound(self) -> None:
+        while self.nodes > self.max_nodes:
+            self.min_lines = max(1, 2 * self.min_lines)
+            self.prune(self.min_lines)
+
+    def prune(self, min_lines: int) -> None:
+        """Drop the directories with fewer than ``min_lines`` lines."""
+
+        def prune(node: _Node) -> None:
+            for name, child in list(node.children.items()):
+                if child.lines() < min_lines:
+                    del node.children[name]
+                    self.nodes -= _count(child)
+                else:
+                    prune(child)
+
+        prune(self.root)
+
+    def __iter__(self) -> Iterator[tuple[str, _Node]]:
+        """(path, node) of every directory, parents first."""
+        stack = [("", self.root)]
+        while stack:
+            path, node = stack.pop()
+            for name in sorted(node.children, reverse=True):
+                stack.append((f"{path}{name}/", node.children[name]))
+            if path:
+                yield path.rstrip("/"), node
+
+    def tables(self) -> dict[str, dict[str, dict]]:
+        """A table of author rows for each directory, like the per-repo
+        tables (but without active days)."""
+        tables = {}
+        for path, node in self:
+            blame_lines = sum(c["blame"] for c in node.authors.values())
+            tables[path] = {
+                author: {
+                    **{key: counts[key] for key in COUNTS},
+                    "blame_percent": (
+                        counts["blame"] / blame_lines * 100 if blame_lines else 0
+                    ),
+                }
+                for author, counts in node.authors.items()
+            }
+        return tables
+
+
+def _count(node: _Node) -> int:
+    return 1 + sum(_count(child) for child in node.children.values())
+
+
+def _git(path, *args: str) -> list[str]:
+    return ["git", "-C", str(path), "-c", "core.quotepath=off", *args]
+
+
+def _numstat(line: str) -> tuple[str, int, int]:
+    added, removed, path = line.split("\t", 2)
+    # binary files are "-"
+    return (
+        path,
+        int(added) if added != "-" else 0,
+        int(removed) if removed != "-" else 0,
+    )
+
+
+class CommitIndex:
+    """The commits seen so far in a run, across repos.
+
+    Repos can share history (a fork, a successor of an old repo, migrated or
+    vendored code), and shared commits would otherwise be counted once for
+    every repo they're in. Each commit is attributed to the first repo it's
+    seen in, and ``overlap[repo][other]`` counts the commits ``repo`` shares
+    with (the earlier) ``other``.
+    """
+
+    def __init__(self) -> None:
+        self.owners: dict[str, str] = {}
+        self.overlap: dict[str, Counter] = {}
+
+    def claim(self, repo: str, shas: Iterable[str]) -> set[str]:
+        """Record the commits of ``repo``; returns those already seen in
+        another repo."""
+        shared = set()
+        overlap = self.overlap.setdefault(repo, Counter())
+        for sha in shas:
+            owner = self.owners.setdefault(sha, repo)
+            if owner != repo:
+                shared.add(sha)
+                overlap[owner] += 1
+        return shared
+
+
+def read_history(
+    path,
+    tree: DirTree | None = None,
+    canonical: Callable[[str], str] = lambda name: name,
+    index: CommitIndex | None = None,
+    repo: str | None = None,
+) -> dict[str, dict]:
+    """Each author's commits, active days and lines added/removed at HEAD,
+    from one pass over the log, with the names made ``canonical``. The
+    changes are also added to ``tree``.
+
+    Merge commits are counted as commits, but (as they show no diff) their
+    lines aren't, so merged changes are attributed to whoever wrote them.
+
+    With an ``index``, commits already seen in another repo are left out
+    (and aren't walked at all), and this repo's are recorded as ``repo``.
+    """
+    authors: dict[str, dict] = {}
+    author = None
+    changes: list[tuple[str, int, int]] = []
+
+    shared: set[str] = set()
+    if index is not None:
+        shas = subprocess.check_output(_git(path, "rev-list", "HEAD"), text=True)
+        shared = index.claim(repo or str(path), shas.split())
+
+    def flush():
+        if author is not None and tree is not None:
+            tree.add_commit(author, changes)
+
+    with subprocess.Popen(
+        _git(
+            path,
+            "log",
+            "--numstat",
+            "--no-renames",
+            f"--format={_LOG_FORMAT}",
+            "--date=short",
+            "--stdin",
+        ),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    ) as proc:
+        assert proc.stdin is not None and proc.stdout is not None
+        # (git reads all of these before it starts writing the log)
+        proc.stdin.write("HEAD\n" + "".join(f"^{sha}\n" for sha in shared))
+        proc.stdin.close()
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            if line.startswith(_COMMIT):
+                flush()
+                _, _sha, name, day = line.split(_COMMIT)
+                author = canonical(name)
+                changes = []
+                info = authors.setdefault(
+                    author,
+                    {
+                        "commits": 0,
+                        "active_days": set(),
+                        "lines_added": 0,
+                        "lines_removed": 0,
+                    },
+                )
+                info["commits"] += 1
+                info["active_days"].add(day)
+            elif line:
+                change = _numstat(line)
+                info["lines_added"] += change[1]
+                info["lines_removed"] += change[2]
+                changes.append(change)
+        flush()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    return authors
+
+
+def list_files(path, rev: str = "HEAD") -> list[tuple[str, str]]:
+    """(path, blob SHA) of every file at ``rev``."""
+    output = subprocess.check_output(_git(path, "ls-tree", "-r", "-z", rev), text=True)
+    files = []
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, name = entry.split("\t", 1)
+        _mode, kind, sha = info.split()
+        # (submodules are "commit" entries)
+        if kind == "blob":
+            files.append((name, sha))
+    return files
+
+
+def blame_file(path, name: str, rev: str = "HEAD") -> Counter:
+    """The number of lines at ``rev`` last touched by each author."""
+    result = subprocess.run(
+        _git(path, "blame", "--line-porcelain", rev, "--", name),
+        capture_output=True,
+        text=True,
+        errors="replace",
+    )
+    # (e.g. symlinks to nowhere can't be blamed, they're skipped as before)
+    return Counter(
+        line[len("author ") :]
+        for line in result.stdout.splitlines()
+        if line.startswith("author ")
+    )
+
+
+def read_blame(
+    path,
+    tree: DirTree | None = None,
+    canonical: Callable[[str], str] = lambda name: name,
+    workers: int = BLAME_WORKERS,
+) -> Counter:
+    """Lines at HEAD last touched by each author, with the names made
+    ``canonical``. The lines of each file are also added to ``tree``."""
+    names = [name for name, _ in list_files(path)]
+    total: Counter = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, counts in zip(names, pool.map(lambda n: blame_file(path, n), names)):
+            for author, lines in counts.items():
+                author = canonical(author)
+                total[author] += lines
+                if tree is not None:
+                    tree.add(author, name, blame=lines)
+    return total
+
+
+def snapshot_revisions(path, mode: str = "yearly") -> list[tuple[str, str, str]]:
+    """(label, date, commit SHA) of the revisions to take blame snapshots
+    at, oldest first, ending with HEAD.
+
+    ``yearly`` is the last commit (on the first-parent line) before each new
+    year, dated at the new year. ``tags`` is every tag, at its commit's date.
+    """
+    log = subprocess.check_output(
+        _git(path, "log", "--first-parent", "--format=%H %cs", "HEAD"), text=True
+    ).split("\n")
+    commits = [line.split() for line in log if line]
+    head_sha, head_date = commits[0]
+    revisions = []
+    if mode == "yearly":
+        # (newest first)
+        years = range(int(commits[0][1][:4]), int(commits[-1][1][:4]), -1)
+        i = 0
+        for year in years:
+            boundary = f"{year}-01-01"
+            while i < len(commits) and commits[i][1] >= boundary:
+                i += 1
+            if i < len(commits):
+                revisions.append((boundary, boundary, commits[i][0]))
+        revisions.reverse()
+    elif mode == "tags":
+        # The commit dates (the tags' own aren't what the code was at), of
+        # the commit an annotated tag points to, or a lightweight tag's own.
+        # Read per tag in the same call: several tags can share a commit.
+        refs = subprocess.check_output(
+            _git(
+                path,
+                "for-each-ref",
+                "--sort=creatordate",
+                "--format=%(refname:short)%09%(objectname)%09%(committerdate:short)"
+                "%09%(*objectname)%09%(*committerdate:short)",
+                "refs/tags",
+            ),
+            text=True,
+        )
+        for line in refs.splitlines():
+            tag, sha, day, peeled_sha, peeled_day = line.split("\t")
+            if peeled_sha:
+                sha, day = peeled_sha, peeled_day
+            if day:  # (not tags of a tree or blob)
+                revisions.append((tag, day, sha))
+        revisions.sort(key=lambda revision: revision[1])
+    else:
+        raise ValueError(f"Unknown snapshot mode {mode!r}, expected yearly or tags")
+    if not revisions or revisions[-1][2] != head_sha:
+        revisions.append(("HEAD", head_date, head_sha))
+    return revisions
+
+
+def blame_snapshots(
+    path,
+    revisions: list[tuple[str, str, str]],
+    canonical: Callable[[str], str] = lambda name: name,
+    workers: int = BLAME_WORKERS,
+) -> list[dict]:
+    """Lines last touched by each author at each revision (see
+    snapshot_revisions), as ``{"revision", "date", "blame"}`` entries.
+
+    A file's counts only depend on its history, so they're kept by (path,
+    blob SHA) and only files whose blob changed since the previous snapshot
+    are blamed again. (A file that changed and then changed back in between
+    keeps its earlier attribution.)
+    """
+    cache: dict[tuple[str, str], Counter] = {}
+    series = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for label, day, rev in revisions:
+            files = list_files(path, rev)
+            todo = [file for file in files if file not in cache]
+            blamed = pool.map(lambda file: blame_file(path, file[0], rev), todo)
+            # (only the current files are kept, so memory is bounded by the
+            # size of the tree)
+            cache = {
+                **{file: cache[file] for file in files if file in cache},
+                **dict(zip(todo, blamed)),
+            }
+            total: Counter = Counter()
+            for counts in cache.values():
+                for author, lines in counts.items():
+                    total[canonical(author)] += lines
+            series.append({"revision": label, "date": day, "blame": dict(total)})
+    return series
+
+
+def total_series(series_by_repo: dict[str, list[dict]]) -> list[dict]:
+    """The blame of all repos at each date any of them has a snapshot at,
+    summing the latest snapshot of each repo up to that date."""
+    dates = sorted(
+        {entry["date"] for series in series_by_repo.values() for entry in series}
+    )
+    total = []
+    for day in dates:
+        blame: Counter = Counter()
+        for series in series_by_repo.values():
+            latest = [entry for entry in series if entry["date"] <= day]
+            if latest:
+                # (the last of those on the latest date)
+                blame.update(sorted(latest, key=lambda e: e["date"])[-1]["blame"])
+        total.append({"revision": day, "date": day, "blame": dict(blame)})
+    return total
+
+
+def with_percent(series: list[dict]) -> list[dict]:
+    """The entries of a series, with each author's share of the lines."""
+    for entry in series:
+        lines = sum(entry["blame"].values())
+        entry["blame_percent"] = {
+            author: count / lines * 100 if lines else 0
+            for author, count in entry["blame"].items()
+        }
+    return series
@@ -1,17 +1,13 @@
-import sys
 import os
 import unicodedata
 import logging
+import json
 from pathlib import Path
-from typing import Dict, Tuple, Any, MutableMapping
+from typing import Dict, Tuple, Any, MutableMapping, Optional
 from collections import OrderedDict
 from contextlib import contextmanager
 
-original_cwd = os.getcwd()
-__path__ = os.path.dirname(os.path.realpath(__file__))
-sys.path.append(os.path.join(__path__, "gitstats"))
-
-import gitstats
+from contributor_stats import history
 
 logger = logging.getLogger(__name__)
 
@@ -39,93 +35,71 @@ def merge_author(a1: MutableMapping, a2: MutableMapping) -> AuthorInfo:
     return a1
 
 
-def get_authorInfos(data) -> AuthorInfo:
-    names = data.getAuthors()
-
-    authorInfos = {}
-    for name in names:
-        _authorInfo = data.getAuthorInfo(name)
-
-        # Run the following and be amazed by the power of Unicode:
-        #   bool('å' == "å")  # False
-        # This weird unicode char was in Måns name, so now we have to unicode normalize everything.
-        # Never done this before, so thanks for making me learn Måns, or perhaps should I write Måns.
-        _new_name = unicodedata.normalize("NFKC", name)
-        if _new_name != name:
-            logger.info("Name '{}' was normalized to '{}'".format(name, _new_name))
-            name = _new_name
-
-        name = name.replace("å", "å")
-        authorInfos[name] = _authorInfo
-
-    author_merges = [
-        ("Erik Bjäreholt", ["Erik BjÃ¤reholt", "Erik Bjareholt"]),
-        ("Johan Bjäreholt", ["johan-bjareholt"]),
-        ("Nikana", ["nikanar"]),
-        ("Johannes Ahnlide", ["ahnlabb"]),
-        ("Nicolae Stroncea", ["nicolae-stroncea", "Nicolae", "nicolae"]),
-        ("Bill Ang Li", ["Bill-linux"]),
-        ("dependabot[bot]", ["dependabot-preview[bot]"]),
-        ("Otto-AA", ["A_A"]),
-        ("Brayo", ["brayo"])
-    ]
-    for name, aliases in author_merges:
-        for alias in aliases:
-            if alias in authorInfos:
-                to_keep = authorInfos.pop(alias)
-                if name in authorInfos:
-                    to_merge_with = authorInfos.pop(name)
-                    to_keep = merge_author(to_merge_with, to_keep)
-                authorInfos[name] = to_keep
-
-    return authorInfos
-
-
-def git_blame_stats(path) -> dict[str, int]:
+AUTHOR_MERGES = [
+    ("Erik Bjäreholt", ["Erik BjÃ¤reholt", "Erik Bjareholt"]),
+    ("Johan Bjäreholt", ["johan-bjareholt"]),
+    ("Nikana", ["nikanar"]),
+    ("Johannes Ahnlide", ["ahnlabb"]),
+    ("Nicolae Stroncea", ["nicolae-stroncea", "Nicolae", "nicolae"]),
+    ("Bill Ang Li", ["Bill-linux"]),
+    ("dependabot[bot]", ["dependabot-preview[bot]"]),
+    ("Otto-AA", ["A_A"]),
+    ("Brayo", ["brayo"])
+]
+_aliases = {alias: name for name, aliases in AUTHOR_MERGES for alias in aliases}
+
+
+def canonical_author(name: str) -> str:
+    # Run the following and be amazed by the power of Unicode:
+    #   bool('å' == "å")  # False
+    # This weird unicode char was in Måns name, so now we have to unicode normalize everything.
+    # Never done this before, so thanks for making me learn Måns, or perhaps should I write Måns.
+    _new_name = unicodedata.normalize("NFKC", name)
+    if _new_name != name:
+        logger.info("Name '{}' was normalized to '{}'".format(name, _new_name))
+        name = _new_name
+
+    name = name.replace("å", "å")
+    return _aliases.get(name, name)
+
+
+def git_blame_stats(path, tree: Optional[history.DirTree] = None) -> Dict[str, int]:
     """
-    Uses the following command to get stats of lines last touched by each author:
+    Stats of lines last touched by each author, like the following (but blaming several files at once):
         git ls-tree --name-only -z -r HEAD -- $1 | xargs -0 -n1 git blame --line-porcelain | grep "^author "|sort|uniq -c|sort -nr
-    """
-    import subprocess
-    os.chdir(path)
-    output = subprocess.check_output(
-        "git ls-tree --name-only -z -r HEAD -- . | xargs -0 -n1 git blame --line-porcelain | grep '^author '|sort|uniq -c|sort -nr", shell=True, text=True
-    )
-    if output.startswith("usage:"):
-        print(os.getcwd())
-        raise Exception(output)
-    os.chdir(original_cwd)
-    return {" ".join(line.split()[2:]): int(line.split()[0]) for line in output.split("\n") if line}
 
+    The lines of each file are also attributed to its directories in `tree`.
+    """
+    return dict(history.read_blame(path, tree, canonical_author))
 
-def generate_from_repo(path: Path) -> Tuple[str, Table]:
-    path = Path(path).resolve()
 
-    # TODO: Could use caching to speed up (not much point since it usually runs in CI)
-    data = gitstats.GitDataCollector()
+def generate_from_repo(
+    path: Path, tree: Optional[history.DirTree] = None, index: Optional[history.CommitIndex] = None
+) -> Tuple[str, Table]:
+    """
+    Author rows of the repo, from one pass over its history and one over its blame (which also fill `tree`).
 
-    # `data.collect` always gets the current directory for whatever reason,
-    # os.chdir works as a workaround
-    os.chdir(path)
-    data.collect(path)
-    data.refine()
-    os.chdir(original_cwd)
+    Commits already in `index` (seen in another repo of the run) are left out.
+    Blame isn't deduplicated, it's of the files each repo has now.
+    """
+    path = Path(path).resolve()
+    projectname = path.name
 
-    blame = git_blame_stats(path)
+    authorInfos = history.read_history(path, tree, canonical_author, index, projectname)
+    blame = git_blame_stats(path, tree)
     blame_lines = sum(blame.values())
 
-    print("Generated stats for: {}".format(data.projectname))
+    print("Generated stats for: {}".format(projectname))
 
     rows = {}
-    authorInfos = get_authorInfos(data)
     for name, info in authorInfos.items():
         rows[name] = merge_author(zero_row.copy(), info)
         rows[name]["blame"] = blame.get(name, 0)  # type: ignore[assignment]
 
     for name in rows:
-        rows[name]["blame_percent"] = rows[name]["blame"] / blame_lines * 100  # type: ignore
+        rows[name]["blame_percent"] = rows[name]["blame"] / blame_lines * 100 if blame_lines else 0  # type: ignore
 
-    return data.projectname, rows
+    return projectname, rows
 
 
 def table_print(rows: Table):
@@ -168,10 +142,12 @@ class HTML:
         return self
 
 
-def table2html(rows: Table) -> str:
+TABLE_KEYS = ["active_days", "commits", "lines_added", "lines_removed", "blame_percent_str"]
+DIR_TABLE_KEYS = ["commits", "lines_added", "lines_removed", "blame", "blame_percent_str"]
+
+
+def table2html(rows: Table, keys=TABLE_KEYS) -> str:
     html = HTML()
-    # keys = rows[list(rows.keys())[0]].keys()
-    keys = ["active_days", "commits", "lines_added", "lines_removed", "blame_percent_str"]
 
     with html.tag("table", 'class="table table-sm"'):
         # Header
@@ -197,6 +173,20 @@ def table2html(rows: Table) -> str:
     return html.s
 
 
+def dirtables2html(tables: Dict[str, Table]) -> str:
+    """The tables of a repo's directories, one after the other under their path."""
+    html = HTML()
+    for path, rows in tables.items():
+        html += "<h3>{}</h3>".format(path)
+        html.s += table2html(rows, DIR_TABLE_KEYS)
+    return html.s
+
+
+def sort_dirtable(rows: Table) -> Table:
+    # By blame, then by commits, then by name
+    return OrderedDict(sorted(rows.items(), key=lambda item: [-item[1]["blame"], -item[1]["commits"], item[0]]))  # type: ignore[operator]
+
+
 def save_table(name, html, directory="tables") -> None:
     if not os.path.exists(directory):
         os.makedirs(directory)
@@ -227,11 +217,59 @@ def merge_tables(tables: Dict[str, Table]):
     return merged_table
 
 
+def save_json(name, data, directory="tables") -> None:
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    filepath = os.path.join(directory, "{}.json".format(name))
+    with open(filepath, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print("Saved: {}".format(filepath))
+
+
+def overlap_rows(index: history.CommitIndex) -> Dict[str, Dict[str, int]]:
+    """Commits each repo shares with an earlier repo of the run (which they're attributed to)."""
+    return {
+        "{} / {}".format(repo, other): {"commits": count}
+        for repo, overlap in index.overlap.items()
+        for other, count in overlap.most_common()
+    }
+
+
+def blame_percent_str(row) -> str:
+    return "{:.2f}%".format(row["blame_percent"]).replace("0.00%", "0%")
+
+
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate contributor tables from the git history of repos.")
+    parser.add_argument("repos", nargs="*", type=Path, help="Repos to analyze (default: those in repos/)")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=history.DEFAULT_DEPTH,
+        help="Directory levels to make per-directory tables for (0 for none)",
+    )
+    parser.add_argument(
+        "--max-dirs",
+        type=int,
+        default=history.MAX_NODES,
+        help="Directories kept per repo, the smallest are pruned beyond that",
+    )
+    parser.add_argument(
+        "--blame-snapshots",
+        choices=["yearly", "tags"],
+        help="Also save each author's share of the code at every new year (or release tag) to tables/blame-over-time.json",
+    )
+    args = parser.parse_args()
+
     tables = {}
+    dirtables = {}
+    index = history.CommitIndex()
+    blame_series = {}
 
-    if len(sys.argv) >= 1:
-        repos = [Path(d) for d in sys.argv[1:]]
+    if args.repos:
+        repos = args.repos
     else:
         print("No arguments given, looking in repos/ folder")
         p = Path("./repos")
@@ -243,11 +281,28 @@ def main():
     print("Found repos: {}".format([str(r) for r in repos]))
 
     for path in repos:
-        repo_name, rows = generate_from_repo(str(path))
+        tree = history.DirTree(args.depth, args.max_dirs) if args.depth > 0 else None
+        repo_name, rows = generate_from_repo(path, tree, index)
         tables[repo_name] = rows
+        if tree is not None:
+            dirtables[repo_name] = {
+                "{}/{}".format(repo_name, dirpath): sort_dirtable(dirrows)
+                for dirpath, dirrows in tree.tables().items()
+            }
+        if args.blame_snapshots:
+            revisions = history.snapshot_revisions(path, args.blame_snapshots)
+            blame_series[repo_name] = history.blame_snapshots(path, revisions, canonical_author)
 
     tables["total"] = merge_tables(tables)
 
+    overlap = overlap_rows(index)
+    if overlap:
+        print("Shared commits (counted for the first repo only)")
+        for repos_, row in overlap.items():
+            print("{:<50} | {}".format(repos_, row["commits"]))
+        print()
+        save_table("overlap", table2html(overlap, ["commits"]))
+
     # Sort the tables by days active, then commits, then adds, then by name (to achieve deterministic ordering)
     for key in tables:
         tables[key] = OrderedDict(
@@ -264,7 +319,7 @@ def main():
 
     for table in tables:
         for row in tables[table].values():
-            row["blame_percent_str"] = "{:.2f}%".format(row["blame_percent"]).replace("0.00%", "0%")
+            row["blame_percent_str"] = blame_percent_str(row)
 
     for name, rows in tables.items():
         print(name)
@@ -276,6 +331,21 @@ def main():
         print()
         # print(html)
 
+    if blame_series:
+        save_json(
+            "blame-over-time",
+            {
+                "repos": {name: history.with_percent(series) for name, series in blame_series.items()},
+                "total": history.with_percent(history.total_series(blame_series)),
+            },
+        )
+
+    for repo_name, repo_dirtables in dirtables.items():
+        for rows in repo_dirtables.values():
+            for row in rows.values():
+                row["blame_percent_str"] = blame_percent_str(row)
+        save_table("{}-dirs".format(repo_name), dirtables2html(repo_dirtables))
+
 
 if __name__ == "__main__":
     main()
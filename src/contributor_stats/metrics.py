@@ -0,0 +1,164 @@
+"""A minimal metrics registry for the GitHub sync, in Prometheus text format.
+
+Counters and histograms with labels, rendered in the Prometheus exposition
+format (https://prometheus.io/docs/instrumenting/exposition_formats/), so a
+run's numbers can be written to a textfile at the end, or scraped from a
+local port while it's running. Kept to the standard library, like render.py,
+instead of adding a prometheus_client dependency for a handful of metrics.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+# Seconds; covers everything from a single request to an hour-long
+# rate-limit sleep.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(tuple(str(labels[n]) for n in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last), sum]
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self.values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall-clock duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return sum(self.values[key][0]) if key in self.values else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+            for le, n in zip(bounds, counts):
+                cumulative += n
+                le_label = f'le="{le}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, key, le_label)}"
+                    f" {cumulative}"
+                )
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        metric = Counter(name, help, tuple(labelnames))
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames=(), **kwargs) -> Histogram:
+        metric = Histogram(name, help, tuple(labelnames), **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self) -> None:
+        """Reset every metric's values (e.g. between tests)."""
+        for metric in self.metrics:
+            metric.values.clear()
+
+    def render(self) -> str:
+        return "".join(
+            line + "\n" for metric in self.metrics for line in metric.render()
+        )
+
+    def write(self, path: Path) -> None:
+        """Write all metrics to ``path``, atomically (for textfile collectors
+        that may read it at any time)."""
+        tmp = Path(f"{path}.tmp")
+        tmp.write_text(self.render())
+        tmp.replace(path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics on ``http://host:port/metrics`` from a daemon
+        thread, until the returned server is shut down."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
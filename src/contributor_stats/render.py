@@ -0,0 +1,119 @@
+"""Render the GitHub activity table and contributors list from the snapshot.
+
+The sync (github_stats.py) keeps a small materialized snapshot of the final
+sorted rows next to its state file. Rendering only reads that snapshot and
+deliberately sticks to the standard library, so the website build doesn't pay
+for importing pandas/PyGithub or re-aggregating the full state on every deploy.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+script_dir = Path(__file__).parent
+project_dir = script_dir.parent.parent
+
+# Final sorted rows (user + DISPLAY_COLUMNS) of everyone who clears
+# MIN_ACTIVITY_TOTAL, written by github_stats._save_state after every sync.
+SNAPSHOT_PATH = project_dir / "github-stats-snapshot.json"
+
+DISPLAY_COLUMNS = [
+    "issues",
+    "comments",
+    "prs",
+    "prs_merged",
+    "pr_comments",
+    "active_days",
+    "total",
+]
+
+# Minimum total activity for a user to appear in either rendered artifact, so
+# the table and the contributors list apply the same bar (drive-by/near-zero
+# accounts are excluded from both).
+MIN_ACTIVITY_TOTAL = 10
+
+# Number of top contributors (by total GitHub activity) whose avatars are shown
+# on the website's contributors page. Chosen to roughly preserve the size of the
+# previously hand-maintained _data/contributors.yml.
+NUM_CONTRIBUTORS = 64
+
+
+def sort_rows(rows: list[dict]) -> list[dict]:
+    """Most active first; ties broken by active days, then name."""
+    return sorted(
+        rows, key=lambda row: (-row["total"], -row["active_days"], row["user"])
+    )
+
+
+def save_snapshot(rows: list[dict], path: Path = SNAPSHOT_PATH) -> None:
+    with path.open("w") as f:
+        json.dump(rows, f, indent=2, sort_keys=True)
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> list[dict]:
+    with path.open() as f:
+        return json.load(f)
+
+
+def _column_title(column: str) -> str:
+    # replace "_" with space and title-ize the column names
+    return column.replace("_", " ").title().replace("Pr", "PR")
+
+
+def _render_table(rows: list[dict], suffix: str = "") -> None:
+    """Render the HTML activity table from aggregated stats.
+
+    The markup matches what ``DataFrame.to_html`` produced when the table was
+    still rendered through pandas, so the website's styling keeps applying.
+    """
+    # drop near-inactive accounts (same bar as the contributors list)
+    rows = [row for row in rows if row["total"] > MIN_ACTIVITY_TOTAL]
+    columns = ["user"] + DISPLAY_COLUMNS
+
+    lines = [
+        '<table class="dataframe table table-sm">',
+        "  <thead>",
+        '    <tr style="text-align: left;">',
+        *(f"      <th>{_column_title(col)}</th>" for col in columns),
+        "    </tr>",
+        "  </thead>",
+        "  <tbody>",
+    ]
+    for row in rows:
+        user = row["user"]
+        lines.append("    <tr>")
+        # linkify GitHub usernames
+        lines.append(f'      <td><a href="https://github.com/{user}">{user}</a></td>')
+        lines.extend(f"      <td>{row[col]}</td>" for col in DISPLAY_COLUMNS)
+        lines.append("    </tr>")
+    lines += ["  </tbody>", "</table>"]
+
+    savepath = Path(f"github-activity-table{suffix}.html")
+    with savepath.open("w") as f:
+        f.write("\n".join(lines))
+    print(f"Written to {savepath}")
+
+
+def _render_contributors(rows: list[dict], suffix: str = "") -> None:
+    """Render the contributors avatar list consumed by the website's
+    _data/contributors.yml (the top contributors by total activity)."""
+    # same activity bar as the table, so the two artifacts stay consistent even
+    # if the contributor pool ever shrinks below NUM_CONTRIBUTORS
+    eligible = [row for row in rows if row["total"] > MIN_ACTIVITY_TOTAL]
+    users = [row["user"] for row in eligible[:NUM_CONTRIBUTORS]]
+    savepath = Path(f"contributors{suffix}.yml")
+    with savepath.open("w") as f:
+        f.write("\n".join(f"- {user}" for user in users) + "\n")
+    print(f"Written {len(users)} contributors to {savepath}")
+    print("Done!")
+
+
+def main() -> None:
+    rows = load_snapshot()
+    _render_table(rows)
+    _render_contributors(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""Record/replay transport underneath the PyGithub client.
+
+PyGithub sends every request through a connection class on its Requester,
+which it lets us swap out (the same hook its own test suite uses). In record
+mode each response (status, the pagination/rate-limit headers, body) is
+captured to a fixture file as it passes through; in replay mode responses are
+served from that file instead of the network, so a whole sync can be run and
+timed offline and deterministically.
+
+Fixtures are plain JSON and can also be written by hand, e.g. to simulate a
+``403 API rate limit exceeded`` with a given reset time.
+
+The same hook spreads requests over a pool of tokens (see pooling), each
+with its own rate-limit budget.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import urllib.parse
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
+
+# Only the response headers the sync depends on are kept: pagination and the
+# rate-limit bookkeeping. Everything else is noise (and may identify the token).
+RECORDED_HEADERS = {
+    "link",
+    "retry-after",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
+    "x-ratelimit-resource",
+    "x-ratelimit-used",
+}
+
+
+class _Response:
+    # mimics the httplib response object, like PyGithub's RequestsResponse
+    def __init__(self, status: int, headers: dict[str, str], body: str):
+        self.status = status
+        self.headers = headers
+        self.text = body
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class Cassette:
+    """An ordered list of recorded request/response interactions.
+
+    Replay matches requests on method, path and query parameters (minus
+    ``ignore_params``, e.g. a ``since`` derived from the current time).
+    Identical requests are answered in recorded order, and the last answer
+    repeats once they run out.
+    """
+
+    def __init__(
+        self,
+        interactions: list[dict] | None = None,
+        ignore_params: Iterable[str] = (),
+    ):
+        self.interactions = interactions or []
+        self.ignore_params = set(ignore_params)
+        self._queues: dict[tuple, deque[dict]] = defaultdict(deque)
+        for interaction in self.interactions:
+            key = self._key(interaction["method"], interaction["url"])
+            self._queues[key].append(interaction)
+
+    @classmethod
+    def load(cls, path: Path, ignore_params: Iterable[str] = ()) -> Cassette:
+        with Path(path).open() as f:
+            return cls(json.load(f)["interactions"], ignore_params)
+
+    def save(self, path: Path) -> None:
+        with Path(path).open("w") as f:
+            json.dump({"interactions": self.interactions}, f, indent=2)
+
+    def _key(self, method: str, url: str) -> tuple:
+        parsed = urllib.parse.urlsplit(url)
+        params = [
+            (k, v)
+            for k, v in urllib.parse.parse_qsl(parsed.query)
+            if k not in self.ignore_params
+        ]
+        return method, parsed.path, tuple(sorted(params))
+
+    def record(
+        self, method: str, url: str, status: int, headers: dict, body: str
+    ) -> None:
+        interaction = {
+            "method": method,
+            "url": url,
+            "status": status,
+            "headers": {
+                k.lower(): v
+                for k, v in headers.items()
+                if k.lower() in RECORDED_HEADERS
+            },
+            "body": json.loads(body) if body else None,
+        }
+        self.interactions.append(interaction)
+        self._queues[self._key(method, url)].append(interaction)
+
+    def play(self, method: str, url: str) -> _Response:
+        queue = self._queues.get(self._key(method, url))
+        if not queue:
+            raise LookupError(f"No recorded response for {method} {url}")
+        interaction = queue.popleft() if len(queue) > 1 else queue[0]
+        body = interaction["body"]
+        return _Response(
+            interaction["status"],
+            dict(interaction["headers"]),
+            "" if body is None else json.dumps(body),
+        )
+
+    def rate_limit(self, method: str, url: str, reset: int) -> None:
+        """Answer the next matching request with a rate-limit error that
+        resets at ``reset`` (epoch seconds), before the recorded response."""
+        self._queues[self._key(method, url)].appendleft(
+            {
+                "method": method,
+                "url": url,
+                "status": 403,
+                "headers": {
+                    "x-ratelimit-limit": "1000",
+                    "x-ratelimit-remaining": "0",
+                    "x-ratelimit-reset": str(reset),
+                },
+                "body": {"message": "API rate limit exceeded for installation."},
+            }
+        )
+
+
+# Called with (method, url, status, headers, body) for every response.
+OnResponse = Callable[[str, str, int, dict, str], None]
+
+
+def _observing_connection(inner: type, on_response: OnResponse) -> type:
+    class ObservingConnection:
+        def __init__(self, host, port=None, **kwargs):
+            self._cnx = inner(host, port, **kwargs)
+
+        def request(self, verb, url, input, headers):
+            self.verb, self.url = verb, url
+            self._cnx.request(verb, url, input, headers)
+
+        def getresponse(self):
+            response = self._cnx.getresponse()
+            on_response(
+                self.verb,
+                self.url,
+                response.status,
+                dict(response.getheaders()),
+                response.read(),
+            )
+            return response
+
+        def close(self):
+            self._cnx.close()
+
+    return ObservingConnection
+
+
+def _replaying_connection(cassette: Cassette) -> type:
+    class ReplayingConnection:
+        def __init__(self, host, port=None, **kwargs):
+            pass
+
+        def request(self, verb, url, input, headers):
+            self.verb, self.url = verb, url
+
+        def getresponse(self):
+            return cassette.play(self.verb, self.url)
+
+        def close(self):
+            return
+
+    return ReplayingConnection
+
+
+@contextmanager
+def recording(path: Path) -> Iterator[Cassette]:
+    """Capture every GitHub API response made inside the block to ``path``."""
+    cassette = Cassette()
+    Requester.injectConnectionClasses(
+        _observing_connection(HTTPRequestsConnectionClass, cassette.record),
+        _observing_connection(HTTPSRequestsConnectionClass, cassette.record),
+    )
+    try:
+        yield cassette
+    finally:
+        Requester.resetConnectionClasses()
+        cassette.save(path)
+
+
+@contextmanager
+def replaying(path: Path, ignore_params: Iterable[str] = ()) -> Iterator[Cassette]:
+    """Serve every GitHub API request made inside the block from ``path``."""
+    cassette = Cassette.load(path, ignore_params)
+    connection = _replaying_connection(cassette)
+    Requester.injectConnectionClasses(connection, connection)
+    try:
+        yield cassette
+    finally:
+        Requester.resetConnectionClasses()
+
+
+@contextmanager
+def _wrapping(wrap: Callable[[type], type]) -> Iterator[None]:
+    """Wrap whichever connection classes are in place (live, recording or
+    replaying) for the duration of the block."""
+    # PyGithub has no public getters for these; name-mangled class attributes
+    http = Requester._Requester__httpConnectionClass  # type: ignore[attr-defined]
+    https = Requester._Requester__httpsConnectionClass  # type: ignore[attr-defined]
+    persist = Requester._Requester__persist  # type: ignore[attr-defined]
+    Requester.injectConnectionClasses(wrap(http), wrap(https))
+    # Injecting turns off connection reuse, which is meant for test doubles;
+    # a live connection that's only observed should keep being reused.
+    Requester._Requester__persist = persist  # type: ignore[attr-defined]
+    try:
+        yield
+    finally:
+        Requester.injectConnectionClasses(http, https)
+        Requester._Requester__persist = persist  # type: ignore[attr-defined]
+
+
+@contextmanager
+def observing(on_response: OnResponse) -> Iterator[None]:
+    """Pass every GitHub API response made inside the block to
+    ``on_response``, on top of whichever transport is in place (live,
+    recording or replaying), e.g. to count requests."""
+    with _wrapping(lambda inner: _observing_connection(inner, on_response)):
+        yield
+
+
+def _resource(url: str) -> str:
+    """The rate-limit resource (budget) a request counts against."""
+    path = urllib.parse.urlsplit(url).path
+    if path.endswith("/graphql"):
+        return "graphql"
+    if "/search/" in path:
+        return "search"
+    return "core"
+
+
+def _is_rate_limited(status: int, headers: dict[str, str]) -> bool:
+    # primary limits report 0 remaining; secondary ones come with a
+    # retry-after
+    return status in (403, 429) and (
+        headers.get("x-ratelimit-remaining") == "0" or "retry-after" in headers
+    )
+
+
+class TokenPool:
+    """GitHub tokens (e.g. the Actions token, a PAT and an App installation
+    token), each with its own rate-limit budget per resource, as last
+    reported by the API's response headers.
+
+    Requests go to the token with the most requests left. Tokens nothing is
+    known about yet (or whose budget has been reset since) count as full, so
+    each gets tried before the others are drained.
+    """
+
+    def __init__(self, tokens: Iterable[str], clock: Callable[[], float] = time.time):
+        self.tokens = list(dict.fromkeys(token for token in tokens if token))
+        if not self.tokens:
+            raise ValueError("No tokens")
+        self.clock = clock
+        # (token, resource) -> (remaining, reset time in epoch seconds)
+        self.budgets: dict[tuple[str, str], tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _remaining(self, token: str, resource: str) -> float:
+        remaining, reset = self.budgets.get((token, resource), (None, 0.0))
+        if remaining is None or reset <= self.clock():
+            return float("inf")
+        return remaining
+
+    def pick(self, resource: str = "core", exclude: Iterable[str] = ()) -> str | None:
+        """The token with the most budget left, or None if all are (or
+        those not excluded are) exhausted."""
+        with self._lock:
+            candidates = [token for token in self.tokens if token not in exclude]
+            if not candidates:
+                return None
+            token = max(candidates, key=lambda t: self._remaining(t, resource))
+            return token if self._remaining(token, resource) > 0 else None
+
+    def update(self, token: str, resource: str, status: int, headers: dict) -> None:
+        """Record the budget a response reported for ``token``."""
+        headers = {k.lower(): v for k, v in headers.items()}
+        resource = headers.get("x-ratelimit-resource", resource)
+        with self._lock:
+            if "retry-after" in headers and _is_rate_limited(status, headers):
+                reset = self.clock() + float(headers["retry-after"])
+                self.budgets[(token, resource)] = (0, reset)
+            elif "x-ratelimit-remaining" in headers:
+                self.budgets[(token, resource)] = (
+                    int(headers["x-ratelimit-remaining"]),
+                    float(headers.get("x-ratelimit-reset", self.clock() + 3600)),
+                )
+
+    def first_reset(self, resource: str = "core", among: Iterable[str] = ()) -> str:
+        """The token (of ``among``, or all) whose budget is reset first."""
+        candidates = list(among) or self.tokens
+        with self._lock:
+            return min(
+                candidates,
+                key=lambda t: self.budgets.get((t, resource), (None, 0.0))[1],
+            )
+
+
+def _pooling_connection(inner: type, pool: TokenPool) -> type:
+    class PoolingConnection:
+        def __init__(self, host, port=None, **kwargs):
+            self._cnx = inner(host, port, **kwargs)
+
+        def request(self, verb, url, input, headers):
+            self.verb, self.url, self.input = verb, url, input
+            self.headers = dict(headers)
+
+        def getresponse(self):
+            resource = _resource(self.url)
+            limited = {}  # token -> its rate-limit error
+            while True:
+                token = pool.pick(resource, exclude=limited)
+                if token is None:
+                    if limited:
+                        # every token is exhausted: the error of the one
+                        # reset first goes through, and the sync sleeps
+                        # until then
+                        return limited[pool.first_reset(resource, limited)]
+                    # all were already: ask the one reset first, for a
+                    # rate-limit error (with its reset time) to pass on
+                    token = pool.first_reset(resource)
+                headers = {**self.headers, "Authorization": f"token {token}"}
+                self._cnx.request(self.verb, self.url, self.input, headers)
+                response = self._cnx.getresponse()
+                response_headers = {
+                    k.lower(): v for k, v in dict(response.getheaders()).items()
+                }
+                pool.update(token, resource, response.status, response_headers)
+                if not _is_rate_limited(response.status, response_headers):
+                    return response
+                limited[token] = response
+
+        def close(self):
+            self._cnx.close()
+
+    return PoolingConnection
+
+
+@contextmanager
+def pooling(tokens: Iterable[str] | TokenPool) -> Iterator[TokenPool]:
+    """Send every GitHub API request made inside the block with the token
+    of the pool that has the most budget left (see TokenPool), retrying
+    rate-limited requests with the other tokens. A rate-limit error only
+    gets through once every token is exhausted."""
+    pool = tokens if isinstance(tokens, TokenPool) else TokenPool(tokens)
+    with _wrapping(lambda inner: _pooling_connection(inner, pool)):
+        yield pool
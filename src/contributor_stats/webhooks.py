@@ -0,0 +1,242 @@
+"""Ingest GitHub webhook payloads into the sync state, as they happen.
+
+Each payload of an ``issues``, ``issue_comment``, ``pull_request`` or
+``pull_request_review_comment`` event is turned into the same items the
+sync's fetchers report for those objects, and merged with _merge_stat. So
+the table can be re-rendered right away instead of after the next scheduled
+sync, which still runs to fill whatever gaps the webhooks left (missed
+deliveries, downtime of the receiver).
+
+Merging is idempotent: deliveries already ingested are skipped by their
+delivery ID, and objects already counted (by either path) by the repo's
+seen-ID index, like for an overlap between two syncs. Webhooks don't move
+a repo's ``last_synced``, as they can't tell whether anything was missed.
+
+Each delivery is merged into the state as saved, reloaded under the state
+file's lock (which the sync's saves take too), so whatever a sync saved in
+the meantime is kept.
+
+Payloads come from a local HTTP receiver (verifying GitHub's HMAC signature
+with GITHUB_WEBHOOK_SECRET), or from a directory of JSON files, each
+``{"event": ..., "delivery": ..., "payload": {...}}``.
+
+Usage:
+    python3 src/contributor_stats/webhooks.py --port 8080
+    python3 src/contributor_stats/webhooks.py --dir deliveries/
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+from contributor_stats.github_stats import (
+    WHITELIST,
+    Account,
+    Item,
+    _load_state,
+    _merge_stat,
+    _record_accounts,
+    _save_state,
+    _snapshot_rows,
+    _state_lock,
+)
+from contributor_stats.render import _render_contributors, _render_table
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ["issues", "issue_comment", "pull_request", "pull_request_review_comment"]
+
+# Delivery IDs remembered for idempotency (the oldest are forgotten first;
+# redeliveries of older ones are still caught by the seen-ID index)
+MAX_DELIVERIES = 10_000
+
+
+def _account(user: dict) -> Account:
+    return Account(user["id"], user["login"], user["node_id"])
+
+
+def _day(timestamp: str) -> date:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).date()
+
+
+def payload_items(event: str, payload: dict) -> list[tuple[str, Item]]:
+    """(stat, item) of everything an event's payload counts for, the same
+    as the sync's fetchers would report for the object."""
+    action = payload.get("action")
+    if event == "issues" and action == "opened":
+        issue = payload["issue"]
+        item = Item(issue["number"], _account(issue["user"]), _day(issue["created_at"]))
+        return [("issues", item)]
+    if event == "issue_comment" and action == "created":
+        # (the comments of PRs' conversations are issue comments too)
+        comment = payload["comment"]
+        words = len((comment.get("body") or "").split())
+        item = Item(
+            comment["id"], _account(comment["user"]), _day(comment["created_at"]), words
+        )
+        return [("comments", item)]
+    if event == "pull_request":
+        pr = payload["pull_request"]
+        user = _account(pr["user"])
+        if action == "opened":
+            # the issues listing includes PRs, see github_stats._repo_row
+            item = Item(pr["number"], user, _day(pr["created_at"]))
+            return [("issues", item), ("prs", item)]
+        if action == "closed" and pr.get("merged_at"):
+            return [("prs_merged", Item(pr["number"], user, _day(pr["merged_at"])))]
+    if event == "pull_request_review_comment" and action == "created":
+        comment = payload["comment"]
+        item = Item(
+            comment["id"], _account(comment["user"]), _day(comment["created_at"])
+        )
+        return [("pr_comments", item)]
+    return []
+
+
+def ingest(state: dict, event: str, payload: dict, delivery: str | None = None) -> bool:
+    """Merge a webhook payload into the state; returns whether it counted
+    for anything new."""
+    deliveries = state.setdefault("deliveries", {})
+    if delivery is not None and delivery in deliveries:
+        return False
+    repo_fullname = payload.get("repository", {}).get("full_name")
+    if repo_fullname not in {f"ActivityWatch/{name}" for name in WHITELIST}:
+        return False
+    received = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+    repo_state = state["repos"].setdefault(
+        repo_fullname, {"last_synced": {}, "users": {}}
+    )
+    new = False
+    for stat, item in payload_items(event, payload):
+        seen = len(repo_state.get("seen", {}).get(stat, []))
+        _record_accounts(state, [item], received)
+        _merge_stat(repo_state, stat, {"items": [item]}, state.get("totals"))
+        new |= len(repo_state.get("seen", {}).get(stat, [])) > seen
+    if delivery is not None:
+        deliveries[delivery] = received
+        if len(deliveries) > MAX_DELIVERIES:
+            for old in sorted(deliveries, key=deliveries.__getitem__)[:-MAX_DELIVERIES]:
+                del deliveries[old]
+    return new
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Whether ``signature`` (the X-Hub-Signature-256 header) is the body's."""
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+def _publish(state: dict) -> None:
+    """Save the state (and its snapshot), and re-render from it."""
+    _save_state(state)
+    rows = _snapshot_rows(state["totals"], state["accounts"])
+    _render_table(rows)
+    _render_contributors(rows)
+
+
+def ingest_dir(state: dict, directory: Path) -> int:
+    """Ingest every delivery file in ``directory`` (in name order); returns
+    how many counted for something new."""
+    count = 0
+    for path in sorted(Path(directory).glob("*.json")):
+        delivery = json.loads(path.read_text())
+        count += ingest(
+            state,
+            delivery["event"],
+            delivery["payload"],
+            delivery.get("delivery", path.stem),
+        )
+    return count
+
+
+def ingest_saved(event: str, payload: dict, delivery: str | None = None) -> bool:
+    """Merge a webhook payload into the saved state, and publish it if it
+    counted for anything new."""
+    with _state_lock():
+        state = _load_state()
+        if not ingest(state, event, payload, delivery):
+            return False
+        _publish(state)
+        return True
+
+
+def make_server(port: int, secret: str) -> HTTPServer:
+    """A receiver for webhook deliveries, merging (and publishing) each as it
+    arrives. Requests are handled one at a time, as they all update the
+    state."""
+
+    class Receiver(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(
+                secret, body, self.headers.get("X-Hub-Signature-256")
+            ):
+                self._reply(401, "bad signature")
+                return
+            event = self.headers.get("X-GitHub-Event", "")
+            if event not in EVENTS:
+                self._reply(200, "ignored")  # e.g. ping
+                return
+            delivery = self.headers.get("X-GitHub-Delivery")
+            if ingest_saved(event, json.loads(body), delivery):
+                self._reply(200, "ingested")
+            else:
+                self._reply(200, "nothing new")
+
+        def _reply(self, status: int, message: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.end_headers()
+            self.wfile.write(message.encode())
+
+        def log_message(self, format, *args):
+            logger.info(format % args)
+
+    return HTTPServer(("127.0.0.1", port), Receiver)
+
+
+def main() -> None:
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Merge GitHub webhook deliveries into the stats state."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--port",
+        type=int,
+        help="Receive deliveries on http://127.0.0.1:PORT (signed with "
+        "GITHUB_WEBHOOK_SECRET).",
+    )
+    source.add_argument(
+        "--dir",
+        type=Path,
+        help="Ingest the delivery files in DIR (see the module docstring).",
+    )
+    args = parser.parse_args()
+
+    if args.dir:
+        with _state_lock():
+            state = _load_state()
+            count = ingest_dir(state, args.dir)
+            _publish(state)
+        logger.info(f"Ingested {count} new deliveries from {args.dir}")
+        return
+    secret = os.getenv("GITHUB_WEBHOOK_SECRET")
+    if not secret:
+        parser.error("GITHUB_WEBHOOK_SECRET is required to verify deliveries")
+    server = make_server(args.port, secret)
+    logger.info(f"Receiving webhooks on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
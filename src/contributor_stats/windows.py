@@ -0,0 +1,95 @@
+"""Rolling-window leaderboards (e.g. the last 30 days) from per-day counts.
+
+The sync keeps, per repo and user, how many events of each stat happened on
+each day (``daily`` in the state). WindowIndex folds those into per-user
+prefix sums once, after which the table for any date range is a couple of
+bisections per user and column, with no re-fetching or re-aggregation.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import accumulate
+
+from contributor_stats.render import sort_rows
+
+# Same columns (and order) as the all-time table, see github_stats.TOTAL_COLUMNS.
+WINDOW_COLUMNS = ["issues", "comments", "prs", "prs_merged", "pr_comments"]
+
+_WINDOW_UNITS = {"d": 1, "w": 7, "y": 365}
+
+
+def parse_window(spec: str) -> timedelta:
+    """Parse a window like ``30d``, ``12w`` or ``1y``."""
+    match = re.fullmatch(r"(\d+)([dwy])", spec)
+    if not match or int(match[1]) == 0:
+        raise ValueError(f"Invalid window {spec!r}, expected e.g. 30d, 12w or 1y")
+    return timedelta(days=int(match[1]) * _WINDOW_UNITS[match[2]])
+
+
+class _PrefixSums:
+    """Cumulative counts over sorted day ordinals."""
+
+    def __init__(self, counts: dict[int, int]):
+        self.days = sorted(counts)
+        self.sums = [0, *accumulate(counts[day] for day in self.days)]
+
+    def between(self, start: int, end: int) -> int:
+        """Sum of counts on days in ``(start, end]``."""
+        return (
+            self.sums[bisect_right(self.days, end)]
+            - self.sums[bisect_right(self.days, start)]
+        )
+
+
+class WindowIndex:
+    """Per-user prefix sums of every column, summed across repos.
+
+    Built from in-memory state (see github_stats._load_state), where each
+    repo's user rows have ``daily: {stat: {date: count}}``.
+    """
+
+    def __init__(self, state: dict):
+        counts: dict[str, dict[str, dict[int, int]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(int))
+        )
+        for repo_state in state["repos"].values():
+            for user, user_stats in repo_state["users"].items():
+                for stat, daily in user_stats.get("daily", {}).items():
+                    user_counts = counts[user][stat]
+                    for day, count in daily.items():
+                        user_counts[day.toordinal()] += count
+        self.accounts = state.get("accounts", {})
+        self.index = {
+            user: {stat: _PrefixSums(counts[user][stat]) for stat in WINDOW_COLUMNS}
+            for user in counts
+        }
+        # One entry per distinct day with any activity, for active_days.
+        self.active = {
+            user: _PrefixSums(dict.fromkeys(set().union(*user_counts.values()), 1))
+            for user, user_counts in counts.items()
+        }
+
+    def rows(self, window: timedelta, today: date) -> list[dict]:
+        """Sorted ``['user'] + DISPLAY_COLUMNS`` rows for the ``window`` up to
+        and including ``today``, like github_stats._snapshot_rows."""
+        end = today.toordinal()
+        start = end - window.days
+        rows = []
+        for user_id, sums in self.index.items():
+            user = self.accounts.get(user_id, {}).get("login", user_id)
+            if user.endswith("[bot]"):
+                continue
+            row = {"user": user}
+            row.update({col: sums[col].between(start, end) for col in WINDOW_COLUMNS})
+            # issues include PRs (see github_stats._repo_row); here the
+            # subtraction is done across repos, not per repo
+            row["issues"] = max(row["issues"] - row["prs"], 0)
+            row["active_days"] = self.active[user_id].between(start, end)
+            row["total"] = sum(row[col] for col in WINDOW_COLUMNS)
+            if row["total"]:
+                rows.append(row)
+        return sort_rows(rows)
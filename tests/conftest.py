@@ -0,0 +1,36 @@
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+from contributor_stats import github_stats
+from contributor_stats.metrics import REGISTRY
+
+ROOT = Path(__file__).parent.parent
+
+
+def load_script(path: str, name: str) -> ModuleType:
+    """Import a script that isn't part of the package (e.g. ``video/*.py``,
+    whose names aren't importable), by its path relative to the repo root."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """Keep a replayed sync from touching the real state, snapshot or cache.
+
+    Returns the list of rate-limit sleeps the sync would have done.
+    """
+    monkeypatch.setattr(github_stats, "STATE_PATH", tmp_path / "state.json")
+    monkeypatch.setattr(github_stats, "SNAPSHOT_PATH", tmp_path / "snapshot.json")
+    for stat, fetcher in github_stats.STAT_FETCHERS.items():
+        monkeypatch.setitem(github_stats.STAT_FETCHERS, stat, fetcher.func)
+    sleeps: list[float] = []
+    monkeypatch.setattr(github_stats.time, "sleep", sleeps.append)
+    REGISTRY.clear()
+    return sleeps
@@ -0,0 +1,44 @@
+import json
+
+from conftest import load_script
+
+from contributor_stats import github_stats
+
+bench = load_script("benchmarks/bench_github_stats.py", "bench_github_stats")
+
+
+def test_generate_state(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps(bench.generate_state(3, 40, 6, 0.25)))
+    state = github_stats._load_state(path)
+    logins = [account["login"] for account in state["accounts"].values()]
+    bots = [login for login in logins if login.endswith("[bot]")]
+    assert len(logins) == 40 and 0 < len(bots) < 20
+    # bots are purged on load, everyone else has their days
+    users = {u for repo in state["repos"].values() for u in repo["users"]}
+    assert len(users) == 40 - len(bots)
+    for repo_state in state["repos"].values():
+        for user_stats in repo_state["users"].values():
+            assert user_stats["issues"] >= user_stats["prs"]
+    active = {
+        user: set().union(
+            *(r["users"][user]["active_days"] for r in state["repos"].values()
+              if user in r["users"])
+        )
+        for user in users
+    }  # fmt: skip
+    assert all(len(days) == 6 for days in active.values())
+
+
+def test_benchmark(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    results = bench.run(["2x30x5", "2x60x5x0"], repeat=1)
+    assert [r["users"] for r in results["results"]] == [30, 60]
+    assert results["results"][1]["rows"] <= 60
+    for result in results["results"]:
+        assert set(result["stages"]) == set(bench.STAGES)
+        assert all(s["peak_bytes"] > 0 for s in result["stages"].values())
+    # nothing was rendered into the working directory
+    assert list(tmp_path.iterdir()) == []
+    bench.report(results, baseline=results)
+    assert "1.00x time" in capsys.readouterr().out
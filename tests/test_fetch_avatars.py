@@ -0,0 +1,122 @@
+import hashlib
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from conftest import ROOT, load_script
+
+fetch_avatars = load_script("video/fetch-avatars.py", "fetch_avatars")
+
+
+def _hash(email):
+    return hashlib.md5(email.encode()).hexdigest()
+
+
+# email hash -> image
+AVATARS = {_hash("johan@example.com"): b"johan.png", _hash("new@example.com"): b"new"}
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    requests: list[tuple] = []
+
+    def do_GET(self):
+        key = self.path.partition("?")[0].rsplit("/", 1)[-1]
+        etag = self.headers.get("If-None-Match")
+        self.requests.append((key, etag))
+        if key not in AVATARS:
+            self.send_response(404)
+            self.end_headers()
+        elif etag == f'"{key}"':
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("ETag", f'"{key}"')
+            self.send_header("Content-Length", str(len(AVATARS[key])))
+            self.end_headers()
+            self.wfile.write(AVATARS[key])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def avatar_url():
+    _StandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/avatar"
+    server.shutdown()
+
+
+def _commit(repo, name, email):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", f"user.name={name}", "-c", f"user.email={email}"]
+        + ["commit", "-q", "--allow-empty", "-m", "commit"],
+        check=True,
+    )
+
+
+def test_fetch_avatars(avatar_url, tmp_path):
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    _commit(repo, "johan-bjareholt", "johan@example.com")
+    _commit(repo, "Johan Bjäreholt", "old@example.com")  # latest first
+    _commit(repo, "nobody", "nobody@example.com")
+    renames = fetch_avatars.load_renames(ROOT / "video" / "gource-rules.json")
+    authors = fetch_avatars.collect_authors([repo, tmp_path / "missing"], renames)
+    assert authors == {
+        "nobody": ["nobody@example.com"],
+        "Johan Bjäreholt": ["old@example.com", "johan@example.com"],
+    }
+
+    def run(**kwargs):
+        cache = fetch_avatars.AvatarCache(
+            tmp_path / "cache",
+            avatar_url,
+            limiter=fetch_avatars.RateLimiter(0),
+            **kwargs,
+        )
+        _StandIn.requests.clear()
+        return fetch_avatars.fetch_avatars(authors, tmp_path / "avatars", cache)
+
+    assert run() == 1
+    # written under the name in the (renamed) gource log
+    assert (tmp_path / "avatars" / "Johan Bjäreholt.png").read_bytes() == b"johan.png"
+    assert len(_StandIn.requests) == 3
+
+    # everything (found or not) is cached...
+    assert run() == 1
+    assert _StandIn.requests == []
+
+    # ...until it's old enough to be re-validated
+    assert run(max_age=0) == 1
+    assert _StandIn.requests == [
+        (_hash("johan@example.com"), f'"{_hash("johan@example.com")}"')
+    ]
+    assert run(max_age=0, negative_max_age=0) == 1
+    assert len(_StandIn.requests) == 3
+
+
+def test_concurrent_gets(avatar_url, tmp_path):
+    cache = fetch_avatars.AvatarCache(
+        tmp_path / "cache", avatar_url, limiter=fetch_avatars.RateLimiter(0)
+    )
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        images = list(pool.map(cache.get, ["johan@example.com"] * 16))
+    # fetched once, by whichever thread got there first
+    assert _StandIn.requests == [(_hash("johan@example.com"), None)]
+    assert {image.read_bytes() for image in images} == {b"johan.png"}
+    assert not list((tmp_path / "cache").glob("*.tmp"))
+
+
+def test_rate_limiter(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fetch_avatars.time, "sleep", sleeps.append)
+    limiter = fetch_avatars.RateLimiter(10)
+    for _ in range(3):
+        limiter.wait()
+    assert sleeps[0] == 0
+    assert 9 < sleeps[1] <= 10 and 19 < sleeps[2] <= 20
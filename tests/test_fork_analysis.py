@@ -0,0 +1,327 @@
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import ANY
+from urllib.parse import parse_qs
+
+import pytest
+
+from contributor_stats import fork_analysis
+
+
+def _commit(sha, message, date="2023-04-01T00:00:00Z"):
+    author = {"name": "Alice", "email": "alice@example.com", "date": date}
+    return {"sha": sha, "commit": {"author": author, "message": message}}
+
+
+def _fork(owner, pushed_at):
+    return {
+        "name": "activitywatch",
+        "owner": {"login": owner},
+        "created_at": "2023-01-01T00:00:00Z",
+        "pushed_at": pushed_at,
+    }
+
+
+def _branch(name, sha):
+    return {"name": name, "commit": {"sha": sha}}
+
+
+def _diff(name, text):
+    return (
+        f"diff --git a/{name} b/{name}\nnew file mode 100644\n"
+        f"--- /dev/null\n+++ b/{name}\n@@ -0,0 +1 @@\n+{text}\n"
+    )
+
+
+# path (without the query) -> pages of response bodies (diffs are served as
+# they are)
+ROUTES = {
+    "/repos/ActivityWatch/activitywatch": [
+        {"default_branch": "master", "clone_url": "unused"}
+    ],
+    "/repos/ActivityWatch/activitywatch/forks": [
+        [_fork("alice", "2023-05-01T00:00:00Z")],
+        [_fork("bob", "2022-12-01T00:00:00Z")],  # never pushed to
+    ],
+    "/repos/alice/activitywatch/branches": [
+        [_branch("master", "a1"), _branch("fix", "a3")]
+    ],
+    "/repos/ActivityWatch/activitywatch/compare/master...alice:master": [
+        {"ahead_by": 1, "commits": [_commit("a1", "Add feature")]}
+    ],
+    "/repos/ActivityWatch/activitywatch/compare/master...alice:fix": [
+        {"ahead_by": 3, "commits": [_commit("a1", "Add feature")]},
+        {"ahead_by": 3, "commits": [_commit("a2", "Fix it"), _commit("a3", "Oops")]},
+    ],
+    "/repos/alice/activitywatch/commits/a1": [_diff("feature", "feature")],
+    "/repos/alice/activitywatch/commits/a2": [_diff("fix", "fix")],
+    # (a3's diff is unavailable)
+}
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    routes = ROUTES
+    requests: list[str] = []
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        self.requests.append(self.path)
+        pages = self.routes.get(path)
+        if pages is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        page = int(parse_qs(query).get("page", ["1"])[0])
+        content = pages[page - 1]
+        body = (content if isinstance(content, str) else json.dumps(content)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if page < len(pages):
+            base = f"http://127.0.0.1:{self.server.server_port}{path}"
+            self.send_header(
+                "Link", f'<{base}?per_page=100&page={page + 1}>; rel="next"'
+            )
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # for unique_patches.json
+    monkeypatch.setattr(_StandIn, "routes", dict(ROUTES))
+    _StandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_fork_analysis(api_url, tmp_path):
+    output = tmp_path / "unique_commits.jsonl"
+    results = fork_analysis.main(api_url=api_url, workers=4, filename=output)
+
+    assert fork_analysis.ResultLog(output).all() == results
+    commits = results["alice"]["unique_commits"]
+    assert [c["sha"] for c in commits] == ["a1", "a2", "a3"]
+    assert commits[0]["branches"] == ["master", "fix"]
+    assert commits[0]["message"] == "Add feature"
+    assert results["alice"]["heads"] == {"master": "a1", "fix": "a3"}
+    assert results["bob"]["unique_commits"] == []
+    assert not any("/bob/" in path for path in _StandIn.requests)
+    # patch IDs from the commits' diffs, the same git computes locally
+    fix_id = fork_analysis.patch_id(_diff("fix", "fix").encode())
+    assert [c["patch_id"] for c in commits] == [ANY, fix_id, None]
+    assert commits[0]["patch_id"] not in (None, fix_id)
+
+    # forks nobody pushed to since aren't checked again
+    _StandIn.requests.clear()
+    size = output.stat().st_size
+    fork_analysis.main(api_url=api_url, filename=output)
+    assert not any("branches" in p or "compare" in p for p in _StandIn.requests)
+    assert output.stat().st_size == size
+
+    # pushed to, but no branch moved: only the branches are listed
+    forks = _StandIn.routes["/repos/ActivityWatch/activitywatch/forks"]
+    forks[0] = [_fork("alice", "2023-06-01T00:00:00Z")]
+    _StandIn.requests.clear()
+    results = fork_analysis.main(api_url=api_url, filename=output)
+    assert not any("compare" in path for path in _StandIn.requests)
+    assert [c["sha"] for c in results["alice"]["unique_commits"]] == ["a1", "a2", "a3"]
+
+    # a branch moved: the fork is compared again, and its new record appended
+    forks[0] = [_fork("alice", "2023-07-01T00:00:00Z")]
+    _StandIn.routes["/repos/alice/activitywatch/branches"] = [[_branch("master", "a1")]]
+    _StandIn.requests.clear()
+    results = fork_analysis.main(api_url=api_url, filename=output)
+    assert [c["sha"] for c in results["alice"]["unique_commits"]] == ["a1"]
+    # (a1's patch ID was known from the previous record)
+    assert not any("/commits/" in path for path in _StandIn.requests)
+    log = fork_analysis.ResultLog(output)
+    assert log.read("alice")["heads"] == {"master": "a1"}
+    assert log.all() == results
+
+
+def test_api_patch_ids_cluster(api_url, tmp_path):
+    # carol cherry-picked alice's fix: another SHA, the same diff
+    _StandIn.routes.update(
+        {
+            "/repos/ActivityWatch/activitywatch/forks": [
+                [_fork("alice", "2023-05-01T00:00:00Z")],
+                [_fork("carol", "2023-05-01T00:00:00Z")],
+            ],
+            "/repos/carol/activitywatch/branches": [[_branch("master", "c1")]],
+            "/repos/ActivityWatch/activitywatch/compare/master...carol:master": [
+                {"ahead_by": 1, "commits": [_commit("c1", "Fix it")]}
+            ],
+            "/repos/carol/activitywatch/commits/c1": [_diff("fix", "fix")],
+        }
+    )
+    fork_analysis.main(api_url=api_url, filename=tmp_path / "unique_commits.jsonl")
+    report = json.loads((tmp_path / "unique_patches.json").read_text())
+    fix = [entry for entry in report if entry["message"] == "Fix it"]
+    assert [(entry["shas"], entry["forks"]) for entry in fix] == [
+        (["a2", "c1"], ["alice", "carol"])
+    ]
+
+
+def test_result_log(tmp_path):
+    path = tmp_path / "results.jsonl"
+    log = fork_analysis.ResultLog(path)
+    record = {"owner": "alice", "pushed_at": "1", "unique_commits": []}
+    log.append([record, {**record, "owner": "bob"}])
+    log.append([{**record, "pushed_at": "2"}])
+    assert fork_analysis.ResultLog(path).get("alice")["pushed_at"] == "2"
+
+    # superseded records are dropped once they're most of the log
+    log.append([{**record, "pushed_at": "3"}, {**record, "pushed_at": "4"}])
+    assert len(path.read_text().splitlines()) == 2
+    assert fork_analysis.ResultLog(path).read("alice")["pushed_at"] == "4"
+
+    # a torn append (the index not updated) is dropped when the log is loaded
+    with path.open("a") as f:
+        f.write('{"owner": "alice", "pus')
+    log = fork_analysis.ResultLog(path)
+    assert log.read("alice")["pushed_at"] == "4"
+    assert set(log.all()) == {"alice", "bob"}
+
+
+def test_cluster_commits():
+    def commit(sha, patch_id, date):
+        return {
+            "sha": sha,
+            "author": sha,
+            "email": f"{sha}@example.com",
+            "message": "Fix it",
+            "date": date,
+            "patch_id": patch_id,
+        }
+
+    results = {
+        # a fix cherry-picked by carol, and a fork of alice's fork
+        "alice": {"unique_commits": [commit("a1", "p1", "2023-02-01T00:00:00Z")]},
+        "carol": {
+            "unique_commits": [
+                commit("c1", "p1", "2023-03-01T00:00:00+01:00"),
+                commit("c2", "p2", "2023-01-01T00:00:00Z"),
+            ]
+        },
+        "dave": {"unique_commits": [commit("a1", "p1", "2023-02-01T00:00:00Z")]},
+        # merges have no patch ID, and are only grouped by SHA
+        "erin": {"unique_commits": [commit("m1", None, "2023-04-01T00:00:00Z")]},
+    }
+    report = fork_analysis.cluster_commits(results)
+
+    assert [c["patch_id"] for c in report] == ["p2", "p1", None]
+    assert report[1]["author"] == "a1"
+    assert report[1]["shas"] == ["a1", "c1"]
+    assert report[1]["forks"] == ["alice", "carol", "dave"]
+    assert report[2]["shas"] == ["m1"]
+
+
+def test_never_pushed():
+    assert fork_analysis.never_pushed(_fork("bob", "2023-01-01T00:00:00Z"))
+    assert not fork_analysis.never_pushed(_fork("bob", "2023-01-01T00:00:01Z"))
+    assert fork_analysis.never_pushed(_fork("bob", None))
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _commit_file(repo, name):
+    (repo / name).write_text(name)
+    _git(repo, "add", name)
+    _git(repo, "commit", "-q", "-m", f"Add {name}")
+
+
+def test_local_patch_ids_of_binary_patches(tmp_path, monkeypatch):
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{var}_NAME", "Alice")
+        monkeypatch.setenv(f"GIT_{var}_EMAIL", "alice@example.com")
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+    (tmp_path / "blob.bin").write_bytes(bytes(range(256)))
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "Add files")
+    sha = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=tmp_path, capture_output=True, text=True
+    ).stdout.strip()
+    patch_ids = fork_analysis.local_patch_ids(tmp_path / ".git", [sha])
+    assert list(patch_ids) == [sha]
+
+
+def test_local_fork_analysis(api_url, tmp_path, monkeypatch):
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{var}_NAME", "Alice")
+        monkeypatch.setenv(f"GIT_{var}_EMAIL", "alice@example.com")
+    upstream = tmp_path / "upstream"
+    upstream.mkdir()
+    _git(upstream, "init", "-q", "-b", "master")
+    _commit_file(upstream, "README")
+    fork = tmp_path / "alice"
+    _git(tmp_path, "clone", "-q", str(upstream), str(fork))
+    _commit_file(fork, "feature")
+    _git(fork, "checkout", "-q", "-b", "fix")
+    _commit_file(fork, "fix")
+    # upstream moves on, including a commit merged from the fork
+    _git(upstream, "pull", "-q", str(fork), "master")
+    _commit_file(upstream, "CHANGELOG")
+    # carol cherry-picks alice's fix on top of that
+    carol = tmp_path / "carol"
+    _git(tmp_path, "clone", "-q", str(upstream), str(carol))
+    _git(carol, "fetch", "-q", str(fork), "fix")
+    _git(carol, "cherry-pick", "FETCH_HEAD")
+
+    _StandIn.routes.update(
+        {
+            "/repos/ActivityWatch/activitywatch": [
+                {"default_branch": "master", "clone_url": upstream.as_uri()}
+            ],
+            "/repos/ActivityWatch/activitywatch/forks": [
+                [
+                    {
+                        **_fork("alice", "2023-05-01T00:00:00Z"),
+                        "clone_url": fork.as_uri(),
+                    },
+                    _fork("bob", "2022-12-01T00:00:00Z"),
+                    {
+                        **_fork("carol", "2023-05-01T00:00:00Z"),
+                        "clone_url": carol.as_uri(),
+                    },
+                ]
+            ],
+        }
+    )
+    local_repo = tmp_path / "forks.git"
+    output = tmp_path / "unique_commits.jsonl"
+    results = fork_analysis.main(
+        api_url=api_url, filename=output, local=True, local_repo=local_repo
+    )
+
+    assert [c["message"] for c in results["alice"]["unique_commits"]] == ["Add fix"]
+    assert results["alice"]["unique_commits"][0]["branches"] == ["fix"]
+    assert results["bob"]["unique_commits"] == []
+    # the cherry-pick is a different commit, but the same contribution
+    (carol_fix,) = results["carol"]["unique_commits"]
+    assert carol_fix["sha"] != results["alice"]["unique_commits"][0]["sha"]
+    (report,) = json.loads((tmp_path / "unique_patches.json").read_text())
+    assert report["patch_id"] == carol_fix["patch_id"]
+    assert report["forks"] == ["alice", "carol"]
+    assert len(report["shas"]) == 2
+    # only the listing went through the API
+    assert not any("branches" in p or "compare" in p for p in _StandIn.requests)
+
+    # later runs fetch incrementally into the same repo
+    _commit_file(fork, "more")
+    forks = _StandIn.routes["/repos/ActivityWatch/activitywatch/forks"]
+    forks[0][0]["pushed_at"] = "2023-06-01T00:00:00Z"
+    results = fork_analysis.main(
+        api_url=api_url, filename=output, local=True, local_repo=local_repo
+    )
+    messages = [c["message"] for c in results["alice"]["unique_commits"]]
+    assert messages == ["Add fix", "Add more"]
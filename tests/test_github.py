@@ -1,22 +1,30 @@
 from datetime import datetime
+from pathlib import Path
 from pprint import pprint
+from typing import Iterator
 
 import pytest
 from github import Github
 
+from contributor_stats.transport import replaying
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+
 
 @pytest.fixture
-def gh() -> Github:
+def gh(offline) -> Iterator[Github]:
     from contributor_stats.github_stats import _init_gh
 
-    return _init_gh()
+    # the fixture was recorded with an earlier `since`
+    with replaying(FIXTURE, ignore_params={"since"}):
+        yield _init_gh()
 
 
 def test_comments_by_user(gh: Github):
     from contributor_stats.github_stats import _comments_by_user
 
     since = datetime(2021, 3, 1)
-    repo = "activitywatch/aw-client"  # smaller repo for testing
+    repo = "ActivityWatch/aw-client"  # smaller repo for testing
     comments = _comments_by_user(gh, repo, since)
     pprint(comments)
     assert len(comments["count"]) > 0
@@ -26,7 +34,7 @@ def test_issues_by_user(gh: Github):
     from contributor_stats.github_stats import _issues_by_user
 
     since = datetime(2021, 3, 1)
-    repo = "activitywatch/aw-client"  # smaller repo for testing
+    repo = "ActivityWatch/aw-client"  # smaller repo for testing
     issues = _issues_by_user(gh, repo, since)
     print("issues_by_user")
     pprint(issues)
@@ -37,19 +45,18 @@ def test_pr_comments_by_user(gh: Github):
     from contributor_stats.github_stats import _pr_comments_by_user
 
     since = datetime(2021, 3, 1)
-    repo = "activitywatch/aw-client"  # smaller repo for testing
+    repo = "ActivityWatch/aw-client"  # smaller repo for testing
     pr_comments = _pr_comments_by_user(gh, repo, since)
     print("pr_comments")
     pprint(pr_comments)
     assert len(pr_comments["count"]) > 0
 
 
-
 def test_submitted_prs(gh: Github):
     from contributor_stats.github_stats import _submitted_prs
 
     since = datetime(2021, 3, 1)
-    repo = "activitywatch/aw-client"  # smaller repo for testing
+    repo = "ActivityWatch/aw-client"  # smaller repo for testing
     submitted_prs = _submitted_prs(gh, repo, since)
     print("submitted_prs")
     pprint(submitted_prs)
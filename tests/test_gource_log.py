@@ -0,0 +1,89 @@
+import subprocess
+from pathlib import Path
+
+from conftest import ROOT, load_script
+
+gource_log = load_script("video/gource-log.py", "gource_log")
+
+RULES = gource_log.Rules.load(ROOT / "video" / "gource-rules.json")
+
+# gource custom logs, by repo name
+LOGS = {
+    "aw-core": [
+        "1500000000|johan-bjareholt|A|/aw_core/models.py",
+        "1500000100|Erik Bjõreholt|A|/.github/workflows/build.yml",
+        "1500000200|ErikBjare|M|/aw_core/models.py",
+        "1600000000|dependabot[bot]|M|/poetry.lock",
+    ],
+    "activitywatch-old": [
+        "1400000000|Erik Bjäreholt|A|/README.md",
+        "1400000100|Erik Bjäreholt|A|/activitywatch/__init__.py",
+        "1400000200|Erik Bjäreholt|A|/notes",
+        "1400000300|Erik Bjäreholt|D|/notes",
+    ],
+}
+
+
+def _extract_log(repo, out):
+    _extracted.append(repo.name)
+    Path(out).write_text("".join(line + "\n" for line in LOGS[repo.name]))
+
+
+_extracted: list[str] = []
+
+
+def _commit(repo):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=a", "-c", "user.email=a@a"]
+        + ["commit", "-q", "--allow-empty", "-m", "commit"],
+        check=True,
+    )
+
+
+def test_rules():
+    apply = RULES.apply
+    assert (
+        apply("1", "2e3s", "A", "/x/main.rs") == "1|Denis Gavrilov|A|/x/main.rs|FFAA33"
+    )
+    assert apply("1", "a", "M", "/x/README.md") == "1|a|M|/x/README.md|FF5555"
+    assert apply("1", "a", "M", "/x/binary") == "1|a|M|/x/binary"
+    assert apply("1", "a", "M", "/x/.github/ci.yml") is None
+    assert apply("1", "ErikBjare", "M", "/x/y.py") is None
+
+
+def test_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(gource_log, "extract_log", _extract_log)
+    _extracted.clear()
+    for name in LOGS:
+        subprocess.run(["git", "init", "-q", str(tmp_path / name)], check=True)
+        _commit(tmp_path / name)
+    repos = [
+        gource_log.parse_repo(f"{tmp_path}/activitywatch-old=activitywatch-old"),
+        gource_log.parse_repo(f"{tmp_path}/aw-core=aw-core/"),
+        gource_log.parse_repo(f"{tmp_path}/missing=missing"),
+    ]
+    output = tmp_path / "combined.gource"
+    assert gource_log.build(repos, RULES, output, tmp_path / "tmp") == 8
+
+    assert output.read_text().splitlines() == [
+        "1400000000|Erik Bjäreholt|A|/README.md|FF5555",
+        "1400000100|Erik Bjäreholt|A|/activitywatch/__init__.py|4B8BBE",
+        "1400000200|Erik Bjäreholt|A|/notes",
+        "1400000300|Erik Bjäreholt|D|/notes",
+        # the old repo's remaining files are deleted when the rewrite began
+        "1461708000|Erik Bjäreholt|D|/README.md|FF5555",
+        "1461708000|Erik Bjäreholt|D|/activitywatch/__init__.py|4B8BBE",
+        "1500000000|Johan Bjäreholt|A|/aw-core/aw_core/models.py|4B8BBE",
+        "1600000000|dependabot|M|/aw-core/poetry.lock|444444",
+    ]
+
+    # unchanged repos (same HEAD, same rules) aren't extracted again
+    _extracted.clear()
+    assert gource_log.build(repos, RULES, output, tmp_path / "tmp") == 8
+    assert _extracted == []
+    _commit(tmp_path / "aw-core")
+    gource_log.build(repos, RULES, output, tmp_path / "tmp")
+    assert _extracted == ["aw-core"]
+    rules = gource_log.Rules({"exclude_authors": ["Erik"]})
+    assert gource_log.build(repos, rules, output, tmp_path / "tmp") == 2
+    assert sorted(_extracted) == ["activitywatch-old", "aw-core", "aw-core"]
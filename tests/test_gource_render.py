@@ -0,0 +1,115 @@
+import re
+import subprocess
+from pathlib import Path
+
+from conftest import ROOT, load_script
+
+gource_render = load_script("video/gource-render.py", "gource_render")
+
+DAY = 24 * 60 * 60
+LOG = [
+    f"{0 * DAY}|alice|A|/a.py|4B8BBE",
+    f"{1 * DAY}|alice|A|/b.md",
+    f"{2 * DAY}|bob|M|/a.py|4B8BBE",
+    f"{3 * DAY}|bob|D|/b.md",
+    f"{8 * DAY}|carol|A|/c.rs",
+    f"{10 * DAY}|carol|M|/c.rs",
+    f"{15 * DAY}|carol|M|/a.py|4B8BBE",
+    f"{19 * DAY}|dave|A|/d",
+]
+
+
+def _log(tmp_path):
+    log = tmp_path / "combined.gource"
+    log.write_text("".join(line + "\n" for line in LOG))
+    return log
+
+
+def test_boundaries(tmp_path):
+    assert gource_render.boundaries(_log(tmp_path), 2) == [
+        0,
+        19 * DAY // 2,
+        19 * DAY + 1,
+    ]
+
+
+def test_segment_log(tmp_path):
+    lines, warmup = gource_render.segment_log(
+        _log(tmp_path), 10 * DAY, 15 * DAY, warmup_days=4, auto_skip_days=10
+    )
+    # the tree as of 4 days before (b.md deleted, a.py added by its last
+    # author), then the events since, spread over the 4 days
+    assert lines == [
+        f"{6 * DAY}|bob|A|/a.py|4B8BBE",
+        f"{8 * DAY}|carol|A|/c.rs",
+        f"{10 * DAY}|carol|M|/c.rs",
+        f"{15 * DAY}|carol|M|/a.py|4B8BBE",  # runs the clock up to the stop
+    ]
+    assert warmup == 4 * DAY
+
+    # too few events to keep gource from skipping: a shorter warm-up
+    lines, warmup = gource_render.segment_log(
+        _log(tmp_path), 10 * DAY, 15 * DAY, warmup_days=4, auto_skip_days=1
+    )
+    assert warmup == 2 * 0.9 * DAY
+    assert lines[0].startswith(f"{int(10 * DAY - warmup)}|bob|A|/a.py")
+
+    # the first segment has nothing to warm up with
+    lines, warmup = gource_render.segment_log(_log(tmp_path), 0, 5 * DAY, 4, 1)
+    assert warmup == 0 and len(lines) == 5
+
+
+def test_render_resumes(tmp_path, monkeypatch):
+    rendered = []
+
+    def render_segment(name, log, options, trim, output):
+        rendered.append((name[:11], options[-2:], trim))
+        output.write_bytes(b"")
+
+    monkeypatch.setattr(gource_render, "render_segment", render_segment)
+    monkeypatch.setattr(gource_render, "concat_videos", lambda *args: None)
+    options = ["--seconds-per-day", "1"]
+    kwargs = {"warmup": 3, "workdir": tmp_path / "segments"}
+    gource_render.render(_log(tmp_path), tmp_path / "out.mp4", options, 2, **kwargs)
+    assert rendered == [
+        ("segment-000", ["--stop-date", "1970-01-10 12:00:00 +0000"], 0),
+        ("segment-001", options, 3),
+    ]
+
+    # already rendered segments are skipped; changed ones rendered again
+    rendered.clear()
+    gource_render.render(_log(tmp_path), tmp_path / "out.mp4", options, 2, **kwargs)
+    assert rendered == []
+    kwargs["warmup"] = 2
+    gource_render.render(_log(tmp_path), tmp_path / "out.mp4", options, 2, **kwargs)
+    assert [name for name, _, _ in rendered] == ["segment-001"]
+
+
+def test_parse_args_from_script():
+    # Have bash build the argv of the render call in gource-output.sh, from
+    # its own variables and gource_options array
+    script = (ROOT / "video" / "gource-output.sh").read_text()
+    lines = script.splitlines()
+    start = lines.index("gource_options=(")
+    end = lines.index(")", start)
+    call = next(line for line in lines if line.startswith("python3 gource-render.py"))
+    snippet = "\n".join(
+        [line for line in lines if re.match(r"(tmpdir|gourcelog|res_\w+)=", line)]
+        + lines[start : end + 1]
+        + [call.replace("python3 gource-render.py", "printf '%s\\0'")]
+    )
+    out = subprocess.run(
+        ["bash", "-c", snippet], check=True, capture_output=True, text=True
+    ).stdout
+    argv = out.split("\0")[:-1]
+
+    args = gource_render.parse_args(argv)
+    assert args.log == Path(".cache/gource/combined.gource")
+    assert args.output == Path("gource.mp4")
+    assert args.workdir == Path(".cache/gource/segments")
+    assert args.gource_options[:2] == [
+        "--title",
+        "ActivityWatch Development 2014-2025+ (https://activitywatch.net)",
+    ]
+    assert "%Y-%m-%d" in args.gource_options
+    assert args.gource_options[-1] == "-1920x1080"
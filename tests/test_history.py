@@ -0,0 +1,174 @@
+import subprocess
+
+import pytest
+
+from contributor_stats import history, main
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _commit(repo, author, files, date="2023-01-01T12:00:00"):
+    for name, text in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        _git(repo, "add", name)
+    email = f"{author.split()[0].lower()}@example.com"
+    _git(
+        repo,
+        "-c", f"user.name={author}", "-c", f"user.email={email}",
+        "commit", "-q", "-m", "Change", "--date", date,
+    )  # fmt: skip
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2023-01-01T12:00:00")
+    repo = tmp_path / "aw-server-rust"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    _commit(repo, "Alice", {"README.md": "a\nb\n", "aw-datastore/src/lib.rs": "1\n2\n3\n"})
+    _commit(repo, "Bob", {"aw-datastore/src/lib.rs": "1\n2\nthree\n4\n"}, "2023-01-02T12:00:00")
+    _commit(repo, "Bob", {"aw-server/main.rs": "x\n"}, "2023-01-02T13:00:00")
+    _commit(repo, "johan-bjareholt", {"aw-server/main.rs": "x\ny\n"}, "2023-01-03T12:00:00")
+    return repo
+
+
+def test_history(repo):
+    tree = history.DirTree(depth=2)
+    authors = history.read_history(repo, tree, main.canonical_author)
+    assert authors["Alice"] == {
+        "commits": 1,
+        "active_days": {"2023-01-01"},
+        "lines_added": 5,
+        "lines_removed": 0,
+    }
+    assert authors["Bob"]["commits"] == 2
+    assert authors["Bob"]["active_days"] == {"2023-01-02"}
+    assert (authors["Bob"]["lines_added"], authors["Bob"]["lines_removed"]) == (3, 1)
+    # aliases are merged
+    assert authors["Johan Bjäreholt"]["commits"] == 1
+
+    blame = history.read_blame(repo, tree, main.canonical_author)
+    assert blame == {"Alice": 4, "Bob": 3, "Johan Bjäreholt": 1}
+
+    tables = tree.tables()
+    assert list(tables) == [
+        "aw-datastore",
+        "aw-datastore/src",
+        "aw-server",
+    ]
+    datastore = tables["aw-datastore"]
+    assert datastore["Alice"]["commits"] == 1
+    assert datastore["Alice"]["blame"] == 2
+    assert datastore["Bob"]["lines_added"] == 2
+    assert datastore["Bob"]["blame_percent"] == pytest.approx(50)
+    # each commit is counted once per directory, by its canonical author
+    assert tables["aw-server"]["Bob"]["commits"] == 1
+    assert tables["aw-server"]["Johan Bjäreholt"]["blame"] == 1
+
+
+def test_generate_from_repo(repo):
+    tree = history.DirTree(depth=1)
+    name, rows = main.generate_from_repo(repo, tree)
+    assert name == "aw-server-rust"
+    assert rows["Alice"]["blame_percent"] == pytest.approx(50)
+    assert len(rows["Bob"]["active_days"]) == 1
+    # only the top level
+    assert list(tree.tables()) == ["aw-datastore", "aw-server"]
+
+
+def test_dir_tree_pruning():
+    tree = history.DirTree(depth=3, max_nodes=10)
+    tree.add_commit("Alice", [("big/src/main.py", 1000, 0)])
+    for i in range(20):
+        tree.add_commit("Bob", [(f"small/{i}/file.py", 1, 0)])
+    assert tree.nodes <= 10
+    paths = list(tree.tables())
+    assert "big/src" in paths
+    # the parent keeps the counts of its pruned subdirectories
+    assert "small" in paths
+    assert tree.tables()["small"]["Bob"]["lines_added"] == 20
+
+
+def test_shared_history(repo, tmp_path):
+    fork = tmp_path / "awatcher"
+    _git(tmp_path, "clone", "-q", str(repo), str(fork))
+    _commit(fork, "Carol", {"src/main.rs": "fn main() {}\n"}, "2023-02-01T12:00:00")
+
+    index = history.CommitIndex()
+    tables = {}
+    for path in (repo, fork):
+        name, rows = main.generate_from_repo(path, index=index)
+        tables[name] = rows
+    # the fork's table only has what isn't in aw-server-rust
+    assert {name: row["commits"] for name, row in tables["awatcher"].items()} == {
+        "Carol": 1
+    }
+    assert index.overlap == {"aw-server-rust": {}, "awatcher": {"aw-server-rust": 4}}
+    assert main.overlap_rows(index) == {"awatcher / aw-server-rust": {"commits": 4}}
+
+    total = main.merge_tables(tables)
+    assert total["Bob"]["commits"] == 2
+    assert total["Bob"]["lines_added"] == 3
+
+
+def test_blame_snapshots(tmp_path, monkeypatch):
+    repo = tmp_path / "aw-core"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    for author, files, date in [
+        ("Alice", {"a.py": "1\n2\n", "b.py": "1\n"}, "2021-06-01T12:00:00"),
+        ("Bob", {"a.py": "1\ntwo\n3\n"}, "2022-06-01T12:00:00"),
+        ("Bob", {"c.py": "1\n"}, "2023-06-01T12:00:00"),
+    ]:
+        monkeypatch.setenv("GIT_COMMITTER_DATE", date)
+        _commit(repo, author, files, date)
+    _git(repo, "tag", "v0.1", "HEAD~2")
+    _git(repo, "tag", "v0.1-alias", "HEAD~2")  # (same commit)
+    _git(repo, "-c", "user.name=Alice", "-c", "user.email=alice@example.com",
+         "tag", "-a", "-m", "Release", "v0.2", "HEAD~1")  # fmt: skip
+
+    revisions = history.snapshot_revisions(repo, "yearly")
+    assert [(label, day) for label, day, _ in revisions] == [
+        ("2022-01-01", "2022-01-01"),
+        ("2023-01-01", "2023-01-01"),
+        ("HEAD", "2023-06-01"),
+    ]
+    tags = history.snapshot_revisions(repo, "tags")
+    assert [(label, day) for label, day, _ in tags] == [
+        ("v0.1", "2021-06-01"),
+        ("v0.1-alias", "2021-06-01"),
+        ("v0.2", "2022-06-01"),
+        ("HEAD", "2023-06-01"),
+    ]
+
+    blamed = []
+    blame_file = history.blame_file
+
+    def counting(path, name, rev="HEAD"):
+        blamed.append(name)
+        return blame_file(path, name, rev)
+
+    monkeypatch.setattr(history, "blame_file", counting)
+    series = history.blame_snapshots(repo, revisions)
+    assert [entry["blame"] for entry in series] == [
+        {"Alice": 3},
+        {"Alice": 2, "Bob": 2},
+        {"Alice": 2, "Bob": 3},
+    ]
+    # only changed (or new) files were blamed again
+    assert sorted(blamed) == ["a.py", "a.py", "b.py", "c.py"]
+
+    other = [{"revision": "HEAD", "date": "2022-12-31", "blame": {"Carol": 4}}]
+    total = history.with_percent(history.total_series({"a": series, "b": other}))
+    assert [entry["date"] for entry in total] == [
+        "2022-01-01",
+        "2022-12-31",
+        "2023-01-01",
+        "2023-06-01",
+    ]
+    assert total[-1]["blame"] == {"Alice": 2, "Bob": 3, "Carol": 4}
+    assert total[0]["blame_percent"] == {"Alice": 100}
@@ -0,0 +1,169 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+import pytest
+from conftest import load_script
+
+export = load_script("video/issue-history-export.py", "issue_history_export")
+
+ISSUES = "/repos/ActivityWatch/aw-core/issues"
+
+
+def _issue(number, created_at, closed_at=None, pr=False):
+    issue = {
+        "url": f"https://api.github.invalid{ISSUES}/{number}",
+        "number": number,
+        "title": f"Issue {number}",
+        "state": "closed" if closed_at else "open",
+        "created_at": created_at,
+        "closed_at": closed_at,
+        "updated_at": closed_at or created_at,
+        "user": {"login": "alice"},
+        "comments": 1,
+    }
+    if pr:
+        issue["pull_request"] = {}
+    return issue
+
+
+def _comment(number, created_at, user="bob"):
+    return {
+        "issue_url": f"https://api.github.invalid{ISSUES}/{number}",
+        "created_at": created_at,
+        "updated_at": created_at,
+        "user": {"login": user},
+    }
+
+
+# path (without the query) -> pages of response bodies
+ROUTES = {
+    ISSUES: [
+        [
+            _issue(1, "2023-01-01T00:00:00Z", "2023-01-03T00:00:00Z"),
+            _issue(2, "2023-01-02T00:00:00Z", pr=True),
+        ],
+        [_issue(3, "2023-01-04T00:00:00Z")],
+    ],
+    "/repos/ActivityWatch/aw-core/issues/comments": [
+        [_comment(1, "2023-01-02T00:00:00Z"), _comment(2, "2023-01-02T01:00:00Z")],
+        [_comment(3, "2023-01-05T00:00:00Z", user="carol")],
+    ],
+}
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    routes = ROUTES
+    requests: list[str] = []
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        self.requests.append(self.path)
+        pages = self.routes.get(path, [[]])
+        params = parse_qs(query)
+        page = int(params.get("page", ["1"])[0])
+        since = params.get("since", [""])[0]
+        items = [item for item in pages[page - 1] if item["updated_at"] >= since]
+        body = json.dumps(items).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if page < len(pages):
+            base = f"http://127.0.0.1:{self.server.server_port}{path}"
+            query = urlencode({**params, "page": [page + 1]}, doseq=True)
+            self.send_header("Link", f'<{base}?{query}>; rel="next"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url(monkeypatch):
+    monkeypatch.setattr(_StandIn, "routes", {k: list(v) for k, v in ROUTES.items()})
+    _StandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def _run(api_url, cache_dir, output, repos, format="csv"):
+    session = export.make_session()
+    export.update_segments(session, repos, cache_dir, True, api_url)
+    events = export.merge_segments(export.segment_path(cache_dir, r) for r in repos)
+    return export.write_output(events, format, output)
+
+
+def test_export(api_url, tmp_path):
+    repos = ["ActivityWatch/aw-core", "ActivityWatch/aw-qt"]
+    output = tmp_path / "issues.gource"
+    assert _run(api_url, tmp_path / "cache", output, repos, "gource") == 5
+
+    # joined to their issues by URL; the PR's comment is left out
+    assert output.read_text().splitlines() == [
+        "1672531200|alice|A|aw-core/issues/1",
+        "1672617600|bob|M|aw-core/issues/1",
+        "1672704000|alice|D|aw-core/issues/1",
+        "1672790400|alice|A|aw-core/issues/3",
+        "1672876800|carol|M|aw-core/issues/3",
+    ]
+    # one request per page of issues and of comments, not per issue
+    assert len(_StandIn.requests) == 2 + 2 + 2
+    assert not any("since" in path for path in _StandIn.requests)
+
+
+def test_incremental_export(api_url, tmp_path):
+    repos = ["ActivityWatch/aw-core", "ActivityWatch/aw-qt"]
+    cache_dir = tmp_path / "cache"
+    output = tmp_path / "issues.csv"
+    _run(api_url, cache_dir, output, repos)
+    segment = export.segment_path(cache_dir, repos[0])
+    size = segment.stat().st_size
+
+    # a comment on an old issue, and one timestamped after this run started
+    # (so it's refetched by the next run, instead of duplicated)
+    _StandIn.routes["/repos/ActivityWatch/aw-qt/issues"] = [
+        [{**_issue(7, "2023-01-01T00:00:00Z"), "updated_at": "2099-01-01T00:00:00Z"}]
+    ]
+    _StandIn.routes["/repos/ActivityWatch/aw-qt/issues/comments"] = [
+        [{**_comment(7, "2099-01-01T00:00:00Z", user="dave")}]
+    ]
+    _StandIn.requests.clear()
+    for _ in range(2):
+        assert _run(api_url, cache_dir, output, repos) == 6
+    # only what's new was fetched, and the old segment is untouched
+    assert all("since=" in path for path in _StandIn.requests)
+    assert segment.stat().st_size == size
+    rows = [line.split(",") for line in output.read_text().splitlines()[1:]]
+    assert [(row[2], row[4], row[5]) for row in rows][-1] == (
+        "aw-qt",
+        "comment",
+        "dave",
+    )
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+
+    # the 500-issue cap is gone
+    _StandIn.routes[ISSUES] = [
+        [_issue(n, "2024-01-01T00:00:00Z") for n in range(100 * p, 100 * (p + 1))]
+        for p in range(6)
+    ]
+    _StandIn.routes[ISSUES + "/comments"] = [[]]
+    assert _run(api_url, tmp_path / "fresh", output, repos) == 600 + 2
+
+
+def test_export_formats():
+    events = [
+        {"timestamp": 2, "repo": "aw-core", "issue_number": 1, "type": "closed",
+         "author": "alice", "title": "Crash, on start"},
+        {"timestamp": 1, "repo": "aw-core", "issue_number": 1, "type": "created",
+         "author": "alice", "title": "Crash, on start"},
+    ]  # fmt: skip
+    events.sort(key=lambda e: e["timestamp"])
+    assert list(export.gource_lines(events)) == [
+        "1|alice|A|aw-core/issues/1",
+        "2|alice|D|aw-core/issues/1",
+    ]
+    csv = list(export.csv_lines(events))
+    assert csv[1].startswith("1,") and csv[1].endswith(",created,alice,Crash  on start")
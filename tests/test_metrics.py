@@ -0,0 +1,78 @@
+import urllib.request
+from pathlib import Path
+
+from contributor_stats import github_stats
+from contributor_stats.metrics import Registry
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+ISSUES_URL = (
+    "/repos/ActivityWatch/aw-client/issues"
+    "?state=all&since=1999-01-01T00%3A00%3A00Z&per_page=100"
+)
+REPO = "ActivityWatch/aw-client"
+
+
+def test_sync_metrics(offline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics = tmp_path / "metrics.prom"
+    github_stats.main(replay=FIXTURE, metrics=metrics)
+
+    requests = github_stats.REQUESTS
+    assert requests.get(repo=REPO, stat="comments", status=200) == 2
+    assert github_stats.PAGES.get(repo=REPO, stat="comments") == 2
+    assert requests.get(repo="", stat="repos", status=200) == 2
+    assert github_stats.REPOS.get(result="synced") == 1
+    assert github_stats.FETCH_SECONDS.count(repo=REPO, stat="issues") == 1
+    assert github_stats.SAVE_STATE_SECONDS.count() >= 1
+
+    text = metrics.read_text()
+    assert (
+        'github_stats_requests_total{repo="ActivityWatch/aw-client",'
+        'stat="comments",status="200"} 2\n'
+    ) in text
+    assert "# TYPE github_stats_save_state_seconds histogram\n" in text
+
+
+def test_rate_limit_sleep_metrics(offline):
+    from contributor_stats.transport import observing, replaying
+
+    with replaying(FIXTURE) as cassette, observing(github_stats._count_request):
+        cassette.rate_limit("GET", ISSUES_URL, reset=1)
+        github_stats._sync(github_stats._init_gh(), github_stats._load_state())
+
+    assert github_stats.RATE_LIMIT_SLEEPS.count() == 1
+    assert github_stats.REQUESTS.get(repo=REPO, stat="issues", status=403) == 1
+    assert github_stats.REQUESTS.get(repo=REPO, stat="issues", status=200) == 1
+    assert github_stats.PAGES.get(repo=REPO, stat="issues") == 1
+
+
+def test_registry_format():
+    registry = Registry()
+    counter = registry.counter("jobs_total", "Jobs run", ("kind",))
+    histogram = registry.histogram("job_seconds", "Job time", buckets=(1, 10))
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    histogram.observe(0.5)
+    histogram.observe(5)
+    histogram.observe(50)
+
+    assert registry.render() == (
+        "# HELP jobs_total Jobs run\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{kind="a"} 3\n'
+        "# HELP job_seconds Job time\n"
+        "# TYPE job_seconds histogram\n"
+        'job_seconds_bucket{le="1"} 1\n'
+        'job_seconds_bucket{le="10"} 2\n'
+        'job_seconds_bucket{le="+Inf"} 3\n'
+        "job_seconds_sum 55.5\n"
+        "job_seconds_count 3\n"
+    )
+
+    server = registry.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == registry.render()
+    finally:
+        server.shutdown()
@@ -0,0 +1,86 @@
+import json
+from pathlib import Path
+
+from contributor_stats import github_stats
+from contributor_stats.transport import replaying
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+REPO = "ActivityWatch/aw-client"
+
+
+def test_assign_shards():
+    repos = ["a", "b", "c", "d", "e"]
+    costs = {"a": 100, "b": 60, "c": 50, "d": 10}
+    shards = github_stats._assign_shards(repos, costs, 2)
+    # e has no known cost, so it weighs the average (55)
+    assert shards == [["a", "c"], ["b", "e", "d"]]
+    # same inputs, same split, regardless of order
+    assert github_stats._assign_shards(repos[::-1], costs, 2) == shards
+    assert sorted(sum(github_stats._assign_shards(repos, {}, 3), [])) == repos
+
+
+def test_sharded_sync_matches_unsharded(offline, tmp_path):
+    github_stats._run_sync(github_stats._load_state(), replaying(FIXTURE))
+    unsharded = github_stats._load_state()
+
+    github_stats.STATE_PATH.unlink()
+    for index in (1, 2):
+        state = github_stats._load_shard_state(index, 2)
+        github_stats._run_sync(state, replaying(FIXTURE))
+    shard_files = sorted(tmp_path.glob("state.shard-*-of-2.json"))
+    assert len(shard_files) == 2
+    assert not github_stats.STATE_PATH.exists()
+    merged = github_stats.merge_shards(shard_files)
+
+    assert merged["repos"][REPO]["users"] == unsharded["repos"][REPO]["users"]
+    assert merged["repos"][REPO]["seen"] == unsharded["repos"][REPO]["seen"]
+    assert merged["totals"] == unsharded["totals"]
+    assert github_stats._load_state()["totals"] == merged["totals"]
+    # the whole sync of aw-client was counted, to balance the next split by
+    assert merged["repos"][REPO]["cost"] == unsharded["repos"][REPO]["cost"] > 0
+
+
+def test_merge_is_commutative(offline):
+    old = github_stats._empty_state()
+    old["repos"][REPO] = {
+        "last_synced": {"issues": "2024-01-01T00:00:00"},
+        "seen": {"issues": [1]},
+        "users": {"1": {**github_stats._empty_user_stats(), "issues": 1}},
+    }
+    old["accounts"]["1"] = {"login": "alice", "updated": "2024-01-01T00:00:00"}
+    new = github_stats._empty_state()
+    new["repos"][REPO] = {
+        "last_synced": {"issues": "2024-02-01T00:00:00"},
+        "seen": {"issues": [1, 2]},
+        "users": {"1": {**github_stats._empty_user_stats(), "issues": 2}},
+    }
+    new["accounts"]["1"] = {"login": "alice2", "updated": "2024-02-01T00:00:00"}
+
+    merged = github_stats._merge_states([old, new])
+    assert merged == github_stats._merge_states([new, old])
+    assert merged == github_stats._merge_states([new, old, new])
+    assert merged["repos"][REPO]["users"]["1"]["issues"] == 2
+    assert merged["repos"][REPO]["seen"]["issues"] == [1, 2]
+    assert merged["accounts"]["1"]["login"] == "alice2"
+
+
+def test_merge_prefers_rekeyed_rows(offline):
+    synced = {stat: "2024-01-01T00:00:00" for stat in github_stats.STAT_FETCHERS}
+    row = {"issues": 0, "comments": 5, "comment_words": 50, "prs": 0}
+    row = {**row, "prs_merged": 0, "pr_comments": 0, "active_days": ["2023-05-01"]}
+    v1 = {"repos": {REPO: {"last_synced": synced, "users": {"alice": row}}}}
+    github_stats.STATE_PATH.write_text(json.dumps(v1))
+    main = github_stats._load_state()
+    assert main["repos"][REPO]["logins"]
+
+    # a shard re-keyed the rows, then stopped before syncing anything
+    shard = github_stats._load_state()
+    repo_state = shard["repos"][REPO]
+    repo_state["users"] = {"42": repo_state.pop("logins")["alice"]}
+    shard["accounts"]["42"] = {"login": "alice", "updated": "2024-01-02T00:00:00"}
+
+    merged = github_stats._merge_states([main, shard])
+    assert merged == github_stats._merge_states([shard, main])
+    assert "logins" not in merged["repos"][REPO]
+    assert merged["repos"][REPO]["users"]["42"]["comments"] == 5
+    assert merged["repos"][REPO]["last_synced"] == synced
@@ -0,0 +1,68 @@
+from datetime import date
+
+from contributor_stats.github_stats import (
+    _aggregate_stats,
+    _build_totals,
+    _merge_stat,
+    _snapshot_rows,
+)
+from contributor_stats.render import _render_contributors, _render_table
+
+
+def _deltas():
+    yield "aw-core", "issues", {
+        "count": {"alice": 3, "bob": 1, "renovate[bot]": 5},
+        "days": {"alice": {date(2024, 1, 1)}, "bob": {date(2024, 1, 2)}},
+    }
+    yield "aw-core", "prs", {
+        "count": {"alice": 2},
+        "days": {"alice": {date(2024, 1, 1), date(2024, 1, 3)}},
+    }
+    yield "aw-core", "comments", {
+        "count": {"bob": 12},
+        "words": {"bob": 200},
+        "days": {"bob": {date(2024, 1, 2)}},
+    }
+    # a PR counted before the issue it also is (see _repo_row)
+    yield "aw-qt", "prs", {"count": {"alice": 1}, "days": {"alice": {date(2024, 2, 1)}}}
+    yield "aw-qt", "pr_comments", {
+        "count": {"alice": 9, "bob": 1},
+        "days": {"alice": {date(2024, 2, 1)}, "bob": {date(2024, 2, 2)}},
+    }
+    yield "aw-qt", "issues", {"count": {"alice": 1}, "days": {}}
+
+
+def test_incremental_totals_match_full_aggregation():
+    state: dict = {"repos": {}, "accounts": {}, "totals": {}}
+    for repo, stat, data in _deltas():
+        repo_state = state["repos"].setdefault(repo, {"last_synced": {}, "users": {}})
+        _merge_stat(repo_state, stat, data, state["totals"])
+
+    assert state["totals"] == _build_totals(state)
+    # legacy-style deltas are keyed by login already; no account to join
+    rows = _snapshot_rows(state["totals"], {})
+    assert rows == _aggregate_stats(state)
+    assert [row["user"] for row in rows] == ["bob", "alice"]
+    alice = rows[1]
+    assert alice["issues"] == 1
+    assert alice["prs"] == 3
+    assert alice["active_days"] == 3
+    assert alice["total"] == 1 + 3 + 9
+
+
+def test_render_from_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = [
+        {"user": "alice", "issues": 5, "comments": 20, "prs": 3, "prs_merged": 2,
+         "pr_comments": 1, "active_days": 12, "total": 31},
+        {"user": "bob", "issues": 1, "comments": 2, "prs": 0, "prs_merged": 0,
+         "pr_comments": 0, "active_days": 2, "total": 3},
+    ]  # fmt: skip
+    _render_table(rows)
+    _render_contributors(rows)
+
+    html = (tmp_path / "github-activity-table.html").read_text()
+    assert "<th>PRs Merged</th>" in html
+    assert '<a href="https://github.com/alice">alice</a>' in html
+    assert "bob" not in html  # below MIN_ACTIVITY_TOTAL
+    assert (tmp_path / "contributors.yml").read_text() == "- alice\n"
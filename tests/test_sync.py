@@ -0,0 +1,214 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from contributor_stats import github_stats
+from contributor_stats.transport import observing, replaying
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+REPO = "ActivityWatch/aw-client"
+
+
+def _sync(**replay_kwargs) -> dict:
+    with replaying(FIXTURE, **replay_kwargs):
+        state = github_stats._load_state()
+        github_stats._sync(github_stats._init_gh(), state)
+    return state
+
+
+def test_unchanged_repo_is_skipped(offline):
+    first = _sync()
+    assert first["repos"][REPO]["meta"]["open_issues_count"] == 2
+
+    # nothing changed in the listing, so no stats are re-fetched (a fetch
+    # would move last_synced)
+    second = _sync()
+    assert second["repos"][REPO]["last_synced"] == first["repos"][REPO]["last_synced"]
+    assert second["repos"][REPO]["users"] == first["repos"][REPO]["users"]
+
+
+def test_unchanged_repo_is_forced_after_interval(offline):
+    state = _sync()
+    stale = datetime.now() - github_stats.FORCE_SYNC_INTERVAL - timedelta(hours=1)
+    state["repos"][REPO]["last_synced"]["issues"] = stale.isoformat()
+    github_stats._save_state(state)
+
+    # the refetch asks for a `since` that isn't in the fixture
+    state = _sync(ignore_params={"since"})
+    last_synced = datetime.fromisoformat(state["repos"][REPO]["last_synced"]["issues"])
+    assert last_synced > stale + timedelta(hours=1)
+
+
+def test_is_unchanged():
+    meta = {
+        "pushed_at": "2023-06-02T12:00:00",
+        "updated_at": "2023-06-02T12:00:00",
+        "open_issues_count": 2,
+    }
+    synced = {stat: "2023-06-03T00:00:00" for stat in github_stats.STAT_FETCHERS}
+    repo_state = {"last_synced": synced, "meta": meta}
+    now = datetime(2023, 6, 4)
+
+    assert github_stats._is_unchanged(repo_state, meta, now)
+    assert not github_stats._is_unchanged(None, meta, now)
+    assert not github_stats._is_unchanged(
+        repo_state, {**meta, "open_issues_count": 3}, now
+    )
+    assert not github_stats._is_unchanged(
+        repo_state, {**meta, "pushed_at": "2023-06-03T12:00:00"}, now
+    )
+    assert not github_stats._is_unchanged(repo_state, meta, datetime(2023, 7, 1))
+
+
+def test_refetched_objects_are_counted_once(offline):
+    first = _sync()
+    users = {user: dict(stats) for user, stats in first["repos"][REPO]["users"].items()}
+
+    # force a full refetch of everything: the fixture returns the very same
+    # comments, issues and PRs again
+    for stat in github_stats.STAT_FETCHERS:
+        first["repos"][REPO]["last_synced"][stat] = "2000-01-01T00:00:00"
+    github_stats._save_state(first)
+    second = _sync(ignore_params={"since"})
+
+    assert second["repos"][REPO]["users"] == users
+    assert second["repos"][REPO]["seen"]["comments"] == [7001, 7002, 7004]
+    assert second["totals"] == github_stats._build_totals(second)
+
+
+def test_seen_ids_roundtrip():
+    ids = [0, 1, 127, 128, 16384, 1_234_567_890, 2_345_678_901]
+    assert github_stats._decode_ids(github_stats._encode_ids(ids)) == ids
+    assert github_stats._decode_ids(github_stats._encode_ids([])) == []
+
+
+def test_unseen_merges_ids():
+    alice = github_stats.Account(1, "alice", "U_1")
+    day = datetime(2023, 5, 1).date()
+    repo_state = {"seen": {"comments": [10, 20, 30]}}
+    items = [github_stats.Item(id_, alice, day) for id_ in (25, 5, 20, 35, 25)]
+    stats = github_stats._unseen(repo_state, "comments", items)
+    assert stats["count"] == {"1": 3}
+    assert repo_state["seen"]["comments"] == [5, 10, 20, 25, 30, 35]
+
+
+def test_renamed_user_keeps_history(offline, tmp_path):
+    state = _sync()
+    # alice renames to alice2 between runs: the login lookup says so, and her
+    # old rows (keyed by ID) are rendered under the new name
+    fixture = tmp_path / "rename.json"
+    fixture.write_text(
+        json.dumps(
+            {
+                "interactions": [
+                    {
+                        "method": "POST",
+                        "url": "/graphql",
+                        "status": 200,
+                        "headers": {},
+                        "body": {
+                            "data": {
+                                "nodes": [{"login": "alice2"}, {"login": "bob"}, None]
+                            }
+                        },
+                    }
+                ]
+            }
+        )
+    )
+    state["accounts_refreshed"] = "2000-01-01T00:00:00"
+    with replaying(fixture):
+        now = datetime.now()
+        github_stats._refresh_accounts(github_stats._init_gh(), state, now)
+
+    assert state["accounts"]["1001"]["login"] == "alice2"
+    assert state["accounts"]["1003"]["login"] == "carol"  # deleted: keeps login
+    assert state["accounts_refreshed"] == now.isoformat()
+    rows = github_stats._snapshot_rows(state["totals"], state["accounts"])
+    assert {row["user"] for row in rows} == {"alice2", "bob", "carol"}
+
+
+def test_v1_state_is_rekeyed(offline, tmp_path):
+    synced = {stat: "2024-01-01T00:00:00" for stat in github_stats.STAT_FETCHERS}
+    row = {"issues": 2, "comments": 3, "comment_words": 30, "prs": 1}
+    row = {**row, "prs_merged": 1, "pr_comments": 0, "active_days": ["2023-05-01"]}
+    v1 = {
+        "repos": {
+            REPO: {
+                "last_synced": synced,
+                "users": {"alice": row, "gone": row, "dependabot[bot]": row},
+            },
+            "ActivityWatch/aw-core": {"last_synced": synced, "users": {"alice": row}},
+        }
+    }
+    github_stats.STATE_PATH.write_text(json.dumps(v1))
+
+    state = github_stats._load_state()
+    assert state["version"] == github_stats.STATE_VERSION
+    assert set(state["repos"][REPO]["logins"]) == {"alice", "gone"}
+    # kept as they are until a sync can look the logins up
+    github_stats._save_state(state)
+    state = github_stats._load_state()
+    assert set(state["repos"][REPO]["logins"]) == {"alice", "gone"}
+
+    fixture = tmp_path / "logins.json"
+    alice = {"databaseId": 1001, "id": "U_1001", "login": "alice"}
+    response = {"data": {"u0": alice, "u1": None}}
+    interaction = {"method": "POST", "url": "/graphql", "status": 200}
+    interaction = {**interaction, "headers": {}, "body": response}
+    fixture.write_text(json.dumps({"interactions": [interaction]}))
+    with replaying(fixture):
+        now = datetime.now()
+        github_stats._rekey_logins(github_stats._init_gh(), state, now)
+
+    # alice keeps her history, the login that no longer resolves is dropped
+    for repo_state in state["repos"].values():
+        assert "logins" not in repo_state
+        assert list(repo_state["users"]) == ["1001"]
+    assert state["repos"][REPO]["users"]["1001"]["comments"] == 3
+    assert state["repos"][REPO]["last_synced"] == synced
+    assert state["accounts"]["1001"]["login"] == "alice"
+    assert state["totals"]["1001"]["comments"] == 6
+    assert state["totals"] == github_stats._build_totals(state)
+
+
+COMMENTS_URL = (
+    "/repos/ActivityWatch/aw-client/issues/comments"
+    "?since=1999-01-01T00%3A00%3A00Z&per_page=100"
+)
+
+
+def test_interrupted_fetch_resumes_from_page(offline, monkeypatch):
+    def killed(gh, state):
+        raise KeyboardInterrupt  # e.g. the job is cancelled while sleeping
+
+    monkeypatch.setattr(github_stats, "_sleep_until_rate_limit_reset", killed)
+    with replaying(FIXTURE) as cassette:
+        cassette.rate_limit("GET", f"{COMMENTS_URL}&page=2", reset=1)
+        state = github_stats._load_state()
+        with pytest.raises(KeyboardInterrupt):
+            github_stats._sync(github_stats._init_gh(), state)
+
+    # the first page was merged and saved, along with where to continue
+    state = github_stats._load_state()
+    cursor = state["repos"][REPO]["cursor"]
+    assert cursor["stat"] == "comments"
+    assert cursor["page"].endswith(f"{COMMENTS_URL}&page=2")
+    assert state["repos"][REPO]["users"]["1001"]["comments"] == 1
+    assert "comments" not in state["repos"][REPO]["last_synced"]
+
+    urls: list[str] = []
+    with replaying(FIXTURE, ignore_params={"since"}), observing(
+        lambda method, url, *_: urls.append(url)
+    ):
+        github_stats._sync(github_stats._init_gh(), state)
+
+    assert COMMENTS_URL not in urls
+    assert f"{COMMENTS_URL}&page=2" in urls
+    repo_state = state["repos"][REPO]
+    assert "cursor" not in repo_state
+    assert repo_state["last_synced"]["comments"] == cursor["started"]
+    assert repo_state["users"]["1001"]["comments"] == 2
+    assert repo_state["seen"]["comments"] == [7001, 7002, 7004]
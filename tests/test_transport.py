@@ -0,0 +1,191 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+from github import Github, RateLimitExceededException
+
+from contributor_stats import github_stats, transport
+from contributor_stats.transport import recording, replaying
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+ISSUES_URL = (
+    "/repos/ActivityWatch/aw-client/issues"
+    "?state=all&since=1999-01-01T00%3A00%3A00Z&per_page=100"
+)
+
+
+def test_replay_sync(offline):
+    with replaying(FIXTURE):
+        gh = github_stats._init_gh()
+        state = github_stats._load_state()
+        github_stats._sync(gh, state)
+
+    assert list(state["repos"]) == ["ActivityWatch/aw-client"]
+    users = state["repos"]["ActivityWatch/aw-client"]["users"]
+    assert "49699333" not in users  # dependabot[bot]
+    assert users["1001"]["comments"] == 2  # across both pages
+    assert users["1001"]["prs_merged"] == 1
+    assert users["1003"]["issues"] == 2
+    assert users["1002"]["pr_comments"] == 1
+    assert state["accounts"]["1001"]["login"] == "alice"
+    assert state["accounts"]["1001"]["node_id"] == "U_1001"
+    assert offline == []
+    assert state["totals"] == github_stats._build_totals(state)
+    assert github_stats.STATE_PATH.exists()
+
+
+def test_replay_run(offline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state_path = tmp_path / "replayed.json"
+    for _ in range(2):
+        github_stats.main(replay=FIXTURE, state_path=state_path)
+        state = github_stats._load_state(state_path)
+        assert (
+            state["repos"]["ActivityWatch/aw-client"]["users"]["1001"]["comments"] == 2
+        )
+    # both runs started from scratch, so neither skipped the repo
+    assert github_stats.REPOS.values == {("synced",): 2}
+    # the published state, snapshot and renders were left alone
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "replayed.json",
+        "replayed.json.lock",
+        "replayed.snapshot.json",
+    ]
+
+
+def test_replay_rate_limit(offline):
+    with replaying(FIXTURE) as cassette:
+        cassette.rate_limit("GET", ISSUES_URL, reset=1)
+        gh = github_stats._init_gh()
+        state = github_stats._load_state()
+        github_stats._sync(gh, state)
+
+    # slept once (the reset is already past, so just the safety margin)...
+    assert offline == [10]
+    # ...and then retried from the same point without losing anything
+    users = state["repos"]["ActivityWatch/aw-client"]["users"]
+    assert users["1003"]["issues"] == 2
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"login": "ActivityWatch", "id": 5810298}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-RateLimit-Remaining", "999")
+        self.send_header("X-RateLimit-Limit", "1000")
+        self.send_header("X-RateLimit-Reset", "1700003600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_record_then_replay(tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    fixture = tmp_path / "recorded.json"
+    try:
+        with recording(fixture):
+            assert Github(base_url=base_url).get_user("ActivityWatch").id == 5810298
+    finally:
+        server.shutdown()
+
+    interaction = json.loads(fixture.read_text())["interactions"][0]
+    assert interaction["url"] == "/users/ActivityWatch"
+    assert interaction["headers"]["x-ratelimit-remaining"] == "999"
+    assert "content-type" not in interaction["headers"]
+
+    with replaying(fixture):
+        gh = Github(base_url=base_url)
+        assert gh.get_user("ActivityWatch").id == 5810298
+        assert gh.rate_limiting == (999, 1000)
+
+
+class _LimitedStandIn(BaseHTTPRequestHandler):
+    """Allows each token ``limit`` requests, like the API's primary rate limit."""
+
+    limit = 2
+    resets: dict[str, int] = {}
+    used: dict[str, int] = {}
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "").removeprefix("token ")
+        self.used[token] = self.used.get(token, 0) + 1
+        remaining = self.limit - self.used[token]
+        if remaining < 0:
+            body = {"message": "API rate limit exceeded for user."}
+            self.send_response(403)
+        else:
+            body = {"login": "ActivityWatch", "id": 5810298}
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-RateLimit-Limit", str(self.limit))
+        self.send_header("X-RateLimit-Remaining", str(max(remaining, 0)))
+        self.send_header("X-RateLimit-Reset", str(self.resets[token]))
+        self.send_header("X-RateLimit-Resource", "core")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_token_pool(monkeypatch):
+    monkeypatch.setattr(_LimitedStandIn, "used", {})
+    # far in the future, so budgets aren't reset during the test
+    monkeypatch.setattr(
+        _LimitedStandIn, "resets", {"a": 4000000000, "b": 4000000100, "c": 3900000000}
+    )
+    server = HTTPServer(("127.0.0.1", 0), _LimitedStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with transport.pooling(["a", "b", "c"]) as pool:
+            gh = Github("a", base_url=base_url)
+            for _ in range(6):
+                assert gh.get_user("ActivityWatch").id == 5810298
+            # every token's budget was used, and no request was refused
+            assert _LimitedStandIn.used == {"a": 2, "b": 2, "c": 2}
+            assert pool.pick() is None
+
+            # once all are exhausted, the error of the one reset first
+            # gets through (for the sync to sleep until then)
+            with pytest.raises(RateLimitExceededException):
+                gh.get_user("ActivityWatch")
+            assert gh.rate_limiting_resettime == 3900000000
+    finally:
+        server.shutdown()
+
+
+def test_token_pool_routing():
+    now = 1000.0
+    pool = transport.TokenPool(["a", "b"], clock=lambda: now)
+    assert pool.pick() == "a"  # nothing known yet
+    pool.update(
+        "a", "core", 200, {"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": "2000"}
+    )
+    assert pool.pick() == "b"  # unknown counts as full
+    pool.update(
+        "b", "core", 200, {"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": "2000"}
+    )
+    assert pool.pick() == "a"
+    # budgets are per resource
+    assert pool.pick("search") == "a"
+    pool.update("a", "core", 403, {"Retry-After": "60"})
+    assert pool.pick() == "b"
+    assert pool.budgets[("a", "core")] == (0, 1060.0)
+    now = 2001.0  # reset
+    assert pool.pick() == "a"
+
+
+def test_init_gh_tokens(monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "actions")
+    monkeypatch.setenv("GITHUB_TOKENS", "pat, app actions")
+    assert github_stats._tokens() == ["actions", "pat", "app"]
+    monkeypatch.delenv("GITHUB_TOKENS")
+    assert github_stats._tokens() == ["actions"]
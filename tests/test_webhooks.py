@@ -0,0 +1,170 @@
+import hashlib
+import hmac
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import date
+from pathlib import Path
+
+from contributor_stats import github_stats, webhooks
+from contributor_stats.transport import replaying
+
+FIXTURE = Path(__file__).parent / "fixtures" / "github-sync.json"
+REPO = "ActivityWatch/aw-client"
+
+
+def _user(id_, login):
+    return {"id": id_, "login": login, "node_id": f"U_{id_}"}
+
+
+def _comment(id_, user, created_at="2023-06-11T10:00:00Z", body="Thanks, works now"):
+    return {
+        "action": "created",
+        "repository": {"full_name": REPO},
+        "comment": {"id": id_, "user": user, "created_at": created_at, "body": body},
+    }
+
+
+def _pr(action, number, user, merged_at=None):
+    pr = {
+        "number": number,
+        "user": user,
+        "created_at": "2023-06-12T09:00:00Z",
+        "merged_at": merged_at,
+    }
+    return {"action": action, "repository": {"full_name": REPO}, "pull_request": pr}
+
+
+def _synced_state():
+    with replaying(FIXTURE):
+        state = github_stats._load_state()
+        github_stats._sync(github_stats._init_gh(), state)
+    return state
+
+
+def test_ingest(offline):
+    state = _synced_state()
+    users = state["repos"][REPO]["users"]
+    assert users["1001"]["comments"] == 2
+    words = users["1001"]["comment_words"]
+
+    alice = _user(1001, "alice")
+    # a comment the sync already counted, then a new one
+    assert not webhooks.ingest(state, "issue_comment", _comment(7004, alice), "d1")
+    assert webhooks.ingest(state, "issue_comment", _comment(7005, alice), "d2")
+    # a redelivery, and the same comment in another delivery
+    assert not webhooks.ingest(state, "issue_comment", _comment(7005, alice), "d2")
+    assert not webhooks.ingest(state, "issue_comment", _comment(7005, alice), "d3")
+    assert users["1001"]["comments"] == 3
+    assert users["1001"]["comment_words"] == words + 3
+
+    carol = _user(1004, "carol")
+    assert webhooks.ingest(state, "pull_request", _pr("opened", 905, carol), "d4")
+    merged = _pr("closed", 905, carol, merged_at="2023-06-13T09:00:00Z")
+    assert webhooks.ingest(state, "pull_request", merged, "d5")
+    assert webhooks.ingest(
+        state, "pull_request_review_comment", _comment(8003, carol), "d6"
+    )
+    assert {
+        stat: users["1004"][stat]
+        for stat in ("issues", "prs", "prs_merged", "pr_comments")
+    } == {"issues": 1, "prs": 1, "prs_merged": 1, "pr_comments": 1}
+    assert state["accounts"]["1004"]["login"] == "carol"
+    # bots, other repos and other actions count for nothing
+    bot = _user(49699333, "dependabot[bot]")
+    assert not webhooks.ingest(state, "issue_comment", _comment(7006, bot))
+    other = {**_comment(7007, alice), "repository": {"full_name": "someone/else"}}
+    assert not webhooks.ingest(state, "issue_comment", other)
+    assert not webhooks.ingest(state, "issues", {**_pr("edited", 4, alice)})
+
+    # the incrementally kept totals agree with a full re-aggregation
+    assert state["totals"] == github_stats._build_totals(state)
+
+    # delivery IDs are kept with the state
+    github_stats._save_state(state)
+    loaded = github_stats._load_state()
+    assert set(loaded["deliveries"]) == {"d1", "d2", "d3", "d4", "d5", "d6"}
+    assert not webhooks.ingest(loaded, "issue_comment", _comment(7008, alice), "d1")
+
+    # and the sync afterwards doesn't count anything twice
+    with replaying(FIXTURE, ignore_params={"since"}):
+        for repo_state in loaded["repos"].values():
+            repo_state.pop("meta", None)  # force a full sync
+        github_stats._sync(github_stats._init_gh(), loaded)
+    assert loaded["repos"][REPO]["users"]["1001"]["comments"] == 3
+
+
+def test_ingest_dir(offline, tmp_path):
+    state = github_stats._load_state()
+    deliveries = tmp_path / "deliveries"
+    deliveries.mkdir()
+    alice = _user(1001, "alice")
+    for name, event, payload in [
+        ("1", "issue_comment", _comment(7005, alice)),
+        ("2", "issues", {**_pr("opened", 906, alice), "issue": _pr("", 906, alice)["pull_request"]}),
+        ("3", "pull_request", _pr("opened", 907, alice)),
+    ]:  # fmt: skip
+        body = {"event": event, "payload": payload}
+        (deliveries / f"{name}.json").write_text(json.dumps(body))
+    assert webhooks.ingest_dir(state, deliveries) == 3
+    # named by their file, so ingesting again changes nothing
+    assert webhooks.ingest_dir(state, deliveries) == 0
+    user = state["repos"][REPO]["users"]["1001"]
+    assert (user["comments"], user["issues"], user["prs"]) == (1, 2, 1)
+
+
+def test_receiver(offline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the table is re-rendered here
+    server = webhooks.make_server(0, "s3cret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(payload, delivery, secret="s3cret", event="issue_comment"):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_port}/",
+            data=body,
+            headers={
+                "X-GitHub-Event": event,
+                "X-GitHub-Delivery": delivery,
+                "X-Hub-Signature-256": f"sha256={signature}",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+
+    try:
+        alice = _user(1001, "alice")
+        assert post(_comment(7005, alice), "d1", secret="wrong") == (
+            401,
+            "bad signature",
+        )
+        assert post({"zen": "Keep it simple."}, "d0", event="ping") == (200, "ignored")
+        for _ in range(20):
+            assert post(_comment(7005, alice), "d1")[0] == 200
+        state = github_stats._load_state()
+        assert state["repos"][REPO]["users"]["1001"]["comments"] == 1
+        assert (tmp_path / "github-activity-table.html").exists()
+
+        # a sync saves in between deliveries: the next one is merged into
+        # what it saved, rather than overwriting it
+        synced = github_stats._load_state()
+        bob = github_stats.Account(1002, "bob", "U_1002")
+        item = github_stats.Item(901, bob, date(2023, 6, 11))
+        github_stats._merge_stat(
+            synced["repos"][REPO], "issues", {"items": [item]}, synced["totals"]
+        )
+        synced["repos"][REPO]["last_synced"]["issues"] = "2023-06-12T00:00:00"
+        github_stats._save_state(synced)
+        assert post(_comment(7006, alice), "d2") == (200, "ingested")
+        state = github_stats._load_state()
+        users = state["repos"][REPO]["users"]
+        assert (users["1001"]["comments"], users["1002"]["issues"]) == (2, 1)
+        assert state["repos"][REPO]["last_synced"] == {"issues": "2023-06-12T00:00:00"}
+        assert set(state["deliveries"]) == {"d1", "d2"}
+    finally:
+        server.shutdown()
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import pytest
+
+from contributor_stats import github_stats
+from contributor_stats.windows import WindowIndex, parse_window
+
+
+def _state(daily_by_repo: dict) -> dict:
+    return {
+        "accounts": {"1": {"login": "alice"}, "2": {"login": "renovate[bot]"}},
+        "repos": {
+            repo: {"users": {user: {"daily": daily} for user, daily in users.items()}}
+            for repo, users in daily_by_repo.items()
+        },
+    }
+
+
+def test_window_rows():
+    state = _state(
+        {
+            "aw-core": {
+                "1": {
+                    "issues": {date(2024, 1, 1): 1, date(2024, 3, 1): 2},
+                    "prs": {date(2024, 3, 1): 1},
+                },
+                "2": {"prs": {date(2024, 3, 1): 50}},
+            },
+            "aw-qt": {
+                "1": {"comments": {date(2024, 2, 29): 3}},
+                "3": {"comments": {date(2023, 1, 1): 40}},
+            },
+        }
+    )
+    index = WindowIndex(state)
+
+    rows = index.rows(timedelta(days=30), today=date(2024, 3, 1))
+    assert rows == [
+        {"user": "alice", "issues": 1, "comments": 3, "prs": 1, "prs_merged": 0,
+         "pr_comments": 0, "active_days": 2, "total": 5},
+    ]  # fmt: skip
+    # the window includes today and excludes the day `window` days before
+    assert index.rows(timedelta(days=1), today=date(2024, 3, 1))[0]["comments"] == 0
+    # no account known: falls back to the ID, like the all-time table
+    rows = index.rows(timedelta(days=3650), today=date(2024, 3, 1))
+    assert [row["user"] for row in rows] == ["3", "alice"]
+
+
+def test_parse_window():
+    assert parse_window("30d") == timedelta(days=30)
+    assert parse_window("2w") == timedelta(days=14)
+    assert parse_window("1y") == timedelta(days=365)
+    for spec in ["30", "0d", "d", "1m"]:
+        with pytest.raises(ValueError):
+            parse_window(spec)
+
+
+def test_merge_keeps_daily_counts(offline):
+    repo_state: dict = {"last_synced": {}, "users": {}}
+    alice = github_stats.Account(1, "alice", "U_1")
+    items = [
+        github_stats.Item(1, alice, date(2024, 1, 1)),
+        github_stats.Item(2, alice, date(2024, 1, 1)),
+        github_stats.Item(3, alice, date(2024, 1, 2)),
+    ]
+    github_stats._merge_stat(repo_state, "issues", github_stats._tally(items[:2]))
+    github_stats._merge_stat(repo_state, "issues", github_stats._tally(items))
+    assert repo_state["users"]["1"]["daily"] == {
+        "issues": {date(2024, 1, 1): 2, date(2024, 1, 2): 1}
+    }
+
+    # and they survive a save/load roundtrip
+    state = {"version": github_stats.STATE_VERSION, "repos": {"r": repo_state}}
+    github_stats._save_state(state)
+    loaded = github_stats._load_state()
+    assert (
+        loaded["repos"]["r"]["users"]["1"]["daily"] == repo_state["users"]["1"]["daily"]
+    )
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Fetch Gravatars of every author in the visualized repos, for gource.
+
+Collects the authors (email and name) of all repos in one pass over their
+git logs, with the names canonicalized by the author renames of
+gource-rules.json (so they match the combined log), and fetches their
+avatars concurrently, a few at a time and at a polite rate. Images are
+written to the gource avatar directory as ``<name>.png``.
+
+Downloaded images are kept in a cache keyed by the hash of the email, and
+re-validated (with If-None-Match/If-Modified-Since) once they're older than
+--max-age. Emails without a Gravatar (404) are remembered too, and not asked
+for again until --negative-max-age has passed.
+
+Usage:
+    ./fetch-avatars.py [--output-dir ../.git/avatar] REPO[=PREFIX]...
+"""
+
+import hashlib
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+AVATAR_URL = "https://www.gravatar.com/avatar"
+SIZE = 256
+
+RULES = Path(__file__).parent / "gource-rules.json"
+CACHE_DIR = Path(".cache/avatars")
+OUTPUT_DIR = Path("../.git/avatar")
+
+# Avatars fetched at once, and the least time between two requests (seconds)
+WORKERS = 4
+MIN_INTERVAL = 0.2
+
+DAY = 24 * 60 * 60
+MAX_AGE = 7 * DAY
+NEGATIVE_MAX_AGE = 30 * DAY
+
+
+def load_renames(path: Path) -> list:
+    rules = json.loads(Path(path).read_text())
+    return [(re.compile(p), r) for p, r in rules.get("author_renames", [])]
+
+
+def canonical(name: str, renames) -> str:
+    for pattern, replacement in renames:
+        name = pattern.sub(replacement, name)
+    return name
+
+
+def collect_authors(repos, renames) -> dict:
+    """Every canonical author name of the repos, with their emails, most
+    recently used first."""
+    authors: dict = {}
+    for repo in repos:
+        result = subprocess.run(
+            ["git", "-C", str(repo), "log", "--format=%ae|%an"],
+            capture_output=True,
+            text=True,
+            errors="replace",
+        )
+        if result.returncode != 0:
+            print(f"  Skipping (not a git repo): {repo}", file=sys.stderr)
+            continue
+        for line in result.stdout.splitlines():
+            email, _, name = line.partition("|")
+            emails = authors.setdefault(canonical(name, renames), [])
+            if email and email not in emails:
+                emails.append(email)
+    return authors
+
+
+class RateLimiter:
+    """Spaces requests (from any thread) at least ``interval`` apart."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+        time.sleep(start - now)
+
+
+class AvatarCache:
+    """Gravatar images by email hash, with conditional re-validation and
+    negative caching (see the module docstring)."""
+
+    def __init__(
+        self,
+        cache_dir=CACHE_DIR,
+        avatar_url=AVATAR_URL,
+        session=None,
+        limiter=None,
+        max_age=MAX_AGE,
+        negative_max_age=NEGATIVE_MAX_AGE,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.avatar_url = avatar_url
+        self.session = session or requests.Session()
+        self.limiter = limiter or RateLimiter(MIN_INTERVAL)
+        self.max_age = max_age
+        self.negative_max_age = negative_max_age
+        # one lock per key, so an avatar is only fetched by one thread at a
+        # time (the others then find it cached)
+        self.locks: dict = {}
+        self.locks_lock = threading.Lock()
+
+    def get(self, email: str):
+        """The path of the cached avatar for ``email``, or None if it has
+        none."""
+        key = hashlib.md5(email.strip().lower().encode()).hexdigest()
+        with self.locks_lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            return self._get(key, email)
+
+    def _get(self, key: str, email: str):
+        image = self.cache_dir / f"{key}.png"
+        meta_file = self.cache_dir / f"{key}.json"
+        meta = json.loads(meta_file.read_text()) if meta_file.exists() else None
+        found = meta is not None and meta["status"] == 200 and image.exists()
+        if meta is not None:
+            max_age = self.max_age if found else self.negative_max_age
+            if time.time() - meta["fetched"] < max_age:
+                return image if found else None
+
+        headers = {}
+        if found:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        self.limiter.wait()
+        try:
+            response = self.session.get(
+                f"{self.avatar_url}/{key}",
+                params={"d": "404", "s": SIZE},
+                headers=headers,
+                timeout=30,
+            )
+            if response.status_code not in (200, 304, 404):
+                response.raise_for_status()
+        except requests.RequestException as e:
+            # keep what we have, and try again next time
+            print(f"  Failed to fetch avatar for {email}: {e}", file=sys.stderr)
+            return image if found else None
+
+        if response.status_code == 304:
+            meta["fetched"] = time.time()
+        elif response.status_code == 404:
+            meta = {"status": 404, "fetched": time.time()}
+            image.unlink(missing_ok=True)
+        else:
+            # (a temporary file of its own, so no other writer, e.g. another
+            # run sharing the cache, can interleave with it)
+            with tempfile.NamedTemporaryFile(
+                dir=self.cache_dir, suffix=".tmp", delete=False
+            ) as tmp:
+                tmp.write(response.content)
+            Path(tmp.name).replace(image)
+            meta = {
+                "status": 200,
+                "fetched": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+        meta_file.write_text(json.dumps(meta))
+        return image if meta["status"] == 200 else None
+
+
+def fetch_avatars(
+    authors: dict, output_dir: Path, cache: AvatarCache, workers=WORKERS
+) -> int:
+    """Write an avatar for each author (trying their emails in order) to
+    ``output_dir``; returns how many were found."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    def fetch(name, emails):
+        if not name or "/" in name:
+            return False
+        for email in emails:
+            image = cache.get(email)
+            if image:
+                (output_dir / f"{name}.png").write_bytes(image.read_bytes())
+                return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(lambda author: fetch(*author), authors.items()))
+
+
+def make_session(workers=WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("repos", nargs="+", metavar="REPO[=PREFIX]")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--rules", type=Path, default=RULES)
+    parser.add_argument("--workers", "-j", type=int, default=WORKERS)
+    parser.add_argument("--max-age", type=float, default=MAX_AGE / DAY, help="days")
+    parser.add_argument(
+        "--negative-max-age", type=float, default=NEGATIVE_MAX_AGE / DAY, help="days"
+    )
+    parser.add_argument(
+        "--avatar-url",
+        default=AVATAR_URL,
+        help="Gravatar base URL (e.g. a local stand-in for testing)",
+    )
+    args = parser.parse_args()
+
+    # (the prefix is accepted, and ignored, to take the same repo list as
+    # gource-log.py)
+    repos = [Path(spec.partition("=")[0]) for spec in args.repos]
+    authors = collect_authors(repos, load_renames(args.rules))
+    cache = AvatarCache(
+        args.cache_dir,
+        args.avatar_url,
+        make_session(args.workers),
+        max_age=args.max_age * DAY,
+        negative_max_age=args.negative_max_age * DAY,
+    )
+    found = fetch_avatars(authors, args.output_dir, cache, args.workers)
+    print(f"Found avatars for {found} of {len(authors)} authors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Build the combined gource log for the ActivityWatch visualization.
+
+Extracts each repo's custom log with ``gource --output-custom-log`` (in
+parallel), applies every transform from a rules file in a single pass over
+each line, and sorts it by time. These per-repo logs are cached in --tmpdir,
+keyed by the repo's HEAD and the rules, so only repos that changed since the
+last run are extracted again. The combined log is a streaming k-way merge of
+the per-repo logs.
+
+Usage:
+    ./gource-log.py [-o combined.gource] [--rules gource-rules.json] REPO[=PREFIX]...
+
+Each REPO is a git checkout; its files are placed under ``/PREFIX`` (if
+given) in the visualization.
+
+Rules (JSON, see gource-rules.json), applied in this order:
+    delete_all_at: {prefix: timestamp} - delete every file of that repo then
+    path_rewrites: [[regex, replacement]] - applied to every path
+    exclude_paths: [regex] - drop events on matching paths
+    author_renames: [[regex, replacement]] - applied to every author
+    exclude_authors: [regex] - drop events by matching (renamed) authors
+    colours: [[regex, colour]] - colour of a path, first match wins
+"""
+
+import hashlib
+import heapq
+import json
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+RULES = Path(__file__).parent / "gource-rules.json"
+TMPDIR = Path(".cache/gource")
+
+# Repos extracted at once (each is a gource process)
+WORKERS = 8
+
+
+class Rules:
+    def __init__(self, rules: dict):
+        # for the cache of transformed logs
+        self.hash = hashlib.sha256(
+            json.dumps(rules, sort_keys=True).encode()
+        ).hexdigest()
+        self.delete_all_at = rules.get("delete_all_at", {})
+        self.path_rewrites = [
+            (re.compile(p), r) for p, r in rules.get("path_rewrites", [])
+        ]
+        self.exclude_paths = [re.compile(p) for p in rules.get("exclude_paths", [])]
+        self.author_renames = [
+            (re.compile(p), r) for p, r in rules.get("author_renames", [])
+        ]
+        self.exclude_authors = [re.compile(p) for p in rules.get("exclude_authors", [])]
+        self.colours = [(re.compile(p), c) for p, c in rules.get("colours", [])]
+
+    @classmethod
+    def load(cls, path: Path) -> "Rules":
+        return cls(json.loads(Path(path).read_text()))
+
+    def apply(self, timestamp: str, author: str, action: str, path: str):
+        """The transformed log line for an event, or None if it's excluded."""
+        for pattern, replacement in self.path_rewrites:
+            path = pattern.sub(replacement, path)
+        if any(pattern.search(path) for pattern in self.exclude_paths):
+            return None
+        for pattern, replacement in self.author_renames:
+            author = pattern.sub(replacement, author)
+        if any(pattern.search(author) for pattern in self.exclude_authors):
+            return None
+        line = f"{timestamp}|{author}|{action}|{path}"
+        for pattern, colour in self.colours:
+            if pattern.search(path):
+                return f"{line}|{colour}"
+        return line
+
+
+def extract_log(repo: Path, out: Path) -> None:
+    """Write the repo's history as a gource custom log."""
+    subprocess.run(
+        ["gource", "--output-custom-log", str(out), str(repo)],
+        check=True,
+        capture_output=True,
+    )
+
+
+def head(repo: Path):
+    """The SHA of the repo's HEAD, or None if it isn't a git repo."""
+    result = subprocess.run(
+        ["git", "-C", str(repo), "rev-parse", "HEAD"], capture_output=True, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def read_log(log: Path, prefix: str):
+    """(timestamp, author, action, path) of every event in a custom log,
+    with the path moved under ``/prefix``."""
+    with open(log, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            timestamp, author, action, path = line.rstrip("\n").split("|", 3)
+            yield timestamp, author, action, f"/{prefix}{path}" if prefix else path
+
+
+def repo_lines(log: Path, prefix: str, rules: Rules) -> list:
+    """(timestamp, line) of every event of a repo after the rules."""
+    lines = []
+    # files that exist at the end, for delete_all_at (last author deletes)
+    files: dict = {}
+    for timestamp, author, action, path in read_log(log, prefix):
+        if action == "D":
+            files.pop(path, None)
+        else:
+            files[path] = author
+        line = rules.apply(timestamp, author, action, path)
+        if line is not None:
+            lines.append((int(timestamp), line))
+    if prefix in rules.delete_all_at:
+        timestamp = rules.delete_all_at[prefix]
+        for path, author in files.items():
+            line = rules.apply(str(timestamp), author, "D", path)
+            if line is not None:
+                lines.append((timestamp, line))
+    return lines
+
+
+def parse_repo(spec: str):
+    """``path[=prefix]`` -> (path, prefix)"""
+    path, _, prefix = spec.partition("=")
+    return Path(path), prefix.strip("/")
+
+
+def repo_log(repo: Path, prefix: str, rules: Rules, tmpdir=TMPDIR) -> Path:
+    """The repo's transformed log, sorted by time. Reused from the last run
+    if neither the repo's HEAD nor the rules changed since."""
+    name = prefix.replace("/", "__") or repo.resolve().name
+    log = Path(tmpdir) / f"{name}.gource"
+    key_file = log.with_suffix(".key")
+    sha = head(repo)
+    key = f"{sha} {prefix} {rules.hash}"
+    if sha and log.exists() and key_file.exists() and key_file.read_text() == key:
+        print(f"  {repo} -> /{prefix} (unchanged)", file=sys.stderr)
+        return log
+
+    raw = log.with_suffix(".txt")
+    extract_log(repo, raw)
+    print(f"  {repo} -> /{prefix}", file=sys.stderr)
+    lines = repo_lines(raw, prefix, rules)
+    # stable, so events keep their order within a second
+    lines.sort(key=lambda line: line[0])
+    tmp = log.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(line + "\n" for _, line in lines)
+    tmp.replace(log)
+    raw.unlink()
+    key_file.write_text(key)
+    return log
+
+
+def merge_logs(logs, output: Path) -> int:
+    """Merge sorted logs into ``output``, streaming; returns the number of
+    events written."""
+    count = 0
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(log, encoding="utf-8")) for log in logs]
+        merged = heapq.merge(*files, key=lambda line: int(line.split("|", 1)[0]))
+        with open(output, "w", encoding="utf-8") as f:
+            for line in merged:
+                f.write(line)
+                count += 1
+    return count
+
+
+def build(repos, rules: Rules, output: Path, tmpdir=TMPDIR, workers=WORKERS) -> int:
+    """Extract (or reuse), transform and combine the logs of ``repos``
+    ((path, prefix) pairs) into ``output``; returns the number of events
+    written."""
+    Path(tmpdir).mkdir(parents=True, exist_ok=True)
+
+    def process(repo, prefix):
+        if not repo.is_dir():
+            print(f"  Skipping (not found): {repo}", file=sys.stderr)
+            return None
+        try:
+            return repo_log(repo, prefix, rules, tmpdir)
+        except subprocess.CalledProcessError as e:
+            print(f"  Skipping {repo}: {e.stderr.decode()}", file=sys.stderr)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        logs = list(pool.map(lambda repo: process(*repo), repos))
+    # (ties are merged in the order of the repos)
+    return merge_logs([log for log in logs if log], output)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("repos", nargs="+", metavar="REPO[=PREFIX]")
+    parser.add_argument("--output", "-o", type=Path, default=TMPDIR / "combined.gource")
+    parser.add_argument("--rules", type=Path, default=RULES)
+    parser.add_argument("--tmpdir", type=Path, default=TMPDIR)
+    parser.add_argument("--workers", "-j", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    repos = [parse_repo(spec) for spec in args.repos]
+    count = build(repos, Rules.load(args.rules), args.output, args.tmpdir, args.workers)
+    print(f"Wrote {count} events to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ set -e
 rootdir=../../../
 tmpdir=.cache/gource
 communitydir=.cache/community  # Directory for auto-cloned community repos
-rm -rf $tmpdir
+# (not cleared: gource-log.py keeps the logs of unchanged repos there)
 mkdir -p $tmpdir
 mkdir -p $communitydir
 
@@ -41,10 +41,11 @@ for repo in "${community_repos[@]}"; do
     fi
 done
 
+# Repos to visualize, as path=prefix (where their files go in the tree)
+repos=()
+
 # Bundle repo (official ActivityWatch)
-echo ""
-echo "=== Processing official repos ==="
-gource --output-custom-log $tmpdir/activitywatch.txt $rootdir
+repos+=("$rootdir")
 
 # ===========================================
 # Official ActivityWatch modules
@@ -75,7 +76,7 @@ modules=(
     # sync and notifications
     other/aw-sync
     other/aw-notify
-    # old
+    # old (every file is deleted when the rewrite began, see gource-rules.json)
     old/activitywatch-old
     # hidden due it causing a mess
     #other/aw-android
@@ -87,35 +88,26 @@ for path in "${modules[@]}"; do
     loc=$(echo $loc | sed -E "s#.+-client.*#clients/$name#g")
     loc=$(echo $loc | sed -E "s#.+-server.*#servers/$name#g")
     loc=$(echo $loc | sed -E "s#docs|activitywatch.github.io#website/$name#g")
-    echo "  $name -> $loc"
-    if [ -d "$rootdir/$path" ]; then
-        gource --output-custom-log $tmpdir/$name.txt $rootdir/$path 2>/dev/null || echo "    (skipped)"
-        sed -i -r "s#(.+)\\|#\\1|/$loc#" $tmpdir/$name.txt 2>/dev/null || true
+    repos+=("$rootdir/$path=$loc")
+done
+
+community_loc() {
+    if [[ $1 == *"watcher"* ]] || [[ $1 == "awatcher" ]]; then
+        echo "watchers/community/$1"
+    elif [[ $1 == *"plasmoid"* ]] || [[ $1 == *"widget"* ]]; then
+        echo "widgets/$1"
     else
-        echo "    -> Skipping (not found): $rootdir/$path"
+        echo "community/$1"
     fi
-done
+}
 
-# Process community repos (auto-cloned from GitHub)
-echo ""
-echo "=== Processing community repos ==="
+# Community repos (auto-cloned from GitHub)
 for repo in "${community_repos[@]}"; do
     name=$(basename $repo)
-    if [[ $name == *"watcher"* ]] || [[ $name == "awatcher" ]]; then
-        loc="watchers/community/$name"
-    elif [[ $name == *"plasmoid"* ]] || [[ $name == *"widget"* ]]; then
-        loc="widgets/$name"
-    else
-        loc="community/$name"
-    fi
-    if [ -d "$communitydir/$name" ]; then
-        echo "  $name -> $loc"
-        gource --output-custom-log $tmpdir/community-$name.txt $communitydir/$name 2>/dev/null || echo "    (skipped)"
-        sed -i -r "s#(.+)\\|#\\1|/$loc#" $tmpdir/community-$name.txt 2>/dev/null || true
-    fi
+    repos+=("$communitydir/$name=$(community_loc $name)")
 done
 
-# Also process any locally-cloned community repos (if present)
+# Also any locally-cloned community repos (if present)
 community_local=(
     community/awatcher
     community/aw-watcher-media-player
@@ -127,107 +119,31 @@ community_local=(
 
 for path in "${community_local[@]}"; do
     name=$(basename $path)
-    # Skip if already processed from auto-clone
-    [ -f "$tmpdir/community-$name.txt" ] && continue
-    if [[ $name == *"watcher"* ]] || [[ $name == "awatcher" ]]; then
-        loc="watchers/community/$name"
-    elif [[ $name == *"plasmoid"* ]] || [[ $name == *"widget"* ]]; then
-        loc="widgets/$name"
-    else
-        loc="community/$name"
-    fi
-    echo "  $name -> $loc (local)"
-    if [ -d "$rootdir/$path" ]; then
-        gource --output-custom-log $tmpdir/$name.txt $rootdir/$path 2>/dev/null || echo "    (skipped)"
-        sed -i -r "s#(.+)\\|#\\1|/$loc#" $tmpdir/$name.txt 2>/dev/null || true
-    else
-        echo "    -> Skipping (not found): $rootdir/$path"
-    fi
+    # Skip if already included from auto-clone
+    [ -d "$communitydir/$name" ] && continue
+    repos+=("$rootdir/$path=$(community_loc $name)")
 done
 
-# Remove all files in activitywatch-old repo when rewrite began
-# TODO: Remove in a logical order (deepest first)
-sed -E 's/.+[|](.+)[|].+[|](.+)/1461708000|\1|D|\2/g' $tmpdir/activitywatch-old.txt 2>/dev/null | uniq > $tmpdir/fixes.txt || true
-
 gourcelog=$tmpdir/combined.gource
 
-# Combine all the logs into one log
-cat $tmpdir/*.txt 2>/dev/null | sort -n > $gourcelog
-
-# Rename activitywatch-old so it behaves like top dir
-sed -i 's#activitywatch-old/##g' $gourcelog
-
-# Remove .github folders (they make a mess)
-sed -i -E 's#.+/.github/##g' $gourcelog
-
-# Color certain file extensions a certain way
-sed -i 's/[.]py/\0|4B8BBE/g' $gourcelog      # Python - blue
-sed -i 's/[.]rs$/\0|FFAA33/g' $gourcelog     # Rust - orange
-sed -i 's/[.]js/\0|F0DB4F/g' $gourcelog      # JavaScript - yellow
-sed -i 's/[.]ts/\0|007ACC/g' $gourcelog      # TypeScript - blue
-sed -i 's/[.]vue/\0|41B883/g' $gourcelog     # Vue - green
-sed -i 's/[.]go$/\0|00ADD8/g' $gourcelog     # Go - cyan
-sed -i 's/[.]kt$/\0|7F52FF/g' $gourcelog     # Kotlin - purple
-sed -i 's/[.]java$/\0|B07219/g' $gourcelog   # Java - brown
-
-# Docs
-sed -i -E 's/[.](md|rst|txt)|LICENSE$/\0|FF5555/g' $gourcelog
-sed -i -E 's/[.](png|jpg|dot|svg)/\0|FFAA55/g' $gourcelog
-sed -i -E 's/[.](css|scss)/\0|cc6699/g' $gourcelog
-sed -i -E 's/[.](pug|html)/\0|cc6699/g' $gourcelog
-
-# Misc files
-sed -i -E 's/Makefile|requirements(-dev)?.txt|Pipfile$/\0|444444/g' $gourcelog
-sed -i -E 's/[.](sh|cmd|editorconfig|ya?ml|gitmodules|.+ignore|gitkeep|gitattributes|lock|toml|babelrc|ps1|spec|service|scpt|bat|in)$/\0|444444/g' $gourcelog
-
-# Fix some commit names
-sed -i 's/johan-bjareholt/Johan Bjäreholt/g' $gourcelog
-sed -i -E 's/Erik Bj.{1,4}reholt/Erik Bjäreholt/g' $gourcelog
-sed -i 's/dependabot.+/dependabot/g' $gourcelog
-sed -i 's/Bill-linux/Bill Ang Li/g' $gourcelog
-# Community contributor name fixes
-sed -i 's/2e3s/Denis Gavrilov/g' $gourcelog
-sed -i 's/NicoWeio/Nicolai Weitkemper/g' $gourcelog
-
-# Remove names which have been spamming commits in CI (accidental bad CI config)
-sed -i 's/.*ErikBjare.*//g' $gourcelog
+# Extract every repo's log (in parallel) and combine them into one, applying
+# the path rewrites, exclusions, author renames and file colours from
+# gource-rules.json along the way
+echo ""
+echo "=== Building combined log ==="
+python3 gource-log.py --rules gource-rules.json --tmpdir $tmpdir -o $gourcelog "${repos[@]}"
 
-# Prepare avatars
-# TODO: Doesn't fetch avatars from all repos (only the ones with most contributors)
+# Prepare avatars, for the authors of all repos, named as in the combined log
+# (see fetch-avatars.py)
 # TODO: Dynamic avatar evolution - change user avatars over time to reflect
 #       their profile picture at that point in history. This would require:
 #       1. GitHub API to fetch historical avatar URLs (if available) or
 #       2. Wayback Machine integration to get historical profile pictures
 #       3. Gource custom avatar timeline support (may need patching gource)
 #       For now, avatars are static (most recent profile picture)
-if [ -d .git/avatar ]; then
-    perl fetch-avatars.pl 2>/dev/null || echo "Avatar fetch skipped"
-    # run for bundle repo, move avatars to local .git/avatars
-    fetchsrc=$(realpath fetch-avatars.pl)
-    if [ -d "$rootdir/.git" ]; then
-        pushd $rootdir > /dev/null; perl $fetchsrc 2>/dev/null || true; popd > /dev/null
-        [ -d "$rootdir/.git/avatar" ] && mv $rootdir/.git/avatar/* .git/avatar 2>/dev/null || true
-    fi
-    if [ -d "$rootdir/aw-server/aw-webui/.git" ]; then
-        pushd $rootdir/aw-server/aw-webui > /dev/null; perl $fetchsrc 2>/dev/null || true; popd > /dev/null
-        [ -d "$rootdir/aw-server/aw-webui/.git/avatar" ] && mv $rootdir/aw-server/aw-webui/.git/avatar/* .git/avatar 2>/dev/null || true
-    fi
-    if [ -d "$rootdir/docs/.git" ]; then
-        pushd $rootdir/docs > /dev/null; perl $fetchsrc 2>/dev/null || true; popd > /dev/null
-        [ -d "$rootdir/docs/.git/avatar" ] && mv $rootdir/docs/.git/avatar/* .git/avatar 2>/dev/null || true
-    fi
-    # Fetch avatars for auto-cloned community contributors
-    for repo in "${community_repos[@]}"; do
-        name=$(basename $repo)
-        if [ -d "$communitydir/$name/.git" ]; then
-            pushd $communitydir/$name > /dev/null; perl $fetchsrc 2>/dev/null || true; popd > /dev/null
-            [ -d "$communitydir/$name/.git/avatar" ] && mv $communitydir/$name/.git/avatar/* .git/avatar 2>/dev/null || true
-        fi
-    done
-fi
-
-# Rename avatars to suit committer name
-[ -f ".git/avatar/johan-bjareholt.png" ] && cp .git/avatar/johan-bjareholt.png '.git/avatar/Johan Bjäreholt.png' 2>/dev/null || true
+echo ""
+echo "=== Fetching avatars ==="
+python3 fetch-avatars.py --rules gource-rules.json --output-dir ../.git/avatar "${repos[@]}" || echo "Avatar fetch skipped"
 
 # Resolutions:
 #  - 2560x1440 (for upload)
@@ -262,15 +178,14 @@ gource_options=(
     #--disable-auto-rotate
     --background-colour 000000
     -$res_med
-    $gourcelog
 )
 
 echo ""
 echo "=== Visualizing ==="
-gource "${gource_options[@]}"
+gource "${gource_options[@]}" $gourcelog
 
-# To render video
+# To render video, in segments rendered in parallel (already rendered ones
+# are reused, so an interrupted render can be resumed by running this again)
 echo ""
 echo "=== Rendering video ==="
-gource "${gource_options[@]}" -o - | ffmpeg -y -r 60 -f image2pipe -vcodec ppm -i - -vcodec libx264 -preset ultrafast -pix_fmt yuv420p -crf 1 -threads 0 -bf 0 gource.mp4
-echo "Done! Output: gource.mp4"
+python3 gource-render.py $gourcelog -o gource.mp4 --workdir $tmpdir/segments -- "${gource_options[@]}"
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Render the gource visualization to a video, in parallel segments.
+
+The combined log's timeline is split into --segments equal time spans, each
+rendered by its own gource | ffmpeg pipeline (--jobs at a time), and the
+segment videos are concatenated losslessly (ffmpeg's concat demuxer, without
+re-encoding) into the output.
+
+So that a segment starts from the same picture the previous one ended with,
+its log begins with a warm-up: every file that existed --warmup seconds (of
+video) before the segment starts is added, and the events since are
+replayed, spread evenly over that time. Gource lays out the tree and moves
+the camera during the warm-up, and its frames are cut from the segment.
+
+Segments already rendered (with the same log and options) are skipped, so
+an interrupted render resumes where it stopped.
+
+Usage:
+    ./gource-render.py combined.gource [-o gource.mp4] [--segments 8] -- GOURCE_OPTION...
+"""
+
+import hashlib
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+FPS = 60
+FFMPEG_OPTIONS = ["-vcodec", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p"]
+FFMPEG_OPTIONS += ["-crf", "1", "-threads", "0", "-bf", "0"]
+
+WORKDIR = Path(".cache/gource/segments")
+SEGMENTS = 8
+JOBS = 4
+WARMUP = 10  # seconds of video
+
+# gource's defaults
+SECONDS_PER_DAY = 10.0
+AUTO_SKIP_SECONDS = 3.0
+
+# How often each worker reports its progress (seconds)
+REPORT_INTERVAL = 30
+
+DAY = 24 * 60 * 60
+
+
+def option(options: list, name: str, default: float) -> float:
+    """The value of a gource option, e.g. ``--seconds-per-day 0.1``."""
+    for i, arg in enumerate(options[:-1]):
+        if arg == name:
+            return float(options[i + 1])
+    return default
+
+
+def read_events(log: Path):
+    """(timestamp, fields) of every event in a gource custom log, where
+    fields are the author, action, path and (optional) colour."""
+    with open(log, encoding="utf-8") as f:
+        for line in f:
+            timestamp, fields = line.rstrip("\n").split("|", 1)
+            yield int(timestamp), fields
+
+
+def boundaries(log: Path, count: int) -> list:
+    """``count + 1`` timestamps splitting the log's timeline in equal spans."""
+    first = last = None
+    for timestamp, _ in read_events(log):
+        first = timestamp if first is None else first
+        last = timestamp
+    if first is None:
+        raise ValueError(f"{log} is empty")
+    span = (last + 1 - first) / count
+    return [first + round(i * span) for i in range(count)] + [last + 1]
+
+
+def segment_log(
+    log: Path, start: int, stop: int, warmup_days: float, auto_skip_days: float
+):
+    """The lines of the segment's log, and how many seconds of warm-up (in
+    log time) they start with.
+
+    The warm-up is the state of the tree ``warmup_days`` before ``start``
+    (as additions), followed by the events since, all spread evenly up to
+    ``start``. Spread over less time, if there are too few of them to keep
+    gource from skipping ahead (by --auto-skip-seconds) while idle.
+    """
+    files: dict = {}
+    replay = []
+    lines = []
+    for timestamp, fields in read_events(log):
+        if timestamp < start - warmup_days * DAY:
+            parts = fields.split("|")
+            if parts[1] == "D":
+                files.pop(parts[2], None)
+            else:
+                parts[1] = "A"
+                files[parts[2]] = "|".join(parts)
+        elif timestamp < start:
+            replay.append(fields)
+        elif timestamp < stop:
+            lines.append(f"{timestamp}|{fields}")
+        else:
+            # so gource's clock runs up to the stop date
+            lines.append(f"{timestamp}|{fields}")
+            break
+
+    warmup = list(files.values()) + replay
+    if not warmup:
+        return lines, 0
+    days = min(warmup_days, len(warmup) * auto_skip_days * 0.9)
+    step = days * DAY / len(warmup)
+    warmup_lines = [
+        f"{int(start - days * DAY + i * step)}|{fields}"
+        for i, fields in enumerate(warmup)
+    ]
+    return warmup_lines + lines, days * DAY
+
+
+def gource_date(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S +0000"
+    )
+
+
+def render_segment(
+    name: str, log: Path, options: list, trim: float, output: Path
+) -> None:
+    """Render a segment's log with gource, piped into ffmpeg, cutting the
+    first ``trim`` seconds of video, and report the frame rate."""
+    tmp = output.with_suffix(".part.mp4")
+    gource = subprocess.Popen(
+        ["gource", *options, "-o", "-", str(log)], stdout=subprocess.PIPE
+    )
+    ffmpeg = subprocess.Popen(
+        ["ffmpeg", "-y", "-r", str(FPS), "-f", "image2pipe", "-vcodec", "ppm"]
+        + ["-i", "-", "-ss", f"{trim:.3f}", *FFMPEG_OPTIONS]
+        + ["-progress", "pipe:1", "-nostats", "-loglevel", "error", str(tmp)],
+        stdin=gource.stdout,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    gource.stdout.close()  # so gource gets SIGPIPE if ffmpeg exits
+
+    started = last_report = time.monotonic()
+    frames = 0
+    for line in ffmpeg.stdout:
+        if line.startswith("frame="):
+            frames = int(line.split("=", 1)[1])
+            now = time.monotonic()
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                print(f"  {name}: {frames} frames, {frames / (now - started):.1f} fps")
+    if gource.wait() != 0 or ffmpeg.wait() != 0:
+        raise RuntimeError(f"Failed to render {name}")
+    tmp.replace(output)
+    elapsed = time.monotonic() - started
+    print(
+        f"  {name}: done, {frames} frames in {elapsed:.0f}s, {frames / elapsed:.1f} fps"
+    )
+
+
+def render(
+    log: Path,
+    output: Path,
+    options: list,
+    segments=SEGMENTS,
+    jobs=JOBS,
+    warmup=WARMUP,
+    workdir=WORKDIR,
+) -> None:
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    seconds_per_day = option(options, "--seconds-per-day", SECONDS_PER_DAY)
+    auto_skip = option(options, "--auto-skip-seconds", AUTO_SKIP_SECONDS)
+    bounds = boundaries(log, segments)
+
+    outputs = []
+    todo = []
+    for i, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+        lines, warmup_log_seconds = segment_log(
+            log, start, stop, warmup / seconds_per_day, auto_skip / seconds_per_day
+        )
+        trim = warmup_log_seconds / DAY * seconds_per_day
+        segment_options = list(options)
+        if i < segments - 1:
+            segment_options += ["--stop-date", gource_date(stop)]
+        data = "".join(line + "\n" for line in lines)
+        key = hashlib.sha256(
+            "\0".join([data, *segment_options, str(trim), *FFMPEG_OPTIONS]).encode()
+        ).hexdigest()[:12]
+        name = f"segment-{i:03d}-{key}"
+        video = workdir / f"{name}.mp4"
+        outputs.append(video)
+        if video.exists():
+            print(f"  {name}: already rendered")
+            continue
+        segment = workdir / f"{name}.gource"
+        segment.write_text(data, encoding="utf-8")
+        todo.append((name, segment, segment_options, trim, video))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # (list, so that a failed segment raises here)
+        list(pool.map(lambda args: render_segment(*args), todo))
+    concat_videos(outputs, output, workdir)
+
+
+def concat_videos(videos: list, output: Path, workdir=WORKDIR) -> None:
+    """Concatenate videos (encoded alike) without re-encoding them."""
+    concat = Path(workdir) / "concat.txt"
+    concat.write_text("".join(f"file '{video.resolve()}'\n" for video in videos))
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0"]
+        + ["-i", str(concat), "-c", "copy", str(output)],
+        check=True,
+    )
+
+
+def parse_args(argv=None):
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Everything after -- is for gource. Split off here, as argparse won't
+    # take it as a positional once options came between it and the log.
+    gource_options = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, gource_options = argv[:i], argv[i + 1 :]
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        usage="%(prog)s [options] log [-- GOURCE_OPTION...]",
+    )
+    parser.add_argument("log", type=Path, help="The combined gource log")
+    parser.add_argument("--output", "-o", type=Path, default=Path("gource.mp4"))
+    parser.add_argument("--segments", type=int, default=SEGMENTS)
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=JOBS, help="Segments rendered at once"
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=WARMUP,
+        help="Seconds of warm-up before each segment",
+    )
+    parser.add_argument("--workdir", type=Path, default=WORKDIR)
+    args = parser.parse_args(argv)
+    args.gource_options = gource_options
+    return args
+
+
+def main():
+    args = parse_args()
+
+    render(
+        args.log,
+        args.output,
+        args.gource_options,
+        args.segments,
+        args.jobs,
+        args.warmup,
+        args.workdir,
+    )
+    print(f"Done! Output: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
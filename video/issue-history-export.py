@@ -5,6 +5,17 @@ Export GitHub issue history for ActivityWatch repos.
 This script fetches issue activity (creation, comments, closure) from GitHub
 and exports it in a format suitable for visualization.
 
+Comments are fetched with the repo-wide ``/repos/{repo}/issues/comments``
+listing (instead of one request per issue) and joined to their issues by
+issue URL, so the number of requests is proportional to the number of pages
+of issues and comments. Repos are fetched concurrently, over one pooled HTTP
+session authenticated with GITHUB_TOKEN (or the token of the gh CLI).
+
+Each repo's events are kept in a segment under --cache-dir: a JSON Lines
+file sorted by timestamp, extended on every run with just the activity since
+the previous one (see update_segment). The output is a streaming k-way merge
+of the segments, so no more than one line per repo is held in memory.
+
 Usage:
     ./issue-history-export.py [--output issues.csv] [--format csv|gource]
 
@@ -13,12 +24,20 @@ Output formats:
     gource: Gource-compatible log format for visualization
 """
 
-import subprocess
+import heapq
 import json
+import os
+import subprocess
 import sys
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://api.github.com"
+
 # ActivityWatch repos to include
 REPOS = [
     "ActivityWatch/activitywatch",
@@ -34,73 +53,86 @@ REPOS = [
     "ActivityWatch/activitywatch.github.io",
 ]
 
-def fetch_issues(repo: str, max_issues: int = 500) -> list:
-    """Fetch issues and their timeline from a GitHub repo."""
+# Repos fetched at once; also the size of the session's connection pool
+WORKERS = 4
+
+CACHE_DIR = Path(".cache/issue-history")
+
+
+def get_token():
+    """GITHUB_TOKEN, or else the token the gh CLI is logged in with."""
+    if os.environ.get('GITHUB_TOKEN'):
+        return os.environ['GITHUB_TOKEN']
+    try:
+        result = subprocess.run(['gh', 'auth', 'token'], capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() or None
+
+
+def make_session(token=None, workers=WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept'] = 'application/vnd.github+json'
+    if token:
+        session.headers['Authorization'] = f'token {token}'
+    return session
+
+
+def get_all(session, url, params):
+    """GET every page of a list endpoint, following the Link headers."""
+    items = []
+    while url:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        items.extend(response.json())
+        url = response.links.get('next', {}).get('url')
+        params = None  # the next URL already has them
+    return items
+
+
+def fetch_issues(session, repo: str, since=None, api_url=API_URL) -> list:
+    """Fetch issues (and PRs) from a GitHub repo, optionally only those
+    updated since the ISO timestamp ``since``."""
     print(f"Fetching issues from {repo}...", file=sys.stderr)
-    
-    # Fetch issues with comments count
-    cmd = [
-        "gh", "api", "-X", "GET", 
-        f"/repos/{repo}/issues",
-        "-f", "state=all",
-        "-f", "per_page=100",
-        "--paginate",
-        "--jq", """
-            .[] | {
-                number: .number,
-                title: .title,
-                state: .state,
-                created_at: .created_at,
-                closed_at: .closed_at,
-                user: .user.login,
-                comments: .comments,
-                is_pr: (.pull_request != null)
-            }
-        """
+    params = {'state': 'all', 'per_page': 100}
+    if since:
+        params['since'] = since
+    issues = get_all(session, f"{api_url}/repos/{repo}/issues", params)
+    return [
+        {
+            'url': issue['url'],
+            'number': issue['number'],
+            'title': issue['title'],
+            'state': issue['state'],
+            'created_at': issue['created_at'],
+            'closed_at': issue['closed_at'],
+            'user': issue['user']['login'],
+            'comments': issue['comments'],
+            'is_pr': 'pull_request' in issue,
+        }
+        for issue in issues
     ]
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        if result.returncode != 0:
-            print(f"  Warning: Failed to fetch {repo}: {result.stderr}", file=sys.stderr)
-            return []
-        
-        issues = []
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                try:
-                    issues.append(json.loads(line))
-                except json.JSONDecodeError:
-                    pass
-        
-        return issues[:max_issues]
-    except subprocess.TimeoutExpired:
-        print(f"  Warning: Timeout fetching {repo}", file=sys.stderr)
-        return []
-
-def fetch_issue_comments(repo: str, issue_number: int) -> list:
-    """Fetch comments for a specific issue."""
-    cmd = [
-        "gh", "api", "-X", "GET",
-        f"/repos/{repo}/issues/{issue_number}/comments",
-        "--jq", '.[] | {created_at: .created_at, user: .user.login}'
+
+
+def fetch_comments(session, repo: str, since=None, api_url=API_URL) -> list:
+    """Fetch the comments on all issues (and PRs) of a repo, oldest first,
+    optionally only those updated since the ISO timestamp ``since``."""
+    params = {'sort': 'created', 'direction': 'asc', 'per_page': 100}
+    if since:
+        params['since'] = since
+    comments = get_all(session, f"{api_url}/repos/{repo}/issues/comments", params)
+    return [
+        {
+            'issue_url': comment['issue_url'],
+            'created_at': comment['created_at'],
+            'user': comment['user']['login'],
+        }
+        for comment in comments
     ]
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode != 0:
-            return []
-        
-        comments = []
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                try:
-                    comments.append(json.loads(line))
-                except json.JSONDecodeError:
-                    pass
-        return comments
-    except subprocess.TimeoutExpired:
-        return []
+
 
 def to_timestamp(iso_date: str) -> int:
     """Convert ISO date string to Unix timestamp."""
@@ -109,17 +141,150 @@ def to_timestamp(iso_date: str) -> int:
     try:
         dt = datetime.fromisoformat(iso_date.replace('Z', '+00:00'))
         return int(dt.timestamp())
-    except:
+    except ValueError:
+        return 0
+
+
+def fetch_repo_events(session, repo: str, include_comments=False, since=None, api_url=API_URL) -> list:
+    """Issue events (created, closed, and optionally comments) of a repo,
+    sorted by timestamp.
+
+    With ``since``, only events at or after then are included. Issues and
+    comments are listed by when they were last updated, which is never
+    before the events themselves, so none are missed.
+    """
+    issues = fetch_issues(session, repo, since=since, api_url=api_url)
+    comments = fetch_comments(session, repo, since, api_url) if include_comments else []
+    print(f"  Found {len(issues)} issues in {repo}", file=sys.stderr)
+
+    repo_short = repo.split('/')[-1]
+    events = []
+    issues_by_url = {}
+    for issue in issues:
+        if issue.get('is_pr'):
+            continue  # Skip PRs for now
+        issues_by_url[issue['url']] = issue
+
+        # Issue created event
+        events.append({
+            'timestamp': to_timestamp(issue['created_at']),
+            'repo': repo_short,
+            'issue_number': issue['number'],
+            'type': 'created',
+            'author': issue['user'],
+            'title': issue['title']
+        })
+
+        # Issue closed event
+        if issue.get('closed_at'):
+            events.append({
+                'timestamp': to_timestamp(issue['closed_at']),
+                'repo': repo_short,
+                'issue_number': issue['number'],
+                'type': 'closed',
+                'author': issue['user'],  # Could fetch closer
+                'title': issue['title']
+            })
+
+    for comment in comments:
+        # (comments on PRs have no match)
+        issue = issues_by_url.get(comment['issue_url'])
+        if issue is None:
+            continue
+        events.append({
+            'timestamp': to_timestamp(comment['created_at']),
+            'repo': repo_short,
+            'issue_number': issue['number'],
+            'type': 'comment',
+            'author': comment['user'],
+            'title': issue['title']
+        })
+
+    if since:
+        # issues updated since, but opened (or closed) before, are already
+        # in the segment
+        events = [e for e in events if e['timestamp'] >= to_timestamp(since)]
+    return sorted(events, key=lambda e: e['timestamp'])
+
+
+def segment_path(cache_dir: Path, repo: str) -> Path:
+    return Path(cache_dir) / (repo.replace('/', '__') + '.jsonl')
+
+
+def update_segment(session, repo: str, cache_dir=CACHE_DIR, include_comments=False, api_url=API_URL) -> int:
+    """Extend the repo's segment with the events since the last update.
+
+    The segment's meta file records when the last update started
+    (``synced``), and the byte offset of the first event at or after then.
+    Events from that point on may have been incomplete while the update
+    was running, so they're truncated and fetched again, along with
+    everything newer, and appended in order.
+
+    Returns the number of events appended.
+    """
+    path = segment_path(cache_dir, repo)
+    meta_path = path.with_suffix('.meta.json')
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() and path.exists() else None
+    if meta and meta['include_comments'] != include_comments:
+        meta = None  # built with different events, start over
+    since = meta['synced'] if meta else None
+    started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    try:
+        events = fetch_repo_events(session, repo, include_comments, since, api_url)
+    except requests.RequestException as e:
+        # the segment stays as it was, and is extended next time
+        print(f"  Warning: Failed to fetch {repo}: {e}", file=sys.stderr)
         return 0
 
-def export_gource_format(events: list) -> str:
-    """Convert events to Gource-compatible log format.
-    
+    offset = None
+    with open(path, 'r+b' if meta else 'wb') as f:
+        f.truncate(meta['offset'] if meta else 0)
+        f.seek(0, os.SEEK_END)
+        for event in events:
+            if offset is None and event['timestamp'] >= to_timestamp(started):
+                offset = f.tell()
+            f.write((json.dumps(event) + '\n').encode())
+        if offset is None:
+            offset = f.tell()
+    meta_path.write_text(json.dumps({
+        'synced': started,
+        'offset': offset,
+        'include_comments': include_comments,
+    }))
+    return len(events)
+
+
+def update_segments(session, repos=REPOS, cache_dir=CACHE_DIR, include_comments=False, api_url=API_URL, workers=WORKERS) -> None:
+    """Update the segments of all repos, concurrently."""
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        appended = pool.map(
+            lambda repo: update_segment(session, repo, cache_dir, include_comments, api_url),
+            repos,
+        )
+        print(f"New events: {sum(appended)}", file=sys.stderr)
+
+
+def read_segment(path: Path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def merge_segments(paths):
+    """All events of the segments, in timestamp order."""
+    segments = [read_segment(path) for path in paths if Path(path).exists()]
+    return heapq.merge(*segments, key=lambda e: e['timestamp'])
+
+
+def gource_lines(events):
+    """Convert (sorted) events to Gource-compatible log lines.
+
     Gource format: timestamp|author|action|path
     Actions: A (add), M (modify), D (delete)
     """
-    lines = []
-    for event in sorted(events, key=lambda e: e['timestamp']):
+    for event in events:
         # Map event types to gource actions
         if event['type'] == 'created':
             action = 'A'  # Add = issue opened
@@ -129,89 +294,61 @@ def export_gource_format(events: list) -> str:
             action = 'D'  # Delete = issue closed
         else:
             action = 'M'
-        
+
         # Create path like: repo/issues/issue-number
         path = f"{event['repo']}/issues/{event['issue_number']}"
-        
-        lines.append(f"{event['timestamp']}|{event['author']}|{action}|{path}")
-    
-    return '\n'.join(lines)
-
-def export_csv_format(events: list) -> str:
-    """Convert events to CSV format."""
-    lines = ["timestamp,datetime,repo,issue_number,type,author,title"]
-    for event in sorted(events, key=lambda e: e['timestamp']):
+
+        yield f"{event['timestamp']}|{event['author']}|{action}|{path}"
+
+
+def csv_lines(events):
+    """Convert (sorted) events to CSV lines."""
+    yield "timestamp,datetime,repo,issue_number,type,author,title"
+    for event in events:
         dt = datetime.fromtimestamp(event['timestamp']).isoformat()
         title = event.get('title', '').replace(',', ' ').replace('"', "'")[:50]
-        lines.append(f"{event['timestamp']},{dt},{event['repo']},{event['issue_number']},{event['type']},{event['author']},{title}")
-    return '\n'.join(lines)
+        yield f"{event['timestamp']},{dt},{event['repo']},{event['issue_number']},{event['type']},{event['author']},{title}"
+
+
+def write_output(events, format: str, path: Path) -> int:
+    """Stream events to ``path`` in the given format; returns how many."""
+    count = 0
+
+    def counted(events):
+        nonlocal count
+        for event in events:
+            count += 1
+            yield event
+
+    lines = gource_lines(counted(events)) if format == 'gource' else csv_lines(counted(events))
+    with open(path, 'w') as f:
+        f.writelines(line + '\n' for line in lines)
+    return count
+
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Export GitHub issue history")
     parser.add_argument('--output', '-o', default='issues.csv', help='Output file')
     parser.add_argument('--format', '-f', choices=['csv', 'gource'], default='csv')
-    parser.add_argument('--include-comments', action='store_true', help='Include comment events (slower)')
+    parser.add_argument('--include-comments', action='store_true', help='Include comment events')
+    parser.add_argument('--cache-dir', type=Path, default=CACHE_DIR, help='Directory of the per-repo event segments')
+    parser.add_argument('--refresh', action='store_true', help='Fetch all history again, instead of just what is new')
+    parser.add_argument('--api-url', default=API_URL, help='GitHub API base URL (e.g. a local stand-in for testing)')
     args = parser.parse_args()
-    
-    all_events = []
-    
-    for repo in REPOS:
-        issues = fetch_issues(repo)
-        print(f"  Found {len(issues)} issues in {repo}", file=sys.stderr)
-        
-        for issue in issues:
-            if issue.get('is_pr'):
-                continue  # Skip PRs for now
-            
-            repo_short = repo.split('/')[-1]
-            
-            # Issue created event
-            all_events.append({
-                'timestamp': to_timestamp(issue['created_at']),
-                'repo': repo_short,
-                'issue_number': issue['number'],
-                'type': 'created',
-                'author': issue['user'],
-                'title': issue['title']
-            })
-            
-            # Issue closed event
-            if issue.get('closed_at'):
-                all_events.append({
-                    'timestamp': to_timestamp(issue['closed_at']),
-                    'repo': repo_short,
-                    'issue_number': issue['number'],
-                    'type': 'closed',
-                    'author': issue['user'],  # Could fetch closer
-                    'title': issue['title']
-                })
-            
-            # Fetch comments if requested (slower due to API rate limits)
-            if args.include_comments and issue.get('comments', 0) > 0:
-                comments = fetch_issue_comments(repo, issue['number'])
-                for comment in comments:
-                    all_events.append({
-                        'timestamp': to_timestamp(comment['created_at']),
-                        'repo': repo_short,
-                        'issue_number': issue['number'],
-                        'type': 'comment',
-                        'author': comment['user'],
-                        'title': issue['title']
-                    })
-    
-    print(f"\nTotal events: {len(all_events)}", file=sys.stderr)
-    
+
+    if args.refresh:
+        for repo in REPOS:
+            segment_path(args.cache_dir, repo).with_suffix('.meta.json').unlink(missing_ok=True)
+
+    session = make_session(get_token())
+    update_segments(session, REPOS, args.cache_dir, args.include_comments, args.api_url)
+
     # Export in requested format
-    if args.format == 'gource':
-        output = export_gource_format(all_events)
-    else:
-        output = export_csv_format(all_events)
-    
-    # Write output
-    output_path = Path(args.output)
-    output_path.write_text(output)
-    print(f"Wrote {len(all_events)} events to {output_path}", file=sys.stderr)
+    events = merge_segments(segment_path(args.cache_dir, repo) for repo in REPOS)
+    count = write_output(events, args.format, args.output)
+    print(f"Wrote {count} events to {args.output}", file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()